@@ -1,8 +1,214 @@
+import json
+import os
+from typing import TYPE_CHECKING
+
 import streamlit as st
 import requests
-import pandas as pd
-import matplotlib.pyplot as plt
-import re
+
+# pandas takes longer to import than streamlit itself and only the Analyze tab needs it
+if TYPE_CHECKING:
+    import pandas as pd
+
+API_URL = os.getenv("NUTRIFIT_API_URL", "http://localhost:8000")
+
+# Canonical macro block -> display labels (None when USDA does not report the nutrient)
+MACRO_FIELDS = {
+    "Calories": "calories",
+    "Protein (g)": "protein_g",
+    "Fat (g)": "fat_g",
+    "Carbohydrates (g)": "carbohydrates_g",
+    "Fiber (g)": "fiber_g",
+    "Sugar (g)": "sugar_g",
+    "Sodium (mg)": "sodium_mg",
+    "Cholesterol (mg)": "cholesterol_mg"
+}
+
+# Realistic fallback values (per medium unit or standard serving)
+FALLBACK_VALUES = {
+    "banana": {  # Medium banana (~118g)
+        "Calories": 89.0,
+        "Protein (g)": 1.1,
+        "Fat (g)": 0.3,
+        "Carbohydrates (g)": 22.8,
+        "Fiber (g)": 2.6,
+        "Sugar (g)": 12.2,
+        "Sodium (mg)": 1.0,
+        "Cholesterol (mg)": 0.0
+    },
+    "oats": {  # 1/2 cup dry rolled oats (~40g)
+        "Calories": 150.0,
+        "Protein (g)": 5.0,
+        "Fat (g)": 2.5,
+        "Carbohydrates (g)": 27.0,
+        "Fiber (g)": 4.0,
+        "Sugar (g)": 1.0,
+        "Sodium (mg)": 0.0,
+        "Cholesterol (mg)": 0.0
+    },
+    "egg": {  # Medium egg (~50g)
+        "Calories": 68.0,
+        "Protein (g)": 6.0,
+        "Fat (g)": 5.0,
+        "Carbohydrates (g)": 0.5,
+        "Fiber (g)": 0.0,
+        "Sugar (g)": 0.5,
+        "Sodium (mg)": 70.0,
+        "Cholesterol (mg)": 186.0
+    },
+    "default": {  # Generic fallback for other foods (e.g., apple-like)
+        "Calories": 52.0,
+        "Protein (g)": 0.3,
+        "Fat (g)": 0.2,
+        "Carbohydrates (g)": 13.8,
+        "Fiber (g)": 2.4,
+        "Sugar (g)": 10.4,
+        "Sodium (mg)": 1.0,
+        "Cholesterol (mg)": 0.0
+    }
+}
+
+# Unit scaling factors (relative to medium or standard serving)
+UNIT_SCALING_FACTORS = {
+    "banana": {
+        "small": 90 / 118,  # Small banana = 90g, Medium = 118g
+        "medium": 1.0,  # Medium banana = 118g
+        "big": 150 / 118,  # Big banana = 150g
+        "gram": 1.0 / 118,  # Per gram
+        "cup": 225 / 118  # 1 cup mashed banana = 225g
+    },
+    "oats": {
+        "small": 20 / 40,  # Small serving = 20g, Medium = 40g (1/2 cup dry)
+        "medium": 1.0,  # Medium = 40g
+        "big": 60 / 40,  # Big serving = 60g
+        "gram": 1.0 / 40,  # Per gram
+        "cup": 80 / 40  # 1 cup dry rolled oats = 80g
+    },
+    "egg": {
+        "small": 40 / 50,  # Small egg = 40g, Medium = 50g
+        "medium": 1.0,  # Medium egg = 50g
+        "big": 63 / 50,  # Big egg = 63g
+        "gram": 1.0 / 50,  # Per gram
+        "cup": 243 / 50  # 1 cup eggs = 243g (~5 medium eggs)
+    },
+    "default": {
+        "small": 0.75,  # Arbitrary 75% of medium
+        "medium": 1.0,
+        "big": 1.25,  # Arbitrary 125% of medium
+        "gram": 0.01,  # Arbitrary 1g = 1% of medium
+        "cup": 2.0  # Arbitrary 2x medium
+    }
+}
+UNITS = ["small", "medium", "big", "gram", "cup"]
+
+CHART_NUTRIENTS = ["Calories", "Protein (g)", "Fat (g)", "Carbohydrates (g)", "Fiber (g)", "Sugar (g)"]
+CHART_COLORS = ['#ff9999', '#66b3ff', '#99ff99', '#ffcc99', '#c2c2f0', '#ffb3e6']
+
+RECOMMENDED = {
+    "Protein (g)": 50,
+    "Fiber (g)": 30,
+    "Fat (g)": 70,
+    "Carbohydrates (g)": 310,
+    "Sugar (g)": 30,
+    "Calories": 2000,
+    "Sodium (mg)": 2300,
+    "Cholesterol (mg)": 300
+}
+NUTRIENT_META = {
+    "Protein (g)": ("🥩", "Macro", "g"),
+    "Fiber (g)": ("🌾", "Macro", "g"),
+    "Fat (g)": ("🧈", "Macro", "g"),
+    "Carbohydrates (g)": ("🍞", "Macro", "g"),
+    "Sugar (g)": ("🍬", "Macro", "g"),
+    "Calories": ("🔥", "Energy", "kcal"),
+    "Sodium (mg)": ("🧂", "Mineral", "mg"),
+    "Cholesterol (mg)": ("🩸", "Lipid", "mg")
+}
+CATEGORIES = ["All", "Macro", "Mineral", "Energy", "Lipid"]
+
+
+# Streamlit re-runs this whole script on every interaction. Everything that depends only on the food
+# is computed once per food in the cached helpers below; a rerun after changing the quantity only
+# multiplies eight numbers.
+@st.cache_resource
+def api_session() -> requests.Session:
+    """One keep-alive connection pool to the API for all sessions of this process."""
+    return requests.Session()
+
+
+class AnalysisUnavailable(Exception):
+    """The API could not analyze a food right now (USDA down, circuit open, missing key, ...)."""
+
+
+@st.cache_data(ttl=3600, max_entries=512, show_spinner=False)
+def fetch_analysis(food_item: str):
+    """
+    Structured nutrition data for a food, or None when the API has none (404). Only those two outcomes are
+    cached: other errors raise, and st.cache_data does not cache exceptions, so the next try asks again.
+    """
+    response = api_session().get(f"{API_URL}/v2/analyze/{food_item}", timeout=(5, 60))
+    if response.status_code == 404:
+        return None
+    if response.status_code != 200:
+        try:
+            detail = response.json().get("detail") or response.reason
+        except (ValueError, AttributeError):
+            detail = response.reason
+        raise AnalysisUnavailable(f"{detail} (HTTP {response.status_code})")
+    return response.json()
+
+
+@st.cache_data(ttl=600, max_entries=2048, show_spinner=False)
+def fetch_suggestions(partial_query: str) -> list:
+    try:
+        response = api_session().get(
+            f"{API_URL}/foods/suggest", params={"q": partial_query, "limit": 8}, timeout=2
+        )
+        return [s["name"] for s in response.json()["suggestions"]] if response.ok else []
+    except Exception:
+        return []
+
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def nutrient_table(fdc_id: int, _nutrients: list) -> "pd.DataFrame":
+    """Per-100 g nutrient table; keyed on the FDC ID so the payload itself is not hashed on every rerun."""
+    import pandas as pd
+
+    return pd.DataFrame(
+        [(n["name"], "N/A" if n["amount"] is None else f"{n['amount']} {n['unit']}") for n in _nutrients],
+        columns=["Nutrient", "Value"]
+    )
+
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def base_nutrients(food_key: str, fdc_id: int, _macros: dict):
+    """Macros per medium unit with fallback values filled in, and whether any fallback was needed."""
+    fallback = FALLBACK_VALUES.get(food_key, FALLBACK_VALUES["default"])
+    nutrients, used_fallback = {}, False
+    for label, field in MACRO_FIELDS.items():
+        value = _macros.get(field)
+        if value is None:
+            value, used_fallback = fallback.get(label, 0.0), True
+        nutrients[label] = value
+    return nutrients, used_fallback
+
+
+def scale_nutrients(nutrients: dict, food_key: str, quantity: float, unit: str) -> dict:
+    unit_scaling = UNIT_SCALING_FACTORS.get(food_key, UNIT_SCALING_FACTORS["default"])[unit]
+    total_multiplier = quantity * unit_scaling
+    return {key: value * total_multiplier for key, value in nutrients.items()}
+
+
+def get_color(val, ref):
+    if ref == 0:
+        return "#e0e0e0"
+    ratio = val / ref
+    if 0.9 <= ratio <= 1.1:
+        return "#d4edda"
+    elif 0.7 <= ratio <= 1.3:
+        return "#fff3cd"
+    else:
+        return "#f8d7da"
+
 
 # Page config
 st.set_page_config(page_title="Nutrition Analyzer", layout="wide")
@@ -14,8 +220,8 @@ if 'quantity_multiplier' not in st.session_state:
     st.session_state.quantity_multiplier = 1.0
 if 'quantity_unit' not in st.session_state:
     st.session_state.quantity_unit = "medium"
-if 'adjusted_nutrients' not in st.session_state:
-    st.session_state.adjusted_nutrients = None
+if 'category_filter' not in st.session_state:
+    st.session_state.category_filter = "All"
 
 # Title and description
 st.title("🥗 NutriFit: AI-Based Food Nutrition Analyzer")
@@ -34,6 +240,14 @@ with tab1:
     st.subheader("🔍 Analyze a Food Item")
     food_item = st.text_input("Enter a food name (e.g., oats, egg, banana)")
 
+    # Suggestions come from the API's in-memory resolver and are cached per partial query
+    if len(food_item.strip()) >= 2:
+        suggestions = fetch_suggestions(food_item.strip().lower())
+        if suggestions:
+            choice = st.selectbox("Suggestions", ["Use what I typed"] + suggestions)
+            if choice != "Use what I typed":
+                food_item = choice
+
     analyze_clicked = st.button("Analyze")
 
     if analyze_clicked:
@@ -42,15 +256,14 @@ with tab1:
         else:
             with st.spinner("Fetching nutrition data..."):
                 try:
-                    response = requests.get(f"http://localhost:8000/analyze/{food_item.strip()}")
-                    if response.status_code == 200:
-                        st.session_state.analysis_data = response.json()
-                        st.session_state.quantity_multiplier = 1.0
-                        st.session_state.quantity_unit = "medium"
-                        st.session_state.adjusted_nutrients = None
-                    else:
+                    st.session_state.analysis_data = fetch_analysis(food_item.strip())
+                    st.session_state.quantity_multiplier = 1.0
+                    st.session_state.quantity_unit = "medium"
+                    if st.session_state.analysis_data is None:
                         st.error("❌ Error fetching nutrition data. Please try another food.")
-                        st.session_state.analysis_data = None
+                except AnalysisUnavailable as e:
+                    st.error(f"❌ Nutrition data is unavailable right now, please try again: {e}")
+                    st.session_state.analysis_data = None
                 except Exception as e:
                     st.error(f"❌ Error connecting to server: {e}")
                     st.session_state.analysis_data = None
@@ -59,170 +272,21 @@ with tab1:
     if st.session_state.analysis_data:
         data = st.session_state.analysis_data
         food_name = data.get("food", "Unknown").title()
+        food_key = food_name.lower()
         display_unit = f"{st.session_state.quantity_unit} {food_name.lower()}s" if st.session_state.quantity_unit in ["small", "medium", "big"] else st.session_state.quantity_unit + "s"
         st.success(f"Nutrition Info for **{food_name}** (x{st.session_state.quantity_multiplier} {display_unit})")
 
-        # Show formatted nutrition info
-        nutrition_info = data.get("nutrition_info", "")
-        if nutrition_info:
-            st.markdown("### Nutrition Details (Per Medium Unit)")
-            nutrient_pairs = {}
-            parts = nutrition_info.split(" - ")
-            for part in parts:
-                part = part.strip()
-                if not part or part.lower().startswith("nutrition info for") and part.endswith(":"):
-                    continue
-                if ": " in part:
-                    try:
-                        key, value = part.split(": ", 1)
-                        nutrient_pairs[key.strip()] = value.strip()
-                    except ValueError:
-                        st.warning(f"⚠️ Could not parse: '{part}'. Skipping...")
-                        continue
-                else:
-                    st.warning(f"⚠️ Invalid format: '{part}'. Expected 'key: value'. Skipping...")
-                    continue
-
-            if nutrient_pairs:
-                try:
-                    df = pd.DataFrame(list(nutrient_pairs.items()), columns=["Nutrient", "Value"])
-                    st.table(df)
-                except Exception as e:
-                    st.warning(f"⚠️ Could not display table: {str(e)}. Displaying as text...")
-                    for key, value in nutrient_pairs.items():
-                        st.markdown(f"- **{key}**: {value}")
-            else:
-                st.info("No valid nutrition details to display.")
-
-        # Initialize nutrient dictionary (base values for a medium unit)
-        nutrient_dict = {
-            "Calories": 0.0,
-            "Protein (g)": 0.0,
-            "Fat (g)": 0.0,
-            "Carbohydrates (g)": 0.0,
-            "Fiber (g)": 0.0,
-            "Sugar (g)": 0.0,
-            "Sodium (mg)": 0.0,
-            "Cholesterol (mg)": 0.0
-        }
-
-        # Refined nutrient parsing with regex for robustness
-        def parse_nutrient(text, pattern, key, unit, default=0.0):
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                try:
-                    value = float(match.group(1).replace(unit, "").strip())
-                    return value
-                except (ValueError, IndexError):
-                    return default
-            return default
-
-        nutrition_text = nutrition_info.lower()
-        nutrient_dict["Calories"] = parse_nutrient(nutrition_text, r"energy:?\s*([\d.]+)\s*kcal", "Calories", "kcal")
-        nutrient_dict["Protein (g)"] = parse_nutrient(nutrition_text, r"protein:?\s*([\d.]+)\s*g", "Protein (g)", "g")
-        nutrient_dict["Fat (g)"] = parse_nutrient(nutrition_text, r"total lipid \(fat\):?\s*([\d.]+)\s*g", "Fat (g)", "g")
-        nutrient_dict["Carbohydrates (g)"] = parse_nutrient(nutrition_text, r"carbohydrate, by difference:?\s*([\d.]+)\s*g", "Carbohydrates (g)", "g")
-        nutrient_dict["Fiber (g)"] = parse_nutrient(nutrition_text, r"fiber, total dietary:?\s*([\d.]+)\s*g", "Fiber (g)", "g")
-        nutrient_dict["Sugar (g)"] = parse_nutrient(nutrition_text, r"sugars, total:?\s*([\d.]+)\s*g", "Sugar (g)", "g")
-        nutrient_dict["Sodium (mg)"] = parse_nutrient(nutrition_text, r"sodium, na:?\s*([\d.]+)\s*mg", "Sodium (mg)", "mg")
-        nutrient_dict["Cholesterol (mg)"] = parse_nutrient(nutrition_text, r"cholesterol:?\s*([\d.]+)\s*mg", "Cholesterol (mg)", "mg")
-
-        # Realistic fallback values (per medium unit or standard serving)
-        fallback_values = {
-            "banana": {  # Medium banana (~118g)
-                "Calories": 89.0,
-                "Protein (g)": 1.1,
-                "Fat (g)": 0.3,
-                "Carbohydrates (g)": 22.8,
-                "Fiber (g)": 2.6,
-                "Sugar (g)": 12.2,
-                "Sodium (mg)": 1.0,
-                "Cholesterol (mg)": 0.0
-            },
-            "oats": {  # 1/2 cup dry rolled oats (~40g)
-                "Calories": 150.0,
-                "Protein (g)": 5.0,
-                "Fat (g)": 2.5,
-                "Carbohydrates (g)": 27.0,
-                "Fiber (g)": 4.0,
-                "Sugar (g)": 1.0,
-                "Sodium (mg)": 0.0,
-                "Cholesterol (mg)": 0.0
-            },
-            "egg": {  # Medium egg (~50g)
-                "Calories": 68.0,
-                "Protein (g)": 6.0,
-                "Fat (g)": 5.0,
-                "Carbohydrates (g)": 0.5,
-                "Fiber (g)": 0.0,
-                "Sugar (g)": 0.5,
-                "Sodium (mg)": 70.0,
-                "Cholesterol (mg)": 186.0
-            },
-            "default": {  # Generic fallback for other foods (e.g., apple-like)
-                "Calories": 52.0,
-                "Protein (g)": 0.3,
-                "Fat (g)": 0.2,
-                "Carbohydrates (g)": 13.8,
-                "Fiber (g)": 2.4,
-                "Sugar (g)": 10.4,
-                "Sodium (mg)": 1.0,
-                "Cholesterol (mg)": 0.0
-            }
-        }
-
-        # Apply fallback if no data parsed
-        food_key = food_name.lower()
-        if food_key in fallback_values:
-            fallback = fallback_values[food_key]
+        # Show nutrition details straight from the structured payload
+        nutrients = data.get("nutrients", [])
+        if nutrients:
+            st.markdown("### Nutrition Details (Per 100 g)")
+            st.table(nutrient_table(data["fdc_id"], nutrients))
         else:
-            fallback = fallback_values["default"]
-            st.warning(f"⚠️ Using default nutrient values for '{food_name}' as specific data is unavailable.")
+            st.info("No valid nutrition details to display.")
 
-        for nutrient in nutrient_dict:
-            if nutrient_dict[nutrient] == 0.0:
-                nutrient_dict[nutrient] = fallback.get(nutrient, 0.0)
-
-        # Define unit scaling factors (relative to medium or standard serving)
-        unit_scaling_factors = {
-            "banana": {
-                "small": 90 / 118,  # Small banana = 90g, Medium = 118g
-                "medium": 1.0,  # Medium banana = 118g
-                "big": 150 / 118,  # Big banana = 150g
-                "gram": 1.0 / 118,  # Per gram
-                "cup": 225 / 118  # 1 cup mashed banana = 225g
-            },
-            "oats": {
-                "small": 20 / 40,  # Small serving = 20g, Medium = 40g (1/2 cup dry)
-                "medium": 1.0,  # Medium = 40g
-                "big": 60 / 40,  # Big serving = 60g
-                "gram": 1.0 / 40,  # Per gram
-                "cup": 80 / 40  # 1 cup dry rolled oats = 80g
-            },
-            "egg": {
-                "small": 40 / 50,  # Small egg = 40g, Medium = 50g
-                "medium": 1.0,  # Medium egg = 50g
-                "big": 63 / 50,  # Big egg = 63g
-                "gram": 1.0 / 50,  # Per gram
-                "cup": 243 / 50  # 1 cup eggs = 243g (~5 medium eggs)
-            },
-            "default": {
-                "small": 0.75,  # Arbitrary 75% of medium
-                "medium": 1.0,
-                "big": 1.25,  # Arbitrary 125% of medium
-                "gram": 0.01,  # Arbitrary 1g = 1% of medium
-                "cup": 2.0  # Arbitrary 2x medium
-            }
-        }
-
-        # Get scaling factor
-        food_key = food_name.lower() if food_name.lower() in unit_scaling_factors else "default"
-        unit_scaling = unit_scaling_factors[food_key][st.session_state.quantity_unit]
-
-        # Apply quantity multiplier and unit scaling
-        if st.session_state.adjusted_nutrients is None:
-            total_multiplier = st.session_state.quantity_multiplier * unit_scaling
-            st.session_state.adjusted_nutrients = {key: value * total_multiplier for key, value in nutrient_dict.items()}
+        nutrient_dict, used_fallback = base_nutrients(food_key, data["fdc_id"], data.get("macros", {}))
+        if used_fallback and food_key not in FALLBACK_VALUES:
+            st.warning(f"⚠️ Using default nutrient values for '{food_name}' as specific data is unavailable.")
 
         # Quantity input, unit selection, and button
         st.markdown("### Adjust Quantity")
@@ -238,8 +302,8 @@ with tab1:
         with col2:
             unit = st.selectbox(
                 "Select unit:",
-                options=["small", "medium", "big", "gram", "cup"],
-                index=["small", "medium", "big", "gram", "cup"].index(st.session_state.quantity_unit)
+                options=UNITS,
+                index=UNITS.index(st.session_state.quantity_unit)
             )
         with col3:
             multiply_clicked = st.button("Multiply Quantity")
@@ -247,87 +311,46 @@ with tab1:
         if multiply_clicked:
             st.session_state.quantity_multiplier = quantity
             st.session_state.quantity_unit = unit
-            unit_scaling = unit_scaling_factors[food_key][unit]
-            total_multiplier = quantity * unit_scaling
-            st.session_state.adjusted_nutrients = {key: value * total_multiplier for key, value in nutrient_dict.items()}
             st.rerun()
 
-        # Use adjusted nutrients for display
-        adjusted_nutrients = st.session_state.adjusted_nutrients
-
-        # Bar chart
-        fig, ax = plt.subplots(figsize=(10, 5))
-        macro_nutrients = ["Calories", "Protein (g)", "Fat (g)", "Carbohydrates (g)", "Fiber (g)", "Sugar (g)"]
-        macro_values = [adjusted_nutrients[n] for n in macro_nutrients]
-        colors = ['#ff9999', '#66b3ff', '#99ff99', '#ffcc99', '#c2c2f0', '#ffb3e6']
-        bars = ax.bar(macro_nutrients, macro_values, color=colors)
-        ax.set_title("🧪 Macronutrient Breakdown", fontsize=16, pad=20)
-        ax.set_ylabel("Amount", fontsize=12)
-        ax.bar_label(bars, padding=3, fmt='%.1f')
-        ax.spines['top'].set_visible(False)
-        ax.spines['right'].set_visible(False)
-        ax.grid(True, axis='y', linestyle='--', alpha=0.7)
-        plt.xticks(rotation=45, ha='right', fontsize=10)
-        plt.tight_layout()
-        st.pyplot(fig)
-
-        # Key Nutrients (rest of the display code remains unchanged)
+        # Only the scaled numbers depend on the quantity
+        adjusted_nutrients = scale_nutrients(
+            nutrient_dict, food_key, st.session_state.quantity_multiplier, st.session_state.quantity_unit
+        )
+
+        # Bar chart, drawn natively by the browser instead of a server-side matplotlib figure
+        st.markdown("### 🧪 Macronutrient Breakdown")
+        import pandas as pd
+
+        chart_data = pd.DataFrame({
+            "Nutrient": CHART_NUTRIENTS,
+            "Amount": [round(adjusted_nutrients[n], 1) for n in CHART_NUTRIENTS],
+            "Color": CHART_COLORS,
+        })
+        st.bar_chart(chart_data, x="Nutrient", y="Amount", color="Color")
+
+        # Key Nutrients
         st.markdown("### 🧾 Key Nutrients (with Insights)", unsafe_allow_html=True)
-        recommended = {
-            "Protein (g)": 50,
-            "Fiber (g)": 30,
-            "Fat (g)": 70,
-            "Carbohydrates (g)": 310,
-            "Sugar (g)": 30,
-            "Calories": 2000,
-            "Sodium (mg)": 2300,
-            "Cholesterol (mg)": 300
-        }
-        nutrient_meta = {
-            "Protein (g)": ("🥩", "Macro", "g"),
-            "Fiber (g)": ("🌾", "Macro", "g"),
-            "Fat (g)": ("🧈", "Macro", "g"),
-            "Carbohydrates (g)": ("🍞", "Macro", "g"),
-            "Sugar (g)": ("🍬", "Macro", "g"),
-            "Calories": ("🔥", "Energy", "kcal"),
-            "Sodium (mg)": ("🧂", "Mineral", "mg"),
-            "Cholesterol (mg)": ("🩸", "Lipid", "mg")
-        }
-
-        # Category filter and card display (unchanged)
-        if 'category_filter' not in st.session_state:
-            st.session_state.category_filter = "All"
         category_filter = st.selectbox(
             "Filter nutrients by category:",
-            options=["All", "Macro", "Mineral", "Energy", "Lipid"],
-            index=["All", "Macro", "Mineral", "Energy", "Lipid"].index(st.session_state.category_filter),
+            options=CATEGORIES,
+            index=CATEGORIES.index(st.session_state.category_filter),
             key="category_filter_select"
         )
         st.session_state.category_filter = category_filter
 
         filtered_keys = [
-            k for k, v in nutrient_meta.items()
+            k for k, v in NUTRIENT_META.items()
             if st.session_state.category_filter == "All" or v[1] == st.session_state.category_filter
         ]
 
-        def get_color(val, ref):
-            if ref == 0:
-                return "#e0e0e0"
-            ratio = val / ref
-            if 0.9 <= ratio <= 1.1:
-                return "#d4edda"
-            elif 0.7 <= ratio <= 1.3:
-                return "#fff3cd"
-            else:
-                return "#f8d7da"
-
         rows = [filtered_keys[i:i+2] for i in range(0, len(filtered_keys), 2)]
         for row in rows:
             cols = st.columns([1, 1, 0.1])
             for i, key in enumerate(row):
-                emoji, cat, unit = nutrient_meta[key]
+                emoji, cat, unit = NUTRIENT_META[key]
                 val = adjusted_nutrients.get(key, 0)
-                ref = recommended.get(key, 1)
+                ref = RECOMMENDED.get(key, 1)
                 color = get_color(val, ref)
                 with cols[i]:
                     st.markdown(
@@ -356,7 +379,17 @@ with tab1:
             st.markdown("### 🍴 Suggested Pairings")
             st.write("- ✅ Try adding whole grain toast or Greek yogurt for a balanced meal.")
 
-# --- Tab 2: Ask Nutrition AI --- (unchanged)
+# --- Tab 2: Ask Nutrition AI ---
+def stream_answer_tokens(response):
+    """Yields answer tokens from the /ask/stream Server-Sent Events response."""
+    for line in response.iter_lines(decode_unicode=True):
+        if line == "event: done":
+            break
+        if line and line.startswith("data: "):
+            token = json.loads(line[len("data: "):]).get("token")
+            if token:
+                yield token
+
 with tab2:
     st.subheader("💡 Ask a Nutrition Question")
     question = st.text_input("e.g., Which fruits are high in potassium?")
@@ -365,16 +398,16 @@ with tab2:
         if not question.strip():
             st.warning("⚠️ Please enter a question.")
         else:
-            with st.spinner("Thinking..."):
-                try:
-                    response = requests.get(f"http://localhost:8000/analyze/{question.strip()}")
-                except Exception as e:
-                    st.error(f"❌ Error connecting to server: {e}")
-                    response = None
-                if response and response.status_code == 200:
-                    data = response.json()
-                    st.success("AI Response")
-                    st.markdown(f"**Q:** {data.get('question', question)}")
-                    st.markdown(f"**A:** {data.get('answer', 'No answer available.')}")
-                else:
-                    st.error("❌ Could not get a response from the AI.")
\ No newline at end of file
+            try:
+                response = api_session().get(
+                    f"{API_URL}/ask/stream",
+                    params={"question": question.strip()},
+                    stream=True,
+                    timeout=(5, 300)
+                )
+                response.raise_for_status()
+                st.success("AI Response")
+                st.markdown(f"**Q:** {question.strip()}")
+                st.write_stream(stream_answer_tokens(response))
+            except Exception as e:
+                st.error(f"❌ Could not get a response from the AI: {e}")
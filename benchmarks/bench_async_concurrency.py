@@ -0,0 +1,67 @@
+"""
+Shows that concurrent /analyze requests overlap instead of queueing behind each other.
+
+USDA is replaced by an in-process transport that sleeps for a fixed latency per call, so
+N concurrent cold lookups should take roughly as long as one.
+
+    python -m benchmarks.bench_async_concurrency --requests 20 --latency 0.5
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import httpx
+
+os.environ.setdefault("USDA_API_KEY", "benchmark")
+os.environ["NUTRITION_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(), "bench_cache.sqlite3")
+
+from main import app  # noqa: E402
+from src.ai_model import nutrition_cache  # noqa: E402
+from src.upstream import usda_upstream  # noqa: E402
+
+
+def usda_stub(latency: float) -> httpx.MockTransport:
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(latency)
+        if request.url.path.endswith("/foods/search"):
+            query = request.url.params["query"]
+            return httpx.Response(200, json={"foods": [{"fdcId": abs(hash(query)) % 10_000_000 + 1}]})
+        fdc_id = int(request.url.path.rsplit("/", 1)[-1])
+        return httpx.Response(200, json={
+            "fdcId": fdc_id,
+            "description": "Benchmark food",
+            "foodNutrients": [{"nutrient": {"id": 1008, "name": "Energy", "unitName": "kcal"}, "amount": 89.0}],
+        })
+
+    return httpx.MockTransport(handler)
+
+
+async def timed_batch(client: httpx.AsyncClient, foods: list) -> float:
+    start = time.perf_counter()
+    responses = await asyncio.gather(*(client.get(f"/analyze/{food}") for food in foods))
+    elapsed = time.perf_counter() - start
+    assert all(r.status_code == 200 for r in responses)
+    return elapsed
+
+
+async def run(requests: int, latency: float) -> None:
+    usda_upstream.transport = usda_stub(latency)
+    nutrition_cache.clear()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        single = await timed_batch(client, ["single-food"])
+        concurrent = await timed_batch(client, [f"food-{i}" for i in range(requests)])
+    await usda_upstream.aclose()
+
+    print(f"1 request:            {single:.3f} s")
+    print(f"{requests} concurrent requests: {concurrent:.3f} s ({concurrent / single:.2f}x a single request)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.5, help="Simulated USDA latency per call (s)")
+    args = parser.parse_args()
+    asyncio.run(run(args.requests, args.latency))
@@ -0,0 +1,138 @@
+"""
+Micro-benchmarks for the per-request CPU paths: parsing a USDA details response, trimming it,
+formatting the legacy text, building the structured report, macro extraction, the food-name
+resolver and meal aggregation. Also reports the memory each cached food takes as trimmed USDA
+details and as a FoodNutrients record.
+
+    python -m benchmarks.bench_micro --repeat 5 --out benchmarks/results/micro.json
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import timeit
+import tracemalloc
+
+os.environ.setdefault("USDA_API_KEY", "benchmark")
+os.environ["NUTRITION_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(), "bench_cache.sqlite3")
+
+from benchmarks.mock_upstreams import food_details  # noqa: E402
+from benchmarks.report import write_results  # noqa: E402
+from src.ai_model import _build_report, _format_nutrition_info, _trim_food_data  # noqa: E402
+from src.food_resolver import FoodResolver  # noqa: E402
+from src.meal_engine import MealEngine  # noqa: E402
+from src.nutrients import CANONICAL_NUTRIENTS, FoodNutrients, extract_macros  # noqa: E402
+
+
+def realistic_details(fdc_id: int, nutrient_count: int = 100) -> dict:
+    """
+    Mock details padded to the roughly 100 nutrients of a typical SR Legacy food, with the real IDs, names and
+    units of the canonical nutrients (listed by rank, as USDA does, not in table order).
+    """
+    details = food_details(fdc_id)
+    reported = {food_nutrient["nutrient"]["id"] for food_nutrient in details["foodNutrients"]}
+    padding = [nutrient for nutrient in CANONICAL_NUTRIENTS if nutrient[0] not in reported]
+    for i, (nutrient_id, name, unit) in enumerate(sorted(padding)[:nutrient_count - len(reported)]):
+        details["foodNutrients"].append({
+            "type": "FoodNutrient",
+            "nutrient": {"id": nutrient_id, "number": str(300 + i), "name": name, "rank": 5000 + i, "unitName": unit},
+            "amount": round(0.1 * i, 3),
+            "dataPoints": 3,
+        })
+    return details
+
+
+def cases() -> dict:
+    details = realistic_details(173944)
+    raw = json.dumps(details)
+    trimmed = _trim_food_data(details)
+    food = FoodNutrients.from_food_data(trimmed)
+    stored = json.dumps(food.to_json())
+    report = _build_report("banana", food)
+
+    resolver = FoodResolver()
+    resolver.add_many((f"Mock food {i}, {word}", i, "sr_legacy_food")
+                      for i, word in enumerate(["raw", "cooked", "boiled", "fried", "baked"] * 1000))
+    resolver.add("banana", 173944)
+
+    engine = MealEngine()
+    for fdc_id in range(1, 501):
+        engine.add_food(FoodNutrients.from_food_data(_trim_food_data(food_details(fdc_id))))
+    meal_ids = list(range(1, 101))
+    meal_grams = [100.0] * 100
+
+    return {
+        "parse_details_json": lambda: json.loads(raw),
+        "trim_food_data": lambda: _trim_food_data(details),
+        "food_record": lambda: FoodNutrients.from_food_data(trimmed),
+        "food_record_from_cache": lambda: FoodNutrients.from_json(json.loads(stored)),
+        "format_nutrition_info": lambda: _format_nutrition_info("banana", food),
+        "build_report": lambda: _build_report("banana", food),
+        "serialize_report_json": lambda: report.model_dump_json(),
+        "extract_macros": lambda: extract_macros(trimmed["foodNutrients"]),
+        "record_macros": lambda: food.macros(),
+        "resolver_exact": lambda: resolver.resolve("banana"),
+        "resolver_fuzzy": lambda: resolver.candidates("mock fod 42 boild", limit=10),
+        "meal_100_items": lambda: engine.item_nutrients(meal_ids, meal_grams).sum(axis=0),
+    }
+
+
+def measure(function, repeat: int) -> dict:
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    per_op = [elapsed / number for elapsed in timer.repeat(repeat=repeat, number=number)]
+    return {
+        "best_us": round(min(per_op) * 1e6, 3),
+        "median_us": round(statistics.median(per_op) * 1e6, 3),
+        "ops_per_second": round(1 / min(per_op), 1),
+        "loops": number,
+    }
+
+
+def bytes_per_food(build, count: int = 2000) -> float:
+    """
+    Average traced allocation per food held in memory, each built from its own JSON like a cache read.
+    """
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    foods = [build(i) for i in range(count)]
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del foods
+    return used / count
+
+
+def memory_cases() -> dict:
+    stored = json.dumps(_trim_food_data(realistic_details(173944)))
+    return {
+        "memory_trimmed_details": lambda i: json.loads(stored),
+        "memory_food_record": lambda i: FoodNutrients.from_json(json.loads(stored)),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", nargs="*", help="Run only these cases")
+    parser.add_argument("--out", help="Result file (default: benchmarks/results/micro-<timestamp>.json)")
+    args = parser.parse_args()
+
+    results = []
+    for name, function in cases().items():
+        if args.only and name not in args.only:
+            continue
+        result = {"name": name, **measure(function, args.repeat)}
+        results.append(result)
+        print(f"{name:24} {result['best_us']:>10.2f} us  (median {result['median_us']:.2f} us)")
+    for name, build in memory_cases().items():
+        if args.only and name not in args.only:
+            continue
+        result = {"name": name, "bytes_per_food": round(bytes_per_food(build))}
+        results.append(result)
+        print(f"{name:24} {result['bytes_per_food']:>10} bytes per food")
+    print(f"Results written to {write_results('micro', {'repeat': args.repeat}, results, args.out)}")
+
+
+if __name__ == "__main__":
+    main()
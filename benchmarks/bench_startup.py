@@ -0,0 +1,77 @@
+"""
+Cold-start import time of the API, measured with `python -X importtime` in fresh interpreters.
+Exits non-zero when the median exceeds the budget, so it can gate CI:
+
+    python -m benchmarks.bench_startup --repeat 5 --max-ms 1000
+    python -m benchmarks.bench_startup --module src.ai_model --top 15
+
+Each run imports the module in a new process (no lifespan, no network) and reports the module's
+cumulative import time and the slowest modules it imports directly.
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+from typing import Dict, Tuple
+
+from benchmarks.report import write_results
+
+STARTUP_BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", "1000"))
+_IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$")
+
+
+def import_times(module: str) -> Dict[str, Tuple[float, int]]:
+    """
+    Cumulative import time in milliseconds and nesting depth of every module imported by `import module`
+    in a fresh interpreter.
+    """
+    env = dict(os.environ, USDA_API_KEY=os.getenv("USDA_API_KEY", "benchmark"))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True, env=env,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME_RE.match(line)
+        if match:
+            times[match.group(4)] = (int(match.group(2)) / 1000, len(match.group(3)))
+    return times
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Cold-start import time of the API")
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="Slowest imports to list")
+    parser.add_argument("--max-ms", type=float, default=STARTUP_BUDGET_MS, help="Budget for the median import time")
+    parser.add_argument("--out", help="Result file (default: benchmarks/results/startup-<timestamp>.json)")
+    args = parser.parse_args()
+
+    # The first run warms the bytecode and OS file caches and is not counted
+    import_times(args.module)
+    runs = [import_times(args.module) for _ in range(args.repeat)]
+    totals = [run[args.module][0] for run in runs]
+    median = statistics.median(totals)
+
+    # importtime indents each level by two spaces
+    child_depth = runs[0][args.module][1] + 2
+    children = {name: [run[name][0] for run in runs if name in run]
+                for name, (_, depth) in runs[0].items() if depth == child_depth}
+    slowest = sorted(((name, statistics.median(ms)) for name, ms in children.items()), key=lambda item: -item[1])
+    for name, ms in slowest[:args.top]:
+        print(f"  {name:40} {ms:>9.1f} ms")
+    print(f"import {args.module}: median {median:.1f} ms, best {min(totals):.1f} ms (budget {args.max_ms:.0f} ms)")
+
+    cases = [{"name": f"import_{args.module}", "median_ms": round(median, 3), "best_ms": round(min(totals), 3)}]
+    print(f"Results written to {write_results('startup', vars(args), cases, args.out)}")
+    if median > args.max_ms:
+        print(f"Import time of {args.module} is over budget by {median - args.max_ms:.1f} ms", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,205 @@
+"""
+Load generator for the API. Reports p50/p95/p99 latency and req/s per scenario and concurrency level.
+
+By default it starts the mock upstreams and the API (uvicorn) itself, with a throwaway cache, so no real
+USDA key or model is needed; pass --url to load an already running server instead.
+
+    python -m benchmarks.load_test --scenarios analyze ask-stream --concurrency 1 8 32 --requests 200
+    python -m benchmarks.load_test --url http://localhost:8000 --scenarios analyze-v2 --distinct 20
+
+Each scenario and concurrency level uses its own set of keys, so it starts with a cold cache;
+--distinct bounds the number of different foods or questions per level and thereby the cache hit ratio.
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+import httpx
+
+from benchmarks.report import latency_summary, write_results
+
+SCENARIOS = ("analyze", "analyze-v2", "ask", "ask-stream")
+SERVE_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "serve.py")
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_until_up(url: str, process: subprocess.Popen, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{' '.join(process.args)} exited with code {process.returncode}")
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+
+@contextmanager
+def spawned_stack(usda_latency: float, ttft: float, token_delay: float, workers: int) -> Iterator[str]:
+    """
+    Runs the mock upstreams and the API in subprocesses and yields the API base URL.
+    """
+    mock_port, api_port = _free_port(), _free_port()
+    workdir = tempfile.mkdtemp(prefix="nutrifit-bench-")
+    env = dict(
+        os.environ,
+        USDA_API_KEY="benchmark",
+        USDA_API_URL=f"http://127.0.0.1:{mock_port}/fdc/v1",
+        OLLAMA_HOST=f"http://127.0.0.1:{mock_port}",
+        NUTRITION_CACHE_PATH=os.path.join(workdir, "nutrition_cache.sqlite3"),
+        USDA_LOCAL_INDEX_PATH=os.path.join(workdir, "no_index.sqlite3"),
+        LOG_PATH=os.path.join(workdir, "app.log"),
+        # The synthetic foods are not popular foods; keep background USDA calls out of the measurements
+        PREFETCH_ENABLED="false",
+        # Only exact repeats hit the answer cache, so --distinct controls the hit ratio for /ask as well
+        ANSWER_CACHE_EMBEDDINGS="off",
+    )
+    mock = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.mock_upstreams", "--port", str(mock_port), "--usda-latency",
+         str(usda_latency), "--ttft", str(ttft), "--token-delay", str(token_delay)],
+        env=env, stdout=subprocess.DEVNULL,
+    )
+    api = subprocess.Popen(
+        [sys.executable, SERVE_SCRIPT, "--bind", f"127.0.0.1:{api_port}", "--workers", str(workers), "--preload"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        _wait_until_up(f"http://127.0.0.1:{mock_port}/fdc/v1/foods/search?query=warmup", mock)
+        _wait_until_up(f"http://127.0.0.1:{api_port}/", api)
+        yield f"http://127.0.0.1:{api_port}"
+    finally:
+        for process in (api, mock):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+async def _request(client: httpx.AsyncClient, scenario: str, key: str) -> Optional[float]:
+    """
+    Sends one request and returns the time to first token for streamed answers, else None.
+    """
+    if scenario == "analyze":
+        response = await client.get(f"/analyze/{key}")
+    elif scenario == "analyze-v2":
+        response = await client.get(f"/v2/analyze/{key}")
+    elif scenario == "ask":
+        response = await client.get(f"/ask/{key}")
+    else:
+        start = time.perf_counter()
+        first_token = None
+        async with client.stream("GET", "/ask/stream", params={"question": key}) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if first_token is None and line.startswith("data:") and '"token"' in line:
+                    first_token = time.perf_counter() - start
+        return first_token
+    response.raise_for_status()
+    return None
+
+
+def _key(scenario: str, run_id: str, concurrency: int, index: int) -> str:
+    food = f"bench food {scenario} {run_id} c{concurrency} {index}"
+    return food if scenario.startswith("analyze") else f"Is {food} a good source of potassium?"
+
+
+async def run_level(url: str, scenario: str, concurrency: int, requests: int, distinct: int, run_id: str) -> dict:
+    latencies, ttfts, errors, rejected = [], [], 0, 0
+    next_index = 0
+
+    async def worker(client: httpx.AsyncClient) -> None:
+        nonlocal next_index, errors, rejected
+        while next_index < requests:
+            index = next_index
+            next_index += 1
+            start = time.perf_counter()
+            try:
+                ttft = await _request(client, scenario, _key(scenario, run_id, concurrency, index % distinct))
+            except httpx.HTTPStatusError as e:
+                # 429/503 are the API shedding load, which keeps goodput up under overload
+                if e.response.status_code in (429, 503):
+                    rejected += 1
+                else:
+                    errors += 1
+                continue
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+            if ttft is not None:
+                ttfts.append(ttft)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, timeout=300.0, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    result = {
+        "name": f"{scenario}@c{concurrency}",
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": errors,
+        "rejected": rejected,
+        "elapsed_s": round(elapsed, 3),
+        "requests_per_second": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        **latency_summary(latencies),
+    }
+    if ttfts:
+        result.update(latency_summary(ttfts, prefix="ttft_"))
+    return result
+
+
+async def run(url: str, scenarios: list, levels: list, requests: int, distinct: Optional[int]) -> list:
+    run_id = f"{int(time.time()) % 100000}"
+    results = []
+    for scenario in scenarios:
+        for concurrency in levels:
+            result = await run_level(url, scenario, concurrency, requests, distinct or requests, run_id)
+            results.append(result)
+            print(f"{result['name']:18} {result['requests_per_second']:>9.1f} req/s  p50 {result['p50_ms']:>9.1f} ms  "
+                  f"p95 {result['p95_ms']:>9.1f} ms  p99 {result['p99_ms']:>9.1f} ms  errors {result['errors']}  rejected {result['rejected']}")
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load generator for the NutriFit API")
+    parser.add_argument("--url", help="Load this running server instead of spawning one with mock upstreams")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=["analyze", "ask"])
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario and concurrency level")
+    parser.add_argument("--distinct", type=int, help="Distinct foods/questions per level (default: all distinct)")
+    parser.add_argument("--usda-latency", type=float, default=0.1, help="Mock USDA delay per call (s)")
+    parser.add_argument("--ttft", type=float, default=0.2, help="Mock Ollama delay before the first token (s)")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="Mock Ollama delay between tokens (s)")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes for the spawned API (serve.py)")
+    parser.add_argument("--out", help="Result file (default: benchmarks/results/load-<timestamp>.json)")
+    args = parser.parse_args()
+
+    parameters = {key: value for key, value in vars(args).items() if key != "out"}
+    if args.url:
+        results = asyncio.run(run(args.url, args.scenarios, args.concurrency, args.requests, args.distinct))
+    else:
+        with spawned_stack(args.usda_latency, args.ttft, args.token_delay, args.workers) as url:
+            results = asyncio.run(run(url, args.scenarios, args.concurrency, args.requests, args.distinct))
+    print(f"Results written to {write_results('load', parameters, results, args.out)}")
+
+
+if __name__ == "__main__":
+    main()
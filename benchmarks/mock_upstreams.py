@@ -0,0 +1,201 @@
+"""
+Local stand-in for USDA FoodData Central and Ollama, so the API can be load-tested offline.
+
+Serves the USDA endpoints the app uses (GET /fdc/v1/foods/search, GET /fdc/v1/food/{fdcId},
+POST /fdc/v1/foods) and Ollama's /api/generate (streaming and non-streaming) and /api/embeddings,
+each with configurable latency:
+
+    python -m benchmarks.mock_upstreams --port 8100 --usda-latency 0.2 --ttft 0.3 --token-delay 0.02
+    USDA_API_URL=http://127.0.0.1:8100/fdc/v1 OLLAMA_HOST=http://127.0.0.1:8100 uvicorn main:app
+"""
+import argparse
+import json
+import socket
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Nutrients every mock food carries: (id, name, unit, base amount per 100 g)
+MOCK_NUTRIENTS = (
+    (1008, "Energy", "kcal", 250.0),
+    (1003, "Protein", "g", 12.0),
+    (1004, "Total lipid (fat)", "g", 9.0),
+    (1005, "Carbohydrate, by difference", "g", 30.0),
+    (1079, "Fiber, total dietary", "g", 3.0),
+    (2000, "Total Sugars", "g", 8.0),
+    (1093, "Sodium, Na", "mg", 120.0),
+    (1253, "Cholesterol", "mg", 20.0),
+    (1087, "Calcium, Ca", "mg", 60.0),
+    (1089, "Iron, Fe", "mg", 1.5),
+    (1092, "Potassium, K", "mg", 300.0),
+    (1162, "Vitamin C, total ascorbic acid", "mg", 10.0),
+)
+ANSWER_WORDS = (
+    "Bananas are a good source of potassium, vitamin B6 and fiber, and a medium banana has about "
+    "105 calories. Pair them with protein to keep you full for longer."
+).split()
+
+
+def fdc_id_for(query: str) -> int:
+    return zlib.crc32(query.lower().encode()) % 9_000_000 + 1_000_000
+
+
+def food_details(fdc_id: int) -> dict:
+    """
+    A deterministic USDA details response shaped like an SR Legacy food.
+    """
+    scale = 0.5 + (fdc_id % 100) / 100
+    return {
+        "fdcId": fdc_id,
+        "description": f"Mock food {fdc_id}, raw",
+        "dataType": "SR Legacy",
+        "foodNutrients": [
+            {"type": "FoodNutrient", "nutrient": {"id": nutrient_id, "number": str(nutrient_id), "name": name,
+                                                  "rank": 100, "unitName": unit},
+             "amount": round(amount * scale, 3), "dataPoints": 1}
+            for nutrient_id, name, unit, amount in MOCK_NUTRIENTS
+        ],
+        "foodPortions": [
+            {"id": fdc_id * 10, "amount": 1.0, "gramWeight": 118.0, "modifier": "medium",
+             "measureUnit": {"id": 9999, "name": "undetermined", "abbreviation": "undetermined"}},
+            {"id": fdc_id * 10 + 1, "amount": 1.0, "gramWeight": 150.0, "modifier": "",
+             "measureUnit": {"id": 1000, "name": "cup", "abbreviation": "cup"}},
+        ],
+    }
+
+
+class MockUpstreamHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "MockUpstreamServer"
+
+    def setup(self):
+        super().setup()
+        # Headers and body go out as separate writes; without this Nagle adds ~40 ms to each response
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, body, status: int = 200) -> None:
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        self.server.count("usda")
+        time.sleep(self.server.usda_latency)
+        if url.path == "/fdc/v1/foods/search":
+            query = parse_qs(url.query).get("query", [""])[0]
+            fdc_id = fdc_id_for(query)
+            self._send_json({"totalHits": 1, "foods": [{"fdcId": fdc_id, "description": f"Mock food {fdc_id}, raw"}]})
+        elif url.path.startswith("/fdc/v1/food/"):
+            self._send_json(food_details(int(url.path.rsplit("/", 1)[-1])))
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        body = self._read_json()
+        if url.path == "/fdc/v1/foods":
+            self.server.count("usda")
+            time.sleep(self.server.usda_latency)
+            self._send_json([food_details(int(fdc_id)) for fdc_id in body.get("fdcIds", [])])
+        elif url.path == "/api/generate":
+            self.server.count("ollama")
+            self._generate(body)
+        elif url.path == "/api/embeddings":
+            self.server.count("ollama")
+            vector = [((zlib.crc32(f"{body.get('prompt', '')}:{i}".encode()) % 2000) - 1000) / 1000 for i in range(64)]
+            self._send_json({"embedding": vector})
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+    def _generate(self, body: dict) -> None:
+        words = ANSWER_WORDS[:body.get("options", {}).get("num_predict") or len(ANSWER_WORDS)]
+        ttft, token_delay = self.server.ttft, self.server.token_delay
+        if not body.get("stream", True):
+            time.sleep(ttft + token_delay * max(len(words) - 1, 0))
+            self._send_json({
+                "model": body.get("model"), "response": " ".join(words), "done": True,
+                "load_duration": 0, "prompt_eval_duration": int(ttft * 1e9),
+                "eval_count": len(words), "eval_duration": int(token_delay * max(len(words) - 1, 1) * 1e9),
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        time.sleep(ttft)
+        try:
+            for i, word in enumerate(words):
+                if i:
+                    time.sleep(token_delay)
+                self._write_chunk({"model": body.get("model"), "response": ("" if i == 0 else " ") + word, "done": False})
+            self._write_chunk({"model": body.get("model"), "response": "", "done": True})
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client cancelled the stream, as the app does when its own client disconnects
+            self.server.count("ollama_cancelled")
+
+    def _write_chunk(self, chunk: dict) -> None:
+        line = json.dumps(chunk).encode() + b"\n"
+        self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+        self.wfile.flush()
+
+
+class MockUpstreamServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 drops connections under load, which shows up as 1 s SYN retransmits
+    request_queue_size = 1024
+
+    def __init__(self, address, usda_latency: float = 0.1, ttft: float = 0.2, token_delay: float = 0.02):
+        super().__init__(address, MockUpstreamHandler)
+        self.usda_latency = usda_latency
+        self.ttft = ttft
+        self.token_delay = token_delay
+        self.calls = {"usda": 0, "ollama": 0, "ollama_cancelled": 0}
+        self._lock = threading.Lock()
+
+    def count(self, upstream: str) -> None:
+        with self._lock:
+            self.calls[upstream] += 1
+
+
+def start_in_thread(port: int = 0, **latencies) -> MockUpstreamServer:
+    """
+    Starts the mock server on a background thread; port 0 picks a free port (see server.server_port).
+    """
+    server = MockUpstreamServer(("127.0.0.1", port), **latencies)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Mock USDA FoodData Central and Ollama servers")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--usda-latency", type=float, default=0.1, help="Delay per USDA call (s)")
+    parser.add_argument("--ttft", type=float, default=0.2, help="Delay before the first generated token (s)")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="Delay between generated tokens (s)")
+    args = parser.parse_args()
+
+    server = MockUpstreamServer(("127.0.0.1", args.port), args.usda_latency, args.ttft, args.token_delay)
+    print(f"Mock USDA at http://127.0.0.1:{args.port}/fdc/v1, mock Ollama at http://127.0.0.1:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
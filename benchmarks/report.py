@@ -0,0 +1,114 @@
+"""
+Result files shared by the benchmarks, and a comparison of two runs:
+
+    python -m benchmarks.report benchmarks/results/load-old.json benchmarks/results/load-new.json
+
+Every result file holds run metadata (time, git commit, Python, platform, parameters) and a list of
+cases, each with a name and its metrics. Cases are matched by name when comparing.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Optional
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+# Metrics where a larger value is an improvement; every other *_ms or *_us metric is lower-is-better
+HIGHER_IS_BETTER = {"requests_per_second", "ops_per_second"}
+
+
+def percentile(sorted_samples: list, fraction: float) -> float:
+    """
+    Nearest-rank percentile of already sorted samples.
+    """
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples), max(1, math.ceil(fraction * len(sorted_samples)))) - 1
+    return sorted_samples[index]
+
+
+def latency_summary(latencies: list, prefix: str = "") -> dict:
+    """
+    p50/p95/p99/max/mean in milliseconds for latencies given in seconds.
+    """
+    ordered = sorted(latencies)
+    summary = {f"{prefix}p{int(q * 100)}_ms": round(percentile(ordered, q) * 1000, 3) for q in (0.5, 0.95, 0.99)}
+    summary[f"{prefix}max_ms"] = round(ordered[-1] * 1000, 3) if ordered else 0.0
+    summary[f"{prefix}mean_ms"] = round(sum(ordered) / len(ordered) * 1000, 3) if ordered else 0.0
+    return summary
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True, timeout=5
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def write_results(benchmark: str, parameters: dict, cases: list, out: Optional[str] = None) -> str:
+    """
+    Writes a result file and returns its path; by default benchmarks/results/<benchmark>-<timestamp>.json.
+    """
+    if out is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        out = os.path.join(RESULTS_DIR, f"{benchmark}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    document = {
+        "benchmark": benchmark,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": parameters,
+        "cases": cases,
+    }
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(document, f, indent=2)
+    return out
+
+
+def compare(old_path: str, new_path: str, threshold: float) -> int:
+    """
+    Prints the change of every shared metric and returns the number of regressions beyond the threshold.
+    """
+    with open(old_path, encoding="utf-8") as f:
+        old = {case["name"]: case for case in json.load(f)["cases"]}
+    with open(new_path, encoding="utf-8") as f:
+        new = {case["name"]: case for case in json.load(f)["cases"]}
+
+    regressions = 0
+    for name in (name for name in new if name in old):
+        print(name)
+        for metric, value in new[name].items():
+            before = old[name].get(metric)
+            if not metric.endswith(("_ms", "_us", "per_second")) or not before:
+                continue
+            change = (value - before) / before
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            flag = ""
+            if worse > threshold:
+                flag = "  REGRESSION"
+                regressions += 1
+            print(f"  {metric:24} {before:>12.3f} -> {value:>12.3f}  {change:+7.1%}{flag}")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative slowdown reported as a regression")
+    args = parser.parse_args()
+    regressions = compare(args.old, args.new, args.threshold)
+    print(f"{regressions} regression(s) beyond {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
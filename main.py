@@ -1,8 +1,115 @@
-from src.ai_model import get_nutrition_info, query_nutrition_knowledge
-from fastapi import FastAPI
-from fastapi.responses import JSONResponse
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager
+from typing import Literal
 
-app = FastAPI()
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+
+from src.ai_model import (
+    NutritionLookupError,
+    aanalyze_meal,
+    aget_nutrition_info,
+    aget_nutrition_report,
+    aget_nutrition_reports,
+    aanswer_nutrition_question,
+    answer_cache,
+    astream_nutrition_knowledge,
+    configure,
+    fact_index,
+    load_food_resolver,
+    local_food_index,
+    nutrition_cache,
+    suggest_foods,
+)
+from src.columnar import MEDIA_TYPES, cache_foods, index_foods, iter_record_batches, stream_foods
+from src.metrics import CONTENT_TYPE, Gauge, Histogram, render_metrics
+from src.prefetch import prefetcher
+from src.scheduler import PRIORITY_BATCH, PRIORITY_INTERACTIVE, LLMOverloadedError, llm_scheduler
+from src.upstream import close_upstream_clients
+from src.schemas import (
+    BatchAnalyzeItem,
+    BatchAnalyzeRequest,
+    BatchAnalyzeResponse,
+    FoodSuggestResponse,
+    MealAnalyzeRequest,
+    MealAnalyzeResponse,
+    NutritionReport,
+)
+
+http_request_duration = Histogram("http_request_duration_seconds", "Request latency by method, route and status")
+http_requests_in_flight = Gauge("http_requests_in_flight", "HTTP requests currently being served")
+
+
+class MetricsMiddleware:
+    """
+    Times every request until its last body chunk is sent, so streamed answers are measured in full.
+    Routes are labelled with their path template, which keeps the number of series bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_requests_in_flight.dec()
+            route = getattr(scope.get("route"), "path", "unmatched")
+            http_request_duration.observe(
+                time.perf_counter() - start, method=scope["method"], route=route, status=status_code
+            )
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Process startup and shutdown. Everything with side effects or a noticeable cost runs here rather than
+    at import, so importing the app (workers, tests, CLIs) stays fast.
+    """
+    configure()
+    # Build or memory-map the nutrition fact index before the first question arrives
+    fact_index.load()
+    # Load every offline-index food name off the event loop; lookups skip the resolver until it is done
+    resolver_load = asyncio.create_task(asyncio.to_thread(load_food_resolver))
+    # Warm and keep refreshing popular foods without delaying startup
+    prefetcher.start()
+    yield
+    resolver_load.cancel()
+    await prefetcher.stop()
+    await close_upstream_clients()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
+
+
+def _client_id(request: Request) -> str:
+    """
+    Identifies the caller for fair LLM scheduling: an explicit X-Client-ID, else the peer address.
+    """
+    return request.headers.get("x-client-id") or (request.client.host if request.client else "anonymous")
+
+@app.exception_handler(LLMOverloadedError)
+async def llm_overloaded(request: Request, e: LLMOverloadedError):
+    return JSONResponse(
+        content={"detail": e.message}, status_code=e.status_code, headers={"Retry-After": str(int(e.retry_after))}
+    )
 
 @app.get("/")
 async def root():
@@ -10,18 +117,99 @@ async def root():
 
 @app.get("/analyze/{food_item}")
 async def analyze_food(food_item: str):
-    result = get_nutrition_info(food_item)
+    result = await aget_nutrition_info(food_item)
     response = {
         "food": food_item,
         "nutrition_info": result.replace("\n", " ")
     }
     return JSONResponse(content=response, status_code=200)
 
+@app.get("/v2/analyze/{food_item}", response_model=NutritionReport)
+async def analyze_food_v2(food_item: str):
+    try:
+        return await aget_nutrition_report(food_item)
+    except NutritionLookupError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+
+@app.post("/analyze/batch", response_model=BatchAnalyzeResponse)
+async def analyze_batch(request: BatchAnalyzeRequest):
+    results = []
+    for food_item, (report, error) in zip(request.foods, await aget_nutrition_reports(request.foods)):
+        if error:
+            results.append(BatchAnalyzeItem(food=food_item, status_code=error.status_code, error=error.message))
+        else:
+            results.append(BatchAnalyzeItem(food=food_item, report=report))
+    return BatchAnalyzeResponse(results=results)
+
+@app.post("/meal/analyze", response_model=MealAnalyzeResponse)
+async def analyze_meal(request: MealAnalyzeRequest):
+    return await aanalyze_meal(request.items)
+
+@app.get("/foods/suggest", response_model=FoodSuggestResponse)
+async def foods_suggest(q: str, limit: int = Query(10, ge=1, le=50)):
+    return FoodSuggestResponse(query=q, suggestions=suggest_foods(q, limit=limit))
+
+@app.get("/export/foods")
+def export_foods(source: Literal["cache", "index"] = "cache", format: Literal["parquet", "arrow"] = "parquet",
+                 include_branded: bool = False):
+    if source == "index" and not local_food_index.available:
+        raise HTTPException(status_code=404, detail="No offline USDA index is loaded.")
+    foods = cache_foods(nutrition_cache) if source == "cache" else index_foods(local_food_index, include_branded)
+    extension = "parquet" if format == "parquet" else "arrows"
+    # A sync generator is iterated in the threadpool, so reading SQLite and encoding never block the event loop
+    return StreamingResponse(
+        stream_foods(iter_record_batches(foods), format), media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="foods-{source}.{extension}"'},
+    )
+
+@app.get("/metrics")
+async def metrics():
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE)
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return JSONResponse(content=nutrition_cache.stats(), status_code=200)
+
+@app.get("/ask/cache/stats")
+async def answer_cache_stats():
+    return JSONResponse(content=answer_cache.stats(), status_code=200)
+
+@app.get("/ask/stream")
+async def ask_question_stream(question: str, request: Request):
+    cached = await answer_cache.get(question)
+    # Wait for a generation slot before answering, so an overloaded server can still reply 429/503
+    lease = None if cached else await llm_scheduler.acquire(_client_id(request), PRIORITY_INTERACTIVE)
+
+    async def events():
+        if cached:
+            yield f"data: {json.dumps({'token': cached[0], 'cached': cached[1]})}\n\n"
+            yield "event: done\ndata: {}\n\n"
+            return
+        tokens = astream_nutrition_knowledge(question, lease)
+        try:
+            async for token in tokens:
+                if await request.is_disconnected():
+                    break
+                yield f"data: {json.dumps({'token': token})}\n\n"
+            yield "event: done\ndata: {}\n\n"
+        finally:
+            # Closes the upstream stream so Ollama stops generating for a client that left
+            await tokens.aclose()
+            lease.release()
+
+    # Also release the slot after the response, in case the client left before the body was started
+    return StreamingResponse(
+        events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"},
+        background=BackgroundTask(lease.release) if lease else None,
+    )
+
 @app.get("/ask/{question}")
-async def ask_question(question: str):
-    result = query_nutrition_knowledge(question)
+async def ask_question(question: str, request: Request):
+    # Streamed answers have someone watching tokens arrive, so they are dispatched first
+    result, cached = await aanswer_nutrition_question(question, _client_id(request), PRIORITY_BATCH)
     response = {
         "question": question,
-        "answer": result.replace("\n", " ")
+        "answer": result.replace("\n", " "),
+        "cached": cached
     }
     return JSONResponse(content=response, status_code=200)
\ No newline at end of file
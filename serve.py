@@ -0,0 +1,113 @@
+"""
+Production launcher: runs the API in several worker processes that share one on-disk nutrition cache.
+
+    python serve.py --workers 4 --preload --bind 0.0.0.0:8000
+
+Workers are gunicorn processes running uvicorn's event loop. With --preload the app is imported once in
+the master, which also loads the fact index and the food-name resolver, so forked workers share those
+pages copy-on-write instead of each building their own. The nutrition cache is a WAL-mode, memory-mapped
+SQLite file (NUTRITION_CACHE_PATH) that every worker reads concurrently, so a food fetched by one worker
+is a cache hit in all of them. Without gunicorn (e.g. on Windows) it falls back to uvicorn's own workers.
+
+Each worker keeps its own in-process LRU, counters and /metrics; scrape every worker or run one per port.
+With several workers each also writes its own rotating log, logs/app.<pid>.log (LOG_PER_PROCESS).
+
+The LLM admission limits are per process, so LLM_MAX_CONCURRENCY and LLM_QUEUE_SIZE are divided between the
+workers before the app is loaded: together they generate at most LLM_MAX_CONCURRENCY answers on the shared
+Ollama host. Every worker needs at least one slot, so with more workers than LLM_MAX_CONCURRENCY the cap is
+one per worker; start fewer workers to keep a tighter cap.
+"""
+import argparse
+import gc
+import os
+
+from loguru import logger
+
+import src.settings  # noqa: F401  (loads .env before the settings below are read)
+
+DEFAULT_WORKERS = int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1)))
+DEFAULT_BIND = os.getenv("NUTRIFIT_BIND", "127.0.0.1:8000")
+DEFAULT_TIMEOUT = int(os.getenv("WORKER_TIMEOUT", "120"))
+
+
+def split_llm_limits(workers: int) -> None:
+    """
+    Gives each worker its share of the LLM concurrency cap and queue. Must run before the app is imported,
+    since the scheduler reads its limits at import; the workers inherit the environment.
+    """
+    from src.upstream import OLLAMA_MAX_CONCURRENCY
+
+    workers = max(1, workers)
+    total = int(os.getenv("LLM_MAX_CONCURRENCY", str(OLLAMA_MAX_CONCURRENCY)))
+    if workers > total:
+        logger.warning(f"{workers} workers each need an LLM slot, so up to {workers} answers can be generated "
+                       f"at once instead of LLM_MAX_CONCURRENCY={total}")
+    os.environ["LLM_MAX_CONCURRENCY"] = str(max(1, total // workers))
+    os.environ["LLM_QUEUE_SIZE"] = str(max(1, int(os.getenv("LLM_QUEUE_SIZE", "32")) // workers))
+
+
+def preload_app():
+    """
+    Imports the app and does the read-only startup work before the workers are forked.
+    """
+    from main import app
+    from src.ai_model import fact_index, load_food_resolver
+
+    fact_index.load()
+    load_food_resolver()
+    # Keep the collector from touching (and so copying) the preloaded objects in every worker
+    gc.collect()
+    gc.freeze()
+    return app
+
+
+def run_gunicorn(bind: str, workers: int, preload: bool, timeout: int) -> None:
+    from gunicorn.app.base import BaseApplication
+
+    class NutriFitApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", bind)
+            self.cfg.set("workers", workers)
+            self.cfg.set("worker_class", "uvicorn.workers.UvicornWorker")
+            self.cfg.set("preload_app", preload)
+            self.cfg.set("timeout", timeout)
+            self.cfg.set("graceful_timeout", timeout)
+
+        def load(self):
+            if preload:
+                return preload_app()
+            from main import app
+            return app
+
+    NutriFitApplication().run()
+
+
+def run_uvicorn(bind: str, workers: int) -> None:
+    import uvicorn
+
+    host, _, port = bind.rpartition(":")
+    uvicorn.run("main:app", host=host or "127.0.0.1", port=int(port), workers=workers)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the NutriFit API with several worker processes")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Worker processes (default: CPU count)")
+    parser.add_argument("--bind", default=DEFAULT_BIND, help="host:port to listen on")
+    parser.add_argument("--preload", action="store_true", help="Load the app and its indexes once before forking")
+    parser.add_argument("--timeout", type=int, default=DEFAULT_TIMEOUT, help="Seconds before a silent worker is restarted")
+    args = parser.parse_args()
+    split_llm_limits(args.workers)
+    if args.workers > 1:
+        os.environ.setdefault("LOG_PER_PROCESS", "true")
+
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        logger.warning("gunicorn is not installed; falling back to uvicorn workers without --preload")
+        run_uvicorn(args.bind, args.workers)
+        return
+    run_gunicorn(args.bind, args.workers, args.preload, args.timeout)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,100 +1,842 @@
+import asyncio
+import collections
+import json
+import math
 import os
-import requests
-from dotenv import load_dotenv
+import sqlite3
+import threading
+import time
+from typing import AsyncIterator, Optional, Tuple
+
+import httpx
+import numpy as np
 from loguru import logger
 
-# Load environment variables
-load_dotenv()
+import src.settings  # noqa: F401  (loads .env before the settings below are read)
+from src.answer_cache import AnswerCache, answer_cache_lookups
+from src.cache import NutritionCache, fdc_key, normalize_query, query_key
+from src.embeddings import hashed_embedding
+from src.food_resolver import CONFIDENT_SCORE, FoodResolver
+from src.meal_engine import MEAL_NUTRIENTS, MealEngine, PortionError
+from src.metrics import Counter, Gauge, Histogram
+from src.nutrients import FoodNutrients, normalize_portion
+from src.retrieval import FactIndex
+from src.resilience import CircuitOpenError
+from src.scheduler import PRIORITY_INTERACTIVE, Lease, LLMOverloadedError, llm_scheduler
+from src.schemas import Macros, MealAnalyzeResponse, MealItemResult, Nutrient, NutritionReport
+from src.singleflight import SingleFlight
+from src.upstream import ollama_sync_upstream, ollama_upstream, usda_sync_upstream, usda_upstream
+from src.usda_index import LocalFoodIndex
+
 usda_api_key = os.getenv("USDA_API_KEY")
+LOG_PATH = os.getenv("LOG_PATH", "logs/app.log")
+# Set by serve.py for several workers: rotating one file from several processes loses lines
+LOG_PER_PROCESS = os.getenv("LOG_PER_PROCESS", "false").lower() == "true"
+_configured = False
 
-# Set up logging
-logger.add("logs/app.log", rotation="10 MB", level="INFO")
 
-# Validate API key
-if not usda_api_key:
-    logger.critical("USDA_API_KEY not found in environment variables. Please set it.")
+def _log_path() -> str:
+    """
+    LOG_PATH, or with LOG_PER_PROCESS this process's own file next to it (logs/app.<pid>.log).
+    """
+    if not LOG_PER_PROCESS:
+        return LOG_PATH
+    root, extension = os.path.splitext(LOG_PATH)
+    return f"{root}.{os.getpid()}{extension}"
+
+
+def configure() -> None:
+    """
+    One-time process setup: the rotating request log and the USDA key check. Called from the API
+    lifespan rather than at import, so importing this module stays cheap and free of side effects.
+    """
+    global _configured
+    if _configured:
+        return
+    _configured = True
+    # enqueue: lines are written by a background thread, never by the event loop
+    logger.add(_log_path(), rotation="10 MB", level="INFO", enqueue=True)
+    if not usda_api_key:
+        logger.critical("USDA_API_KEY not found in environment variables. Please set it.")
 
 # Ollama configuration
-OLLAMA_URL = "http://localhost:11434/api/generate"
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+OLLAMA_URL = f"{OLLAMA_HOST}/api/generate"
 OLLAMA_MODEL = "llama3.1:8b"
+OLLAMA_EMBEDDINGS_URL = f"{OLLAMA_HOST}/api/embeddings"
+OLLAMA_EMBED_MODEL = os.getenv("OLLAMA_EMBED_MODEL", "nomic-embed-text")
+OLLAMA_NUM_PREDICT = int(os.getenv("OLLAMA_NUM_PREDICT", "256"))
+
+# Retrieval configuration: facts from FACT_SOURCE_DIR are indexed into FACT_INDEX_DIR
+FACT_SOURCE_DIR = os.getenv("FACT_SOURCE_DIR", "data")
+FACT_INDEX_DIR = os.getenv("FACT_INDEX_DIR", "data/index")
+FACT_TOP_K = int(os.getenv("FACT_TOP_K", "3"))
+
+PROMPT_TEMPLATE = (
+    "You are a concise nutrition assistant. Use the facts below when they are relevant. "
+    "Answer in at most four sentences.\n\nFacts:\n{facts}\n\nQuestion: {question}\nAnswer:"
+)
+
+# Answer cache configuration; ANSWER_CACHE_EMBEDDINGS is "local", "ollama" or "off"
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", str(24 * 3600)))
+ANSWER_CACHE_CAPACITY = int(os.getenv("ANSWER_CACHE_CAPACITY", "2048"))
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.9"))
+ANSWER_CACHE_EMBEDDINGS = os.getenv("ANSWER_CACHE_EMBEDDINGS", "off")
+
+# USDA FoodData Central configuration
+USDA_API_URL = os.getenv("USDA_API_URL", "https://api.nal.usda.gov/fdc/v1")
+USDA_MULTI_FOOD_BATCH_SIZE = 20  # USDA caps the multi-ID /foods endpoint at 20 FDC IDs per request
+
+# Nutrition cache configuration
+NUTRITION_CACHE_PATH = os.getenv("NUTRITION_CACHE_PATH", "data/cache/nutrition_cache.sqlite3")
+NUTRITION_CACHE_TTL = float(os.getenv("NUTRITION_CACHE_TTL", str(7 * 24 * 3600)))
+NUTRITION_CACHE_MEMORY_ENTRIES = int(os.getenv("NUTRITION_CACHE_MEMORY_ENTRIES", "1024"))
+NUTRITION_CACHE_DISK_ENTRIES = int(os.getenv("NUTRITION_CACHE_DISK_ENTRIES", "100000"))
+
+# Offline USDA index, built with `python -m src.usda_index import <FoodData Central download>`
+USDA_LOCAL_INDEX_PATH = os.getenv("USDA_LOCAL_INDEX_PATH", "data/usda/fdc_index.sqlite3")
+
+# Food-name resolver: maps queries to FDC IDs locally; branded products are left to the USDA search
+FOOD_RESOLVER_MIN_SCORE = float(os.getenv("FOOD_RESOLVER_MIN_SCORE", str(CONFIDENT_SCORE)))
+FOOD_RESOLVER_INCLUDE_BRANDED = os.getenv("FOOD_RESOLVER_INCLUDE_BRANDED", "false").lower() == "true"
+
+nutrition_cache = NutritionCache(
+    NUTRITION_CACHE_PATH,
+    ttl_seconds=NUTRITION_CACHE_TTL,
+    max_memory_entries=NUTRITION_CACHE_MEMORY_ENTRIES,
+    max_disk_entries=NUTRITION_CACHE_DISK_ENTRIES,
+)
+local_food_index = LocalFoodIndex(USDA_LOCAL_INDEX_PATH)
+usda_flight = SingleFlight()
+food_resolver = FoodResolver()
+# Live lookups per normalized query; the prefetcher keeps the most requested foods fresh
+food_lookup_counts = collections.Counter()
+_food_resolver_started = False
+_food_resolver_loaded = threading.Event()
+_food_resolver_lock = threading.Lock()
+
+
+async def _local_question_embedding(text: str) -> np.ndarray:
+    return hashed_embedding(text)
+
+
+async def _ollama_question_embedding(text: str) -> np.ndarray:
+    # Bypasses the generation concurrency cap: embeddings are cheap and must not queue behind answers
+    response = await ollama_upstream.client.post(
+        OLLAMA_EMBEDDINGS_URL, json={"model": OLLAMA_EMBED_MODEL, "prompt": text}
+    )
+    response.raise_for_status()
+    vector = np.asarray(response.json()["embedding"], dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+fact_index = FactIndex(FACT_INDEX_DIR, FACT_SOURCE_DIR)
+
+answer_cache = AnswerCache(
+    ttl_seconds=ANSWER_CACHE_TTL,
+    capacity=ANSWER_CACHE_CAPACITY,
+    similarity_threshold=ANSWER_CACHE_SIMILARITY,
+    embed={"local": _local_question_embedding, "ollama": _ollama_question_embedding}.get(ANSWER_CACHE_EMBEDDINGS),
+)
+
+# LLM streaming metrics
+llm_time_to_first_token = Histogram("llm_time_to_first_token_seconds", "Time from request to first generated token")
+llm_tokens_per_second = Histogram(
+    "llm_tokens_per_second", "Generation speed of answers",
+    buckets=(1, 2, 5, 10, 20, 30, 50, 75, 100, 200),
+)
+llm_stream_cancellations = Counter("llm_stream_cancellations_total", "Streamed answers abandoned by the client")
+llm_generations_in_flight = Gauge("llm_generations_in_flight", "Answers Ollama is currently generating")
+
+# Nutrition lookup metrics; stages are local (cache, resolver, offline index), search, details and format
+nutrition_stage_duration = Histogram("nutrition_stage_duration_seconds", "Time spent in each stage of a nutrition lookup")
+nutrition_cache_hit_ratio = Gauge("nutrition_cache_hit_ratio", "Share of nutrition cache lookups that were hits")
+nutrition_cache_hit_ratio.set_function(lambda: nutrition_cache.stats()["hit_ratio"])
+usda_lookups_in_flight = Gauge("usda_lookups_in_flight", "Distinct USDA lookups in flight after coalescing")
+usda_lookups_in_flight.set_function(lambda: usda_flight.stats()["in_flight"])
+
+
+def _answer_cache_hit_ratio() -> float:
+    hits = answer_cache_lookups.value(result="exact") + answer_cache_lookups.value(result="semantic")
+    lookups = hits + answer_cache_lookups.value(result="miss")
+    return hits / lookups if lookups else 0.0
+
+
+answer_cache_hit_ratio = Gauge("answer_cache_hit_ratio", "Share of answer cache lookups served from the cache")
+answer_cache_hit_ratio.set_function(_answer_cache_hit_ratio)
+
+
+def _build_prompt(question: str) -> str:
+    """
+    Grounds the question with the most relevant local nutrition facts.
+    """
+    facts = fact_index.search(question, k=FACT_TOP_K)
+    if not facts:
+        return question
+    return PROMPT_TEMPLATE.format(facts="\n".join(f"- {fact}" for fact in facts), question=question)
+
+
+def _ollama_payload(question: str, stream: bool) -> dict:
+    return {
+        "model": OLLAMA_MODEL,
+        "prompt": _build_prompt(question),
+        "stream": stream,
+        "options": {"num_predict": OLLAMA_NUM_PREDICT}
+    }
+
+
+def _observe_generation(result: dict) -> None:
+    """
+    Records TTFT and tokens/s for a non-streamed answer from Ollama's own timings (in nanoseconds):
+    model load plus prompt evaluation precede the first token.
+    """
+    if result.get("prompt_eval_duration") is not None:
+        llm_time_to_first_token.observe((result.get("load_duration", 0) + result["prompt_eval_duration"]) / 1e9)
+    if result.get("eval_count") and result.get("eval_duration"):
+        llm_tokens_per_second.observe(result["eval_count"] * 1e9 / result["eval_duration"])
 
 
 def query_nutrition_knowledge(question: str) -> str:
     """
-    Uses locally running Ollama LLaMA3 model to answer nutrition-related questions.
+    Uses locally running Ollama LLaMA3 model to answer nutrition-related questions,
+    grounded with facts retrieved from the local nutrition fact index.
     """
+    import requests
+
     try:
         logger.info(f"Querying Ollama for question: {question}")
-        payload = {
-            "model": OLLAMA_MODEL,
-            "prompt": question,
-            "stream": False
-        }
-        response = requests.post(OLLAMA_URL, json=payload)
+        payload = _ollama_payload(question, stream=False)
+        with llm_generations_in_flight.track_inprogress():
+            response = ollama_sync_upstream.request("POST", OLLAMA_URL, json=payload)
         response.raise_for_status()
         result = response.json()
+        _observe_generation(result)
         return result.get("response", "No response from LLaMA3.")
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, CircuitOpenError) as e:
         logger.error(f"Ollama request error: {str(e)}")
         return "Unable to answer the question due to a local LLaMA3 server issue."
     except Exception as e:
         logger.error(f"Unexpected error using Ollama: {str(e)}")
         return "An unexpected error occurred while querying LLaMA3."
 
-def get_nutrition_info(food_item: str) -> str:
+async def _agenerate_answer(question: str, client: str, priority: int) -> str:
+    async with llm_scheduler.slot(client, priority):
+        logger.info(f"Querying Ollama for question: {question}")
+        payload = _ollama_payload(question, stream=False)
+        with llm_generations_in_flight.track_inprogress():
+            response = await ollama_upstream.request("POST", OLLAMA_URL, json=payload)
+    response.raise_for_status()
+    result = response.json()
+    _observe_generation(result)
+    return result.get("response", "No response from LLaMA3.")
+
+
+async def aanswer_nutrition_question(question: str, client: str = "anonymous",
+                                     priority: int = PRIORITY_INTERACTIVE) -> Tuple[str, Optional[str]]:
     """
-    Fetches detailed nutrition information for a specific food item using USDA FoodData Central API.
+    Answers a question from the answer cache when possible, otherwise with Ollama once the LLM scheduler
+    admits it. Returns the answer and the cache tier that served it ("exact", "semantic" or None).
+    Raises LLMOverloadedError when the scheduler turns the question away.
     """
-    if not usda_api_key:
-        return "USDA API key is not configured, cannot fetch nutrition information."
+    cached = await answer_cache.get(question)
+    if cached:
+        logger.info(f"Answer cache {cached[1]} hit for question: {question}")
+        return cached
 
     try:
-        # Search for the food item
-        search_url = f"https://api.nal.usda.gov/fdc/v1/foods/search?query={food_item}&api_key={usda_api_key}"
-        logger.info(f"Searching USDA for: {food_item}")
-        search_response = requests.get(search_url)
-        search_response.raise_for_status()
+        answer = await _agenerate_answer(question, client, priority)
+    except LLMOverloadedError:
+        raise
+    except (httpx.HTTPError, CircuitOpenError) as e:
+        logger.error(f"Ollama request error: {str(e)}")
+        return "Unable to answer the question due to a local LLaMA3 server issue.", None
+    except Exception as e:
+        logger.error(f"Unexpected error using Ollama: {str(e)}")
+        return "An unexpected error occurred while querying LLaMA3.", None
+
+    await answer_cache.set(question, answer)
+    return answer, None
+
+
+async def aquery_nutrition_knowledge(question: str) -> str:
+    """
+    Async variant of query_nutrition_knowledge that does not block the event loop during generation.
+    """
+    answer, _ = await aanswer_nutrition_question(question)
+    return answer
+
+
+async def astream_nutrition_knowledge(question: str, lease: Optional[Lease] = None) -> AsyncIterator[str]:
+    """
+    Streams the Ollama answer token by token as Ollama's NDJSON chunks arrive.
+    Completed answers are stored in the answer cache.
+    Closing the generator closes the upstream connection, which makes Ollama stop generating.
+    `lease` is a generation slot already taken from llm_scheduler; it is released when the stream ends.
+    Without one, the stream waits for a slot first and may raise LLMOverloadedError.
+    """
+    if lease is None:
+        lease = await llm_scheduler.acquire()
+    logger.info(f"Streaming Ollama answer for question: {question}")
+    payload = _ollama_payload(question, stream=True)
+    start = time.perf_counter()
+    first_token_at = None
+    tokens = 0
+    parts = []
+    llm_generations_in_flight.inc()
+    try:
+        async with ollama_upstream.stream("POST", OLLAMA_URL, json=payload) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                token = chunk.get("response", "")
+                if token:
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                        llm_time_to_first_token.observe(first_token_at - start)
+                        logger.info(f"First token after {first_token_at - start:.3f}s for question: {question}")
+                    tokens += 1
+                    parts.append(token)
+                    yield token
+                if chunk.get("done"):
+                    break
+    except (asyncio.CancelledError, GeneratorExit):
+        llm_stream_cancellations.inc()
+        logger.info(f"Client went away after {tokens} tokens, cancelled generation for question: {question}")
+        raise
+    except (httpx.HTTPError, CircuitOpenError) as e:
+        logger.error(f"Ollama request error: {str(e)}")
+        yield "Unable to answer the question due to a local LLaMA3 server issue."
+        return
+    except Exception as e:
+        logger.error(f"Unexpected error using Ollama: {str(e)}")
+        yield "An unexpected error occurred while querying LLaMA3."
+        return
+    finally:
+        llm_generations_in_flight.dec()
+        lease.release()
+
+    if first_token_at is not None and tokens > 1:
+        elapsed = time.perf_counter() - first_token_at
+        if elapsed > 0:
+            llm_tokens_per_second.observe((tokens - 1) / elapsed)
+    if parts:
+        await answer_cache.set(question, "".join(parts))
+
+
+class NutritionLookupError(Exception):
+    """
+    Raised when nutrition data for a food cannot be produced. The message is safe to show to users.
+    """
+
+    def __init__(self, message: str, status_code: int = 502):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+def _trim_food_data(food_data: dict) -> dict:
+    """
+    Keeps only the fields we use from a USDA details response so cache entries stay small.
+    """
+    nutrients = []
+    for nutrient in food_data.get("foodNutrients", []):
+        nutrient_details = nutrient.get("nutrient", {})
+        nutrients.append({
+            "nutrient": {
+                "id": nutrient_details.get("id"),
+                "name": nutrient_details.get("name", "Unknown Nutrient"),
+                "unitName": nutrient_details.get("unitName", ""),
+            },
+            "amount": nutrient.get("amount"),
+        })
+    portions = []
+    for portion in food_data.get("foodPortions", []):
+        portion = normalize_portion(
+            portion.get("measureUnit", {}).get("name"), portion.get("modifier"),
+            portion.get("portionDescription"), portion.get("amount"), portion.get("gramWeight"),
+        )
+        if portion:
+            portions.append(portion)
+    # Branded foods describe a single serving instead of foodPortions
+    if str(food_data.get("servingSizeUnit", "")).lower() in ("g", "grm") and food_data.get("servingSize"):
+        portions.append({"unit": "serving", "gramWeight": float(food_data["servingSize"])})
+    return {
+        "fdcId": food_data.get("fdcId"),
+        "description": food_data.get("description", ""),
+        "foodNutrients": nutrients,
+        "foodPortions": portions,
+    }
+
+
+def _format_nutrition_info(food_item: str, food: FoodNutrients) -> str:
+    with nutrition_stage_duration.time(stage="format"):
+        lines = [f"Nutrition info for {food_item}:\n"]
+        for _, name, unit, amount in food.nutrients():
+            lines.append(f"- {name}: {'N/A' if amount is None else amount} {unit}\n")
+        return "".join(lines)
+
+
+def _build_report(food_item: str, food: FoodNutrients) -> NutritionReport:
+    with nutrition_stage_duration.time(stage="format"):
+        nutrients = [
+            Nutrient(id=nutrient_id, name=name, amount=amount, unit=unit)
+            for nutrient_id, name, unit, amount in food.nutrients()
+        ]
+        return NutritionReport(
+            food=food_item,
+            fdc_id=food.fdc_id,
+            description=food.description,
+            macros=Macros(**food.macros()),
+            nutrients=nutrients,
+        )
+
+
+def _cached_food_data(food_item: str, allow_stale: bool = False) -> Optional[FoodNutrients]:
+    """
+    Returns the cached food for a query, or None when either the query or the food is not cached.
+    """
+    cached_query = nutrition_cache.get(query_key(food_item), allow_stale=allow_stale)
+    if not cached_query:
+        return None
+    return nutrition_cache.get(fdc_key(cached_query["fdcId"]), allow_stale=allow_stale)
+
+
+def load_food_resolver() -> FoodResolver:
+    """
+    Fills the resolver from the offline USDA index, once. With a full FoodData Central import this takes
+    seconds, so the API runs it in a worker thread from its lifespan (serve.py --preload runs it before
+    forking). Lookups never load it themselves; until it is done they skip it.
+    """
+    global _food_resolver_started
+    with _food_resolver_lock:
+        if _food_resolver_started:
+            return food_resolver
+        _food_resolver_started = True
+    try:
+        food_resolver.add_many(local_food_index.iter_foods(include_branded=FOOD_RESOLVER_INCLUDE_BRANDED))
+        logger.info(f"Food resolver loaded {len(food_resolver)} names")
+    except sqlite3.Error as e:
+        logger.error(f"Could not load food names from the local USDA index: {str(e)}")
+    finally:
+        _food_resolver_loaded.set()
+    return food_resolver
+
+
+def resolve_fdc_id(food_item: str) -> Optional[int]:
+    """
+    The FDC ID the resolver is confident about. While the resolver is still loading it has no opinion,
+    since the best match may not be loaded yet; the other tiers answer instead.
+    """
+    if not _food_resolver_loaded.is_set():
+        return None
+    return food_resolver.resolve(food_item, min_score=FOOD_RESOLVER_MIN_SCORE)
+
+
+def suggest_foods(partial_query: str, limit: int = 10) -> list:
+    """
+    Ranked food names for autocomplete, answered from memory (from the names loaded so far during startup).
+    """
+    return food_resolver.candidates(partial_query, limit=limit)
+
+
+def _index_food(food_data: Optional[dict]) -> Optional[FoodNutrients]:
+    return FoodNutrients.from_food_data(food_data) if food_data else None
+
+
+def _local_food_data(food_item: str) -> Optional[FoodNutrients]:
+    """
+    Answers a query without the network: first from the nutrition cache, then through the food-name
+    resolver, then from the offline USDA index. Foods without nutrients do not count.
+    """
+    food = _cached_food_data(food_item)
+    if food:
+        logger.info(f"Nutrition cache hit for {food_item} (FDC ID: {food.fdc_id})")
+        return food
+
+    fdc_id = resolve_fdc_id(food_item)
+    if fdc_id:
+        food = nutrition_cache.get(fdc_key(fdc_id)) or _index_food(local_food_index.get_food(fdc_id))
+        if food:
+            logger.info(f"Food resolver hit for {food_item} (FDC ID: {fdc_id})")
+            return food
+
+    food = _index_food(local_food_index.lookup(food_item, include_branded=FOOD_RESOLVER_INCLUDE_BRANDED))
+    if food:
+        logger.info(f"Local USDA index hit for {food_item} (FDC ID: {food.fdc_id})")
+        return food
+    return None
+
+
+def _store_food_data(food_item: str, food: FoodNutrients) -> None:
+    nutrition_cache.set(query_key(food_item), {"fdcId": food.fdc_id})
+    nutrition_cache.set(fdc_key(food.fdc_id), food)
+    food_resolver.add(food_item, food.fdc_id)
+    food_resolver.add(food.description, food.fdc_id)
 
-        search_data = search_response.json()
-        if not search_data.get("foods"):
-            logger.warning(f"No food items found for '{food_item}' in USDA search.")
-            return f"No detailed nutrition information found for '{food_item}'."
 
-        # Get the first matching food's FDC ID
-        fdc_id = search_data["foods"][0].get("fdcId")
+def _first_fdc_id(food_item: str, search_data: dict) -> int:
+    if not search_data.get("foods"):
+        logger.warning(f"No food items found for '{food_item}' in USDA search.")
+        raise NutritionLookupError(f"No detailed nutrition information found for '{food_item}'.", 404)
+
+    # Get the first matching food's FDC ID
+    fdc_id = search_data["foods"][0].get("fdcId")
+    if not fdc_id:
+        logger.warning(f"FDC ID not found for the first food item in search for '{food_item}'.")
+        raise NutritionLookupError(f"Could not retrieve FDC ID for '{food_item}'.", 404)
+    return fdc_id
+
+
+def _cached_fdc_food_data(food_item: str, fdc_id: int) -> Optional[FoodNutrients]:
+    """
+    Another query may already have resolved to this food; reuse its details if so.
+    """
+    food_data = nutrition_cache.get(fdc_key(fdc_id))
+    if food_data:
+        nutrition_cache.set(query_key(food_item), {"fdcId": fdc_id})
+        food_resolver.add(food_item, fdc_id)
+        logger.info(f"Nutrition cache hit for FDC ID: {fdc_id} ({food_item})")
+    return food_data
+
+
+def store_details(food_item: str, fdc_id: int, details: dict) -> FoodNutrients:
+    """
+    Trims USDA details for a food and caches them under both the query and the FDC ID.
+    Raises NutritionLookupError when the details carry no nutrients.
+    """
+    food_data = _trim_food_data(details)
+    food_data["fdcId"] = fdc_id
+    food = FoodNutrients.from_food_data(food_data)
+    if not food:
+        logger.info(f"No nutrient data found for FDC ID: {fdc_id} ({food_item})")
+        raise NutritionLookupError(f"No detailed nutrient data available for {food_item}.", 404)
+
+    _store_food_data(food_item, food)
+    logger.info(f"Successfully fetched nutrition data for {food_item}")
+    return food
+
+
+def _usda_error(food_item: str, e: BaseException) -> NutritionLookupError:
+    """
+    Logs an error raised while talking to USDA and converts it into a user-facing NutritionLookupError.
+    """
+    import requests
+
+    if isinstance(e, NutritionLookupError):
+        return e
+    if isinstance(e, CircuitOpenError):
+        logger.warning(f"Skipping USDA call for '{food_item}': {str(e)}")
+        return NutritionLookupError(
+            f"Nutrition data for '{food_item}' is temporarily unavailable, please try again later.", 503
+        )
+    if isinstance(e, (requests.exceptions.RequestException, httpx.HTTPError)):
+        logger.error(f"Network or HTTP error fetching USDA data for '{food_item}': {str(e)}")
+        return NutritionLookupError(f"Unable to fetch nutrition info for '{food_item}' due to a network error.")
+    if isinstance(e, ValueError):
+        logger.error(f"JSON decoding error from USDA API for '{food_item}': {str(e)}")
+        return NutritionLookupError(f"Unable to process nutrition info for '{food_item}' due to data format issues.")
+    logger.error(f"An unexpected error occurred fetching USDA data for '{food_item}': {str(e)}")
+    return NutritionLookupError("Unable to fetch nutrition info due to an unexpected error.", 500)
+
+
+def _stale_food_data_or_error(food_item: str, e: BaseException):
+    """
+    While USDA is failing, serves expired cache entries rather than an error. Returns the stale food
+    data, or the NutritionLookupError to raise when there is nothing to serve.
+    """
+    error = _usda_error(food_item, e)
+    if error.status_code in (502, 503):
+        food_data = _cached_food_data(food_item, allow_stale=True)
+        if food_data:
+            logger.warning(f"Serving stale nutrition data for {food_item}: {error.message}")
+            return food_data
+    return error
+
+
+def _raise_or_stale(food_item: str, e: BaseException) -> FoodNutrients:
+    outcome = _stale_food_data_or_error(food_item, e)
+    if isinstance(outcome, NutritionLookupError):
+        raise outcome
+    return outcome
+
+
+def _missing_api_key_error() -> NutritionLookupError:
+    return NutritionLookupError("USDA API key is not configured, cannot fetch nutrition information.", 503)
+
+
+def _fetch_food_data(food_item: str) -> FoodNutrients:
+    """
+    Resolves a food to its nutrient record: nutrition cache, then offline index, then the USDA API.
+    """
+    with nutrition_stage_duration.time(stage="local"):
+        food_data = _local_food_data(food_item)
+    if food_data:
+        return food_data
+
+    if not usda_api_key:
+        raise _missing_api_key_error()
+
+    try:
+        fdc_id = resolve_fdc_id(food_item)
         if not fdc_id:
-            logger.warning(f"FDC ID not found for the first food item in search for '{food_item}'.")
-            return f"Could not retrieve FDC ID for '{food_item}'."
+            # Search for the food item
+            logger.info(f"Searching USDA for: {food_item}")
+            with nutrition_stage_duration.time(stage="search"):
+                search_response = usda_sync_upstream.request(
+                    "GET", f"{USDA_API_URL}/foods/search", params={"query": food_item, "api_key": usda_api_key}
+                )
+                search_response.raise_for_status()
+                fdc_id = _first_fdc_id(food_item, search_response.json())
+
+        food_data = _cached_fdc_food_data(food_item, fdc_id)
+        if food_data:
+            return food_data
 
         # Fetch detailed nutrition info
-        details_url = f"https://api.nal.usda.gov/fdc/v1/food/{fdc_id}?api_key={usda_api_key}"
         logger.info(f"Fetching detailed nutrition info for FDC ID: {fdc_id} ({food_item})")
-        details_response = requests.get(details_url)
-        details_response.raise_for_status()
-
-        food_data = details_response.json()
-        nutrients = food_data.get("foodNutrients", [])
-
-        if not nutrients:
-            logger.info(f"No nutrient data found for FDC ID: {fdc_id} ({food_item})")
-            return f"No detailed nutrient data available for {food_item}."
-
-        nutrition_info = f"Nutrition info for {food_item}:\n"
-        for nutrient in nutrients:
-            nutrient_details = nutrient.get("nutrient", {})
-            name = nutrient_details.get("name", "Unknown Nutrient")
-            amount = nutrient.get("amount", "N/A")
-            unit = nutrient_details.get("unitName", "")
-            nutrition_info += f"- {name}: {amount} {unit}\n"
-
-        logger.info(f"Successfully fetched and formatted nutrition data for {food_item}")
-        return nutrition_info
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Network or HTTP error fetching USDA data for '{food_item}': {str(e)}")
-        return f"Unable to fetch nutrition info for '{food_item}' due to a network error."
-    except ValueError as e:
-        logger.error(f"JSON decoding error from USDA API for '{food_item}': {str(e)}")
-        return f"Unable to process nutrition info for '{food_item}' due to data format issues."
+        with nutrition_stage_duration.time(stage="details"):
+            details_response = usda_sync_upstream.request(
+                "GET", f"{USDA_API_URL}/food/{fdc_id}", params={"api_key": usda_api_key}
+            )
+            details_response.raise_for_status()
+            details = details_response.json()
+        return store_details(food_item, fdc_id, details)
     except Exception as e:
-        logger.error(f"An unexpected error occurred fetching USDA data for '{food_item}': {str(e)}")
-        return "Unable to fetch nutrition info due to an unexpected error."
+        return _raise_or_stale(food_item, e)
+
+
+async def asearch_fdc_id(food_item: str) -> int:
+    """
+    Returns the FDC ID for a food: from the local resolver when it is confident, otherwise from the
+    first USDA search result. Identical in-flight searches share one call.
+    """
+    fdc_id = resolve_fdc_id(food_item)
+    if fdc_id:
+        return fdc_id
+
+    async def search() -> int:
+        logger.info(f"Searching USDA for: {food_item}")
+        with nutrition_stage_duration.time(stage="search"):
+            search_response = await usda_upstream.request(
+                "GET", f"{USDA_API_URL}/foods/search", params={"query": food_item, "api_key": usda_api_key}
+            )
+            search_response.raise_for_status()
+            return _first_fdc_id(food_item, search_response.json())
+
+    return await usda_flight.do(f"search:{normalize_query(food_item)}", search)
+
+
+async def afetch_details_many(fdc_ids: list) -> dict:
+    """
+    Fetches USDA details for many foods through the multi-ID /foods endpoint, chunks in parallel.
+    Maps each FDC ID to its details, or to the exception raised for its chunk.
+    """
+    async def fetch_chunk(chunk: list) -> list:
+        logger.info(f"Fetching detailed nutrition info for FDC IDs: {chunk}")
+        with nutrition_stage_duration.time(stage="details"):
+            response = await usda_upstream.request(
+                "POST", f"{USDA_API_URL}/foods", params={"api_key": usda_api_key}, json={"fdcIds": chunk}
+            )
+            response.raise_for_status()
+            return response.json()
+
+    chunks = [fdc_ids[i:i + USDA_MULTI_FOOD_BATCH_SIZE] for i in range(0, len(fdc_ids), USDA_MULTI_FOOD_BATCH_SIZE)]
+    outcomes = await asyncio.gather(*(fetch_chunk(chunk) for chunk in chunks), return_exceptions=True)
+
+    details = {}
+    for chunk, outcome in zip(chunks, outcomes):
+        if isinstance(outcome, BaseException):
+            details.update(dict.fromkeys(chunk, outcome))
+        else:
+            details.update((food.get("fdcId"), food) for food in outcome)
+    return details
+
+
+async def _afetch_remote_food_data(food_item: str) -> FoodNutrients:
+    if not usda_api_key:
+        raise _missing_api_key_error()
+
+    try:
+        fdc_id = await asearch_fdc_id(food_item)
+        food_data = _cached_fdc_food_data(food_item, fdc_id)
+        if food_data:
+            return food_data
+
+        logger.info(f"Fetching detailed nutrition info for FDC ID: {fdc_id} ({food_item})")
+        with nutrition_stage_duration.time(stage="details"):
+            details_response = await usda_upstream.request(
+                "GET", f"{USDA_API_URL}/food/{fdc_id}", params={"api_key": usda_api_key}
+            )
+            details_response.raise_for_status()
+            details = details_response.json()
+        return store_details(food_item, fdc_id, details)
+    except Exception as e:
+        return _raise_or_stale(food_item, e)
+
+
+async def _afetch_food_data(food_item: str) -> FoodNutrients:
+    """
+    Async variant of _fetch_food_data built on the pooled USDA client.
+    Concurrent lookups of the same food make a single upstream call.
+    """
+    food_lookup_counts[normalize_query(food_item)] += 1
+    with nutrition_stage_duration.time(stage="local"):
+        food_data = _local_food_data(food_item)
+    if food_data:
+        return food_data
+    return await usda_flight.do(query_key(food_item), lambda: _afetch_remote_food_data(food_item))
+
+
+async def _afetch_many_food_data(food_items: list) -> dict:
+    """
+    Resolves many distinct foods at once: local lookups first, then concurrent USDA searches and
+    multi-ID detail fetches. Maps each normalized query to its FoodNutrients or NutritionLookupError.
+    """
+    results = {}
+    pending = []
+    food_lookup_counts.update(map(normalize_query, food_items))
+    for food_item in food_items:
+        with nutrition_stage_duration.time(stage="local"):
+            food_data = _local_food_data(food_item)
+        if food_data:
+            results[normalize_query(food_item)] = food_data
+        else:
+            pending.append(food_item)
+    if not pending:
+        return results
+    if not usda_api_key:
+        results.update(dict.fromkeys(map(normalize_query, pending), _missing_api_key_error()))
+        return results
+
+    search_outcomes = await asyncio.gather(*(asearch_fdc_id(food) for food in pending), return_exceptions=True)
+    to_fetch = {}
+    for food_item, outcome in zip(pending, search_outcomes):
+        if isinstance(outcome, BaseException):
+            results[normalize_query(food_item)] = _stale_food_data_or_error(food_item, outcome)
+            continue
+        food_data = _cached_fdc_food_data(food_item, outcome)
+        if food_data:
+            results[normalize_query(food_item)] = food_data
+        else:
+            to_fetch.setdefault(outcome, []).append(food_item)
+
+    details = await afetch_details_many(list(to_fetch)) if to_fetch else {}
+    for fdc_id, queries in to_fetch.items():
+        outcome = details.get(fdc_id)
+        for food_item in queries:
+            try:
+                if outcome is None:
+                    raise NutritionLookupError(f"No detailed nutrition information found for '{food_item}'.", 404)
+                if isinstance(outcome, BaseException):
+                    raise outcome
+                results[normalize_query(food_item)] = store_details(food_item, fdc_id, outcome)
+            except Exception as e:
+                results[normalize_query(food_item)] = _stale_food_data_or_error(food_item, e)
+    return results
+
+
+def get_nutrition_info(food_item: str) -> str:
+    """
+    Fetches detailed nutrition information for a specific food item using USDA FoodData Central API.
+    The nutrition cache and the offline USDA index are consulted first; the API is only called on a miss.
+    """
+    try:
+        food_data = _fetch_food_data(food_item)
+    except NutritionLookupError as e:
+        return e.message
+    return _format_nutrition_info(food_item, food_data)
+
+
+async def aget_nutrition_info(food_item: str) -> str:
+    """
+    Async variant of get_nutrition_info built on the pooled USDA client.
+    """
+    try:
+        food_data = await _afetch_food_data(food_item)
+    except NutritionLookupError as e:
+        return e.message
+    return _format_nutrition_info(food_item, food_data)
+
+
+def get_nutrition_report(food_item: str) -> NutritionReport:
+    """
+    Returns structured nutrition data for a food. Raises NutritionLookupError when it cannot be produced.
+    """
+    return _build_report(food_item, _fetch_food_data(food_item))
+
+
+async def aget_nutrition_report(food_item: str) -> NutritionReport:
+    """
+    Async variant of get_nutrition_report.
+    """
+    return _build_report(food_item, await _afetch_food_data(food_item))
+
+
+def _unique_queries(food_items: list) -> list:
+    unique = {}
+    for food_item in food_items:
+        unique.setdefault(normalize_query(food_item), food_item)
+    return list(unique.values())
+
+
+async def aget_nutrition_reports(food_items: list) -> list:
+    """
+    Structured nutrition data for many foods. Duplicates are looked up once and results come back
+    in input order as (report, None) or (None, NutritionLookupError) pairs.
+    """
+    resolved = await _afetch_many_food_data(_unique_queries(food_items))
+
+    results = []
+    for food_item in food_items:
+        outcome = resolved[normalize_query(food_item)]
+        if isinstance(outcome, NutritionLookupError):
+            results.append((None, outcome))
+        else:
+            results.append((_build_report(food_item, outcome), None))
+    return results
+
+
+async def aanalyze_meal(items: list) -> MealAnalyzeResponse:
+    """
+    Resolves every food of a meal or recipe, converts quantities to grams with USDA portion data and
+    computes per-item and total macros in one vectorized pass. Items that fail carry their own error.
+    A macro is null when a food does not report it, and so is its total.
+    """
+    resolved = await _afetch_many_food_data(_unique_queries([item.food for item in items]))
+
+    # Foods stay in the nutrition cache; the matrix only lives for this request
+    meal_engine = MealEngine(capacity=len(items))
+    results, fdc_ids, grams = [], [], []
+    for item in items:
+        result = MealItemResult(food=item.food, quantity=item.quantity, unit=item.unit)
+        outcome = resolved[normalize_query(item.food)]
+        if isinstance(outcome, NutritionLookupError):
+            result.status_code, result.error = outcome.status_code, outcome.message
+        else:
+            meal_engine.add_food(outcome)
+            try:
+                result.grams = meal_engine.grams_for(outcome.fdc_id, item.quantity, item.unit)
+                result.fdc_id = outcome.fdc_id
+                fdc_ids.append(result.fdc_id)
+                grams.append(result.grams)
+            except PortionError as e:
+                result.status_code, result.error = 422, str(e)
+        results.append(result)
+
+    per_item = meal_engine.item_nutrients(fdc_ids, grams)
+    valid = (result for result in results if result.fdc_id is not None)
+    for result, row in zip(valid, per_item):
+        result.macros = _meal_macros(row)
+    return MealAnalyzeResponse(items=results, totals=_meal_macros(per_item.sum(axis=0)))
+
+
+def _meal_macros(row) -> Macros:
+    """
+    A row of MEAL_NUTRIENTS amounts as Macros; NaN (not reported) becomes null.
+    """
+    return Macros(**{
+        field: None if math.isnan(value) else round(value, 3) for field, value in zip(MEAL_NUTRIENTS, row.tolist())
+    })
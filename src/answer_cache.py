@@ -0,0 +1,142 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from src.embeddings import tokenize
+from src.metrics import Counter
+
+# Words that do not change what a nutrition question is asking for ("and"/"or" do: "iron and zinc")
+STOPWORDS = frozenset(
+    "a an are can could do does for give how i in is it me of on please some tell "
+    "that the there to what whats which with would you".split()
+)
+
+answer_cache_lookups = Counter("answer_cache_lookups_total", "Answer cache lookups by result (exact, semantic, miss)")
+
+
+def _singular(token: str) -> str:
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def _exact_tokens(key: str) -> frozenset:
+    """
+    Tokens of a normalized question that embeddings barely register but that change the answer: numbers
+    ("30 year old" vs "60 year old") and one- or two-letter words ("vitamin c" vs "vitamin d").
+    """
+    return frozenset(token for token in key.split() if len(token) <= 2 or any(char.isdigit() for char in token))
+
+
+def normalize_question(question: str) -> str:
+    """
+    Lowercases, drops punctuation and filler words and folds simple plurals, so
+    "Which fruits are high in potassium?" and "fruit high in potassium" share a key.
+    """
+    return " ".join(_singular(token) for token in tokenize(question) if token not in STOPWORDS)
+
+
+class AnswerCache:
+    """
+    Bounded LRU of LLM answers keyed by normalized question text, with an optional semantic tier:
+    when an embedding function is given, a miss on the exact key falls back to the most similar
+    cached question whose cosine similarity clears the threshold and whose numbers and short words
+    (vitamin letters, ages, amounts) are the same.
+    """
+
+    def __init__(self, ttl_seconds: float, capacity: int, similarity_threshold: float,
+                 embed: Optional[Callable[[str], Awaitable[Optional[np.ndarray]]]] = None):
+        self.ttl_seconds = ttl_seconds
+        self.capacity = capacity
+        self.similarity_threshold = similarity_threshold
+        self.embed = embed
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, answer, slot)
+        self._vectors: Optional[np.ndarray] = None  # capacity x dim, one row per slot
+        self._slot_keys: list = [None] * capacity
+        self._free_slots = list(range(capacity - 1, -1, -1))
+        self._lock = threading.Lock()
+
+    async def _embed(self, key: str) -> Optional[np.ndarray]:
+        if self.embed is None or not key:
+            return None
+        try:
+            return await self.embed(key)
+        except Exception as e:
+            logger.error(f"Answer cache embedding failed: {str(e)}")
+            return None
+
+    async def get(self, question: str) -> Optional[Tuple[str, str]]:
+        """
+        Returns (answer, tier) where tier is "exact" or "semantic", or None on a miss.
+        """
+        key = normalize_question(question)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                answer_cache_lookups.inc(result="exact")
+                return entry[1], "exact"
+
+        vector = await self._embed(key)
+        if vector is not None:
+            with self._lock:
+                match = self._nearest(key, vector, now)
+                if match is not None:
+                    self._entries.move_to_end(match)
+                    answer_cache_lookups.inc(result="semantic")
+                    return self._entries[match][1], "semantic"
+
+        answer_cache_lookups.inc(result="miss")
+        return None
+
+    def _nearest(self, key: str, vector: np.ndarray, now: float) -> Optional[str]:
+        if self._vectors is None or self._vectors.shape[1] != vector.shape[0]:
+            return None
+        exact_tokens = _exact_tokens(key)
+        similarities = self._vectors @ vector
+        for slot in np.argsort(similarities)[::-1]:
+            if similarities[slot] < self.similarity_threshold:
+                return None
+            candidate = self._slot_keys[slot]
+            if (candidate is not None and self._entries[candidate][0] > now
+                    and _exact_tokens(candidate) == exact_tokens):
+                return candidate
+        return None
+
+    async def set(self, question: str, answer: str) -> None:
+        key = normalize_question(question)
+        vector = await self._embed(key)
+        with self._lock:
+            if key in self._entries:
+                self._release(key)
+            while len(self._entries) >= self.capacity:
+                self._release(next(iter(self._entries)))
+
+            slot = None
+            if vector is not None:
+                if self._vectors is None or self._vectors.shape[1] != vector.shape[0]:
+                    self._vectors = np.zeros((self.capacity, vector.shape[0]), dtype=np.float32)
+                slot = self._free_slots.pop()
+                self._vectors[slot] = vector
+                self._slot_keys[slot] = key
+            self._entries[key] = (time.time() + self.ttl_seconds, answer, slot)
+
+    def _release(self, key: str) -> None:
+        _, _, slot = self._entries.pop(key)
+        if slot is not None:
+            self._vectors[slot] = 0.0
+            self._slot_keys[slot] = None
+            self._free_slots.append(slot)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "exact_hits": answer_cache_lookups.value(result="exact"),
+            "semantic_hits": answer_cache_lookups.value(result="semantic"),
+            "misses": answer_cache_lookups.value(result="miss"),
+        }
@@ -0,0 +1,297 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Iterable, Iterator, Optional, Tuple
+
+from loguru import logger
+
+import src.settings  # noqa: F401  (loads .env before the settings below are read)
+from src.nutrients import FoodNutrients
+
+# Shared-cache tuning for several worker processes on one SQLite file
+CACHE_MMAP_BYTES = int(os.getenv("NUTRITION_CACHE_MMAP_BYTES", str(256 * 1024 * 1024)))
+# Requests wait only briefly for another worker's write: the cache is skipped rather than stalling the event loop
+CACHE_BUSY_TIMEOUT_MS = int(os.getenv("NUTRITION_CACHE_BUSY_TIMEOUT_MS", "50"))
+# Bulk imports run offline and can wait for their turn
+CACHE_BULK_BUSY_TIMEOUT_MS = int(os.getenv("NUTRITION_CACHE_BULK_BUSY_TIMEOUT_MS", "5000"))
+# A disk hit refreshes its LRU timestamp at most this often, so reads rarely need the write lock
+ACCESS_TIME_RESOLUTION = 60.0
+
+
+def normalize_query(text: str) -> str:
+    """
+    Normalizes a free-text food query so that "Banana", " banana " and "BANANA" share a cache entry.
+    """
+    return " ".join(text.lower().split())
+
+
+def query_key(food_item: str) -> str:
+    return f"query:{normalize_query(food_item)}"
+
+
+def fdc_key(fdc_id: int) -> str:
+    return f"fdc:{fdc_id}"
+
+
+def _encode(value: Any) -> str:
+    # Records such as FoodNutrients serialize themselves
+    return json.dumps(value, separators=(",", ":"), default=lambda record: record.to_json())
+
+
+def _decode(key: str, text: str) -> Any:
+    value = json.loads(text)
+    return FoodNutrients.from_json(value) if key.startswith("fdc:") else value
+
+
+class NutritionCache:
+    """
+    Two-tier cache for USDA lookups: an in-process LRU for hot foods backed by a SQLite store
+    that survives restarts. Every entry carries its own expiry time. Foods ("fdc:" keys) are held in
+    memory as FoodNutrients records and stored on disk in their compact JSON form.
+
+    The SQLite store is the cache shared by all worker processes: it runs in WAL mode so readers never
+    block each other or the writer, and is memory-mapped so hot pages are read from the OS page cache
+    that every worker shares instead of being copied into per-process buffers.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float, max_memory_entries: int, max_disk_entries: int):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self._memory: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._conn_pid: Optional[int] = None
+        self._writes_since_evict = 0
+        self.hits = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        # A connection inherited from the parent over fork() (gunicorn --preload) must not be reused
+        if self._conn is None or self._conn_pid != os.getpid():
+            if self.path != ":memory:":
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=CACHE_BUSY_TIMEOUT_MS / 1000)
+            self._conn_pid = os.getpid()
+            if self.path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode = WAL")
+                self._conn.execute("PRAGMA synchronous = NORMAL")
+                self._conn.execute(f"PRAGMA mmap_size = {CACHE_MMAP_BYTES}")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)")
+            self._conn.commit()
+        return self._conn
+
+    def get(self, key: str, allow_stale: bool = False) -> Optional[Any]:
+        """
+        Returns the cached value, or None on a miss. With allow_stale, expired entries that are still
+        on disk are returned too; they are not counted as hits and are not promoted to memory.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    self.memory_hits += 1
+                    return value
+                del self._memory[key]
+
+            try:
+                conn = self._connection()
+                row = conn.execute(
+                    "SELECT value, expires_at, accessed_at FROM entries WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    self.misses += 1
+                    return None
+                if row[1] <= now:
+                    if allow_stale:
+                        return _decode(key, row[0])
+                    self.misses += 1
+                    return None
+                if now - row[2] > ACCESS_TIME_RESOLUTION:
+                    self._touch(conn, key, now)
+                value = _decode(key, row[0])
+            except (sqlite3.Error, ValueError, KeyError, TypeError) as e:
+                logger.error(f"Nutrition cache read error for '{key}': {str(e)}")
+                self.misses += 1
+                return None
+
+            self._remember(key, row[1], value)
+            self.hits += 1
+            self.disk_hits += 1
+            return value
+
+    def _touch(self, conn: sqlite3.Connection, key: str, now: float) -> None:
+        """
+        Refreshes an entry's LRU timestamp. Only eviction order depends on it, so when another worker
+        holds the write lock the refresh is skipped instead of turning the hit into a miss.
+        """
+        try:
+            conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            conn.commit()
+        except sqlite3.OperationalError:
+            self._rollback()
+
+    def peek(self, key: str) -> Optional[Any]:
+        """
+        Returns a cached value, expired or not, without counting a lookup, refreshing its LRU position or
+        loading it into memory, so background checks do not skew hit ratios or eviction order.
+        """
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                return entry[1]
+            try:
+                row = self._connection().execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+                return None if row is None else _decode(key, row[0])
+            except (sqlite3.Error, ValueError, KeyError, TypeError) as e:
+                logger.error(f"Nutrition cache read error for '{key}': {str(e)}")
+                return None
+
+    def ttl_remaining(self, key: str) -> Optional[float]:
+        """
+        Seconds until an entry expires (negative once expired), or None when it is not cached at all.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                return entry[0] - now
+            try:
+                row = self._connection().execute("SELECT expires_at FROM entries WHERE key = ?", (key,)).fetchone()
+            except sqlite3.Error as e:
+                logger.error(f"Nutrition cache read error for '{key}': {str(e)}")
+                return None
+        return None if row is None else row[0] - now
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        now = time.time()
+        expires_at = now + (self.ttl_seconds if ttl_seconds is None else ttl_seconds)
+        with self._lock:
+            self._remember(key, expires_at, value)
+            try:
+                conn = self._connection()
+                conn.execute(
+                    "INSERT OR REPLACE INTO entries (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, _encode(value), expires_at, now),
+                )
+                conn.commit()
+                self._writes_since_evict += 1
+                if self._writes_since_evict >= 64:
+                    self._evict_disk(now)
+            except sqlite3.Error as e:
+                # Typically another worker holding the write lock; the entry stays cached in memory
+                self._rollback()
+                logger.error(f"Nutrition cache write error for '{key}': {str(e)}")
+
+    def set_many(self, items: Iterable[Tuple[str, Any]], ttl_seconds: Optional[float] = None) -> int:
+        """
+        Stores many entries on disk in one transaction, for bulk imports. They are not loaded into the
+        in-process LRU. Returns the number of entries written.
+        """
+        now = time.time()
+        expires_at = now + (self.ttl_seconds if ttl_seconds is None else ttl_seconds)
+        rows = [(key, _encode(value), expires_at, now) for key, value in items]
+        with self._lock:
+            for key, _, _, _ in rows:
+                self._memory.pop(key, None)
+            try:
+                conn = self._connection()
+                conn.execute(f"PRAGMA busy_timeout = {CACHE_BULK_BUSY_TIMEOUT_MS}")
+                try:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO entries (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)", rows
+                    )
+                    conn.commit()
+                    self._evict_disk(now)
+                finally:
+                    conn.execute(f"PRAGMA busy_timeout = {CACHE_BUSY_TIMEOUT_MS}")
+            except sqlite3.Error as e:
+                self._rollback()
+                logger.error(f"Nutrition cache bulk write error: {str(e)}")
+                return 0
+        return len(rows)
+
+    def iter_entries(self, prefix: str = "") -> Iterator[Tuple[str, Any, float]]:
+        """
+        Yields (key, value, expires_at) for every entry on disk whose key starts with prefix, expired ones
+        included, in key order. Reads through its own connection so a long export does not hold the lock.
+        """
+        if self.path == ":memory:" or not os.path.exists(self.path):
+            return
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+        try:
+            rows = conn.execute(
+                "SELECT key, value, expires_at FROM entries WHERE key >= ? AND key < ? ORDER BY key",
+                (prefix, prefix + "\U0010ffff"),
+            )
+            for key, value, expires_at in rows:
+                yield key, _decode(key, value), expires_at
+        finally:
+            conn.close()
+
+    def _rollback(self) -> None:
+        # A failed write leaves the implicit transaction open, which would pin an old snapshot of the file
+        if self._conn is not None and self._conn.in_transaction:
+            try:
+                self._conn.rollback()
+            except sqlite3.Error:
+                pass
+
+    def _remember(self, key: str, expires_at: float, value: Any) -> None:
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def _evict_disk(self, now: float) -> None:
+        """
+        Trims the disk store to its size bound, dropping expired entries first, then least recently used.
+        Expired entries are otherwise kept so they can be served stale while USDA is unreachable.
+        """
+        conn = self._connection()
+        (count,) = conn.execute("SELECT COUNT(*) FROM entries").fetchone()
+        overflow = count - self.max_disk_entries
+        if overflow > 0:
+            conn.execute(
+                "DELETE FROM entries WHERE key IN "
+                "(SELECT key FROM entries ORDER BY expires_at > ?, accessed_at LIMIT ?)",
+                (now, overflow),
+            )
+            self.evictions += overflow
+        conn.commit()
+        self._writes_since_evict = 0
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._connection().execute("DELETE FROM entries")
+            self._connection().commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "memory_entries": len(self._memory),
+            }
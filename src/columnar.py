@@ -0,0 +1,291 @@
+"""
+Columnar bulk export and import of nutrition data as Parquet or Arrow IPC streams.
+
+Every food is one row: its FDC ID, description, data type, the queries that resolve to it, its full
+nutrient vector and portions as nested lists, and the canonical macros as flat columns for analytics.
+Rows are produced and written in record batches, so memory stays flat however many foods are exported:
+
+    python -m src.columnar export foods.parquet --source cache
+    python -m src.columnar export foods.arrow --source index --include-branded
+    python -m src.columnar import foods.parquet --into cache
+    python -m src.columnar import foods.parquet --into index
+
+The same files are served by GET /export/foods. Importing into the cache makes the foods (and their
+queries) cache hits; importing into the offline USDA index is meant for tables too large for the cache.
+"""
+import argparse
+import io
+import os
+import sys
+from typing import Iterable, Iterator, Optional, Tuple
+
+import src.settings  # noqa: F401  (loads .env before the settings below are read)
+from src.cache import NutritionCache, fdc_key, query_key
+from src.nutrients import MACRO_NUTRIENT_IDS, FoodNutrients, extract_macros
+from src.usda_index import IndexImport, LocalFoodIndex
+
+FORMATS = ("parquet", "arrow")
+MEDIA_TYPES = {"parquet": "application/vnd.apache.parquet", "arrow": "application/vnd.apache.arrow.stream"}
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "5000"))
+
+
+def food_schema():
+    import pyarrow as pa
+
+    return pa.schema(
+        [
+            ("fdc_id", pa.int64()),
+            ("description", pa.string()),
+            ("data_type", pa.string()),
+            ("queries", pa.list_(pa.string())),
+            ("nutrients", pa.list_(pa.struct([
+                ("id", pa.int32()), ("name", pa.string()), ("unit", pa.string()), ("amount", pa.float64()),
+            ]))),
+            ("portions", pa.list_(pa.struct([("unit", pa.string()), ("gram_weight", pa.float64())]))),
+        ]
+        + [(field, pa.float64()) for field in MACRO_NUTRIENT_IDS]
+    )
+
+
+def _food_row(food_data: dict, data_type: Optional[str], queries: list) -> dict:
+    row = {
+        "fdc_id": int(food_data["fdcId"]),
+        "description": food_data.get("description", ""),
+        "data_type": data_type,
+        "queries": queries,
+        "nutrients": [
+            {"id": food_nutrient["nutrient"].get("id"), "name": food_nutrient["nutrient"].get("name"),
+             "unit": food_nutrient["nutrient"].get("unitName"), "amount": food_nutrient.get("amount")}
+            for food_nutrient in food_data.get("foodNutrients", [])
+        ],
+        "portions": [
+            {"unit": portion["unit"], "gram_weight": portion["gramWeight"]} for portion in food_data.get("foodPortions", [])
+        ],
+    }
+    row.update(extract_macros(food_data.get("foodNutrients", [])))
+    return row
+
+
+def _food_data(row: dict) -> dict:
+    """
+    Turns an exported row back into trimmed USDA details, the shape the cache and the index serve.
+    """
+    return {
+        "fdcId": row["fdc_id"],
+        "description": row["description"] or "",
+        "foodNutrients": [
+            {"nutrient": {"id": nutrient["id"], "name": nutrient["name"], "unitName": nutrient["unit"] or ""},
+             "amount": nutrient["amount"]}
+            for nutrient in row["nutrients"] or []
+        ],
+        "foodPortions": [
+            {"unit": portion["unit"], "gramWeight": portion["gram_weight"]} for portion in row["portions"] or []
+        ],
+    }
+
+
+def cache_foods(cache: NutritionCache) -> Iterator[Tuple[dict, Optional[str], list]]:
+    """
+    Yields (food, data_type, queries) for every food in the nutrition cache, expired entries included.
+    The query -> FDC ID mappings are read first; they are small next to the foods themselves.
+    """
+    queries = {}
+    for key, mapping, _ in cache.iter_entries("query:"):
+        queries.setdefault(mapping["fdcId"], []).append(key[len("query:"):])
+    for _, food, _ in cache.iter_entries("fdc:"):
+        yield food.to_food_data(), None, queries.get(food.fdc_id, [])
+
+
+def index_foods(index: LocalFoodIndex, include_branded: bool = False) -> Iterator[Tuple[dict, Optional[str], list]]:
+    for food_data, data_type in index.iter_food_details(include_branded=include_branded):
+        yield food_data, data_type, []
+
+
+def iter_record_batches(foods: Iterable[Tuple[dict, Optional[str], list]], batch_size: int = EXPORT_BATCH_SIZE):
+    """
+    Groups (food, data_type, queries) tuples into Arrow record batches of food_schema().
+    """
+    import pyarrow as pa
+
+    schema = food_schema()
+    rows = []
+    for food_data, data_type, queries in foods:
+        rows.append(_food_row(food_data, data_type, queries))
+        if len(rows) >= batch_size:
+            yield pa.RecordBatch.from_pylist(rows, schema=schema)
+            rows = []
+    if rows:
+        yield pa.RecordBatch.from_pylist(rows, schema=schema)
+
+
+def _writer(sink, fmt: str):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if fmt == "parquet":
+        return pq.ParquetWriter(sink, food_schema(), compression="zstd")
+    return pa.ipc.new_stream(sink, food_schema())
+
+
+def write_foods(batches: Iterable, path: str, fmt: str) -> int:
+    """
+    Writes record batches to a Parquet file (one row group per batch) or an Arrow IPC stream.
+    Returns the number of foods written.
+    """
+    count = 0
+    with _writer(path, fmt) as writer:
+        for batch in batches:
+            writer.write_batch(batch)
+            count += batch.num_rows
+    return count
+
+
+class _ChunkSink(io.RawIOBase):
+    """
+    Write-only file that collects what the Arrow writers emit so it can be streamed out in pieces.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+
+def stream_foods(batches: Iterable, fmt: str) -> Iterator[bytes]:
+    """
+    Encodes record batches as a Parquet file or Arrow IPC stream, yielding bytes after every batch.
+    """
+    sink = _ChunkSink()
+    writer = _writer(sink, fmt)
+    try:
+        for batch in batches:
+            writer.write_batch(batch)
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def read_batches(path: str, batch_size: int = EXPORT_BATCH_SIZE):
+    """
+    Reads record batches from a Parquet file or an Arrow IPC file or stream.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    with open(path, "rb") as f:
+        is_parquet = f.read(4) == b"PAR1"
+    if is_parquet:
+        yield from pq.ParquetFile(path).iter_batches(batch_size=batch_size)
+        return
+    with pa.memory_map(path) as source:
+        try:
+            reader = pa.ipc.open_file(source)
+        except pa.ArrowInvalid:
+            source.seek(0)
+            yield from pa.ipc.open_stream(source)
+            return
+        for i in range(reader.num_record_batches):
+            yield reader.get_batch(i)
+
+
+def import_into_cache(path: str, cache: NutritionCache, ttl_seconds: Optional[float] = None) -> int:
+    """
+    Stores every food of an exported table in the nutrition cache, with its queries. Returns the food count.
+    """
+    count = 0
+    for batch in read_batches(path):
+        entries = []
+        for row in batch.to_pylist():
+            food = FoodNutrients.from_food_data(_food_data(row))
+            entries.append((fdc_key(food.fdc_id), food))
+            entries.extend((query_key(query), {"fdcId": food.fdc_id}) for query in row.get("queries") or [])
+        cache.set_many(entries, ttl_seconds=ttl_seconds)
+        count += batch.num_rows
+    return count
+
+
+def import_into_index(path: str, db_path: str) -> dict:
+    """
+    Adds every food of an exported table to the offline USDA index. Returns the table counts.
+    The API keeps serving the current index until the finished import replaces it.
+    """
+    seen_nutrients = set()
+    with IndexImport(db_path) as index_import:
+        for batch in read_batches(path):
+            foods, nutrients, food_nutrients, food_portions = [], [], [], []
+            for row in batch.to_pylist():
+                fdc_id = row["fdc_id"]
+                foods.append((fdc_id, row["description"] or "", row["data_type"]))
+                for nutrient in row["nutrients"] or []:
+                    if nutrient["id"] is None:
+                        continue
+                    if nutrient["id"] not in seen_nutrients:
+                        seen_nutrients.add(nutrient["id"])
+                        nutrients.append((nutrient["id"], nutrient["name"] or "", nutrient["unit"]))
+                    food_nutrients.append((fdc_id, nutrient["id"], nutrient["amount"]))
+                food_portions.extend(
+                    (fdc_id, portion["unit"], portion["gram_weight"]) for portion in row["portions"] or []
+                )
+            index_import.insert(foods, nutrients, food_nutrients, food_portions)
+    return index_import.counts
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description="Bulk export and import of foods as Parquet or Arrow")
+    parser.add_argument("--cache", default=os.getenv("NUTRITION_CACHE_PATH", "data/cache/nutrition_cache.sqlite3"))
+    parser.add_argument("--usda-index", default=os.getenv("USDA_LOCAL_INDEX_PATH", "data/usda/fdc_index.sqlite3"))
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_cmd = commands.add_parser("export", help="Write foods from the cache or the offline index")
+    export_cmd.add_argument("out")
+    export_cmd.add_argument("--source", choices=("cache", "index"), default="cache")
+    export_cmd.add_argument("--format", choices=FORMATS, help="Default: from the file extension")
+    export_cmd.add_argument("--include-branded", action="store_true", help="Also export branded index foods")
+    export_cmd.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE)
+    import_cmd = commands.add_parser("import", help="Load an exported Parquet or Arrow table")
+    import_cmd.add_argument("source")
+    import_cmd.add_argument("--into", choices=("cache", "index"), default="cache")
+    import_cmd.add_argument("--ttl", type=float, help="Cache entry lifetime in seconds (default: NUTRITION_CACHE_TTL)")
+    args = parser.parse_args(argv)
+
+    ttl = float(os.getenv("NUTRITION_CACHE_TTL", str(7 * 24 * 3600)))
+    cache = NutritionCache(args.cache, ttl_seconds=ttl, max_memory_entries=0,
+                           max_disk_entries=int(os.getenv("NUTRITION_CACHE_DISK_ENTRIES", "100000")))
+
+    if args.command == "import":
+        if args.into == "index":
+            counts = import_into_index(args.source, args.usda_index)
+            print(f"Index {args.usda_index} now holds {counts['foods']} foods and {counts['food_nutrients']} nutrient values")
+        else:
+            count = import_into_cache(args.source, cache, args.ttl)
+            print(f"Imported {count} foods into {args.cache}")
+        return 0
+
+    fmt = args.format or ("parquet" if args.out.endswith(".parquet") else "arrow")
+    if args.source == "index":
+        index = LocalFoodIndex(args.usda_index)
+        if not index.available:
+            print(f"No local index at {args.usda_index}", file=sys.stderr)
+            return 1
+        foods = index_foods(index, args.include_branded)
+    else:
+        foods = cache_foods(cache)
+    count = write_foods(iter_record_batches(foods, args.batch_size), args.out, fmt)
+    print(f"Exported {count} foods to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
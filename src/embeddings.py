@@ -0,0 +1,36 @@
+import re
+import zlib
+
+import numpy as np
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+LOCAL_EMBEDDING_DIM = 512
+
+
+def tokenize(text: str) -> list:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def hashed_embedding(text: str, dim: int = LOCAL_EMBEDDING_DIM, normalize: bool = True) -> np.ndarray:
+    """
+    Local stand-in for a sentence embedding: word unigrams and character trigrams hashed into a
+    fixed-size float32 vector, L2-normalized unless asked not to. Stable across processes (crc32, not hash()).
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    for token in tokenize(text):
+        vector[zlib.crc32(token.encode()) % dim] += 1.0
+        padded = f" {token} "
+        for i in range(len(padded) - 2):
+            vector[zlib.crc32(padded[i:i + 3].encode()) % dim] += 0.5
+    if not normalize:
+        return vector
+    return l2_normalize(vector)
+
+
+def l2_normalize(vectors: np.ndarray) -> np.ndarray:
+    """
+    Normalizes a vector, or each row of a matrix, to unit length. Zero rows stay zero.
+    """
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
@@ -0,0 +1,222 @@
+import bisect
+import itertools
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from src.embeddings import tokenize
+
+# Alternative names mapped to the word USDA uses in its descriptions
+SYNONYMS = {
+    "aubergine": "eggplant", "courgette": "zucchini", "garbanzo": "chickpea", "capsicum": "pepper",
+    "oatmeal": "oat", "porridge": "oat", "yoghurt": "yogurt", "curd": "yogurt", "prawn": "shrimp",
+    "mince": "ground", "rocket": "arugula", "coriander": "cilantro", "maize": "corn", "scallion": "onion",
+}
+
+# Lower rank wins when several foods share a name: generic USDA data before branded products
+DATA_TYPE_RANK = {
+    "foundation_food": 0, "Foundation": 0, "learned": 1, "sr_legacy_food": 1, "SR Legacy": 1,
+    "survey_fndds_food": 2, "Survey (FNDDS)": 2, "branded_food": 3, "Branded": 3,
+}
+
+# Words USDA descriptions add to the food itself ("Bananas, raw", "Eggs, whole, raw, fresh"). A confident
+# match may carry these beyond the query, but no other words: "egg" is not "egg white"
+QUALIFIER_TOKENS = frozenset({
+    "raw", "fresh", "whole", "plain", "regular", "unprepared", "uncooked", "all", "variety", "commercial",
+    "commercially", "ns", "nfs", "type",
+})
+
+# Names bulk-loaded per hold of the resolver lock, so lookups from other threads are never held up long
+ADD_MANY_CHUNK = 10_000
+
+CONFIDENT_SCORE = 0.72
+COMMON_TRIGRAM_POSTINGS = 500
+
+
+def singular(token: str) -> str:
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 4 and token.endswith(("oes", "ches", "shes")):
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s") and not token.endswith(("ss", "us")):
+        return token[:-1]
+    return token
+
+
+def normalize_name(text: str) -> str:
+    """
+    Lowercase, punctuation-free, singular tokens with synonyms folded: "Bananas, raw" -> "banana raw".
+    """
+    return " ".join(SYNONYMS.get(token, token) for token in map(singular, tokenize(text)))
+
+
+def _trigrams(text: str) -> set:
+    padded = f" {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class _Entry:
+    __slots__ = ("name", "display", "fdc_id", "rank", "tokens", "trigrams")
+
+    def __init__(self, name: str, display: str, fdc_id: int, rank: int):
+        self.name = name
+        self.display = display
+        self.fdc_id = fdc_id
+        self.rank = rank
+        self.tokens = name.split()
+        self.trigrams = _trigrams(name)
+
+
+def same_food(query: str, name: str) -> bool:
+    """
+    Whether a normalized name denotes the food a normalized query asks for.
+    """
+    # Every query word must be in the name ("egg white" is not "egg yolk"); only a trailing word of
+    # three or more letters may be unfinished, as in "banan"
+    name_tokens = set(name.split())
+    *words, last = query.split()
+    if not name_tokens.issuperset(words):
+        return False
+    partial = last not in name_tokens
+    if partial and not (
+        last.isalpha() and len(last) >= 3 and any(name_token.startswith(last) for name_token in name_tokens)
+    ):
+        return False
+    # ...and every word of the name must be in the query, so "apple" does not resolve to "apple pie"
+    query_tokens = set(query.split())
+    return all(
+        name_token in query_tokens or (partial and name_token.startswith(last))
+        for name_token in name_tokens - QUALIFIER_TOKENS
+    )
+
+
+class FoodResolver:
+    """
+    Local food-name resolver: normalized names (USDA descriptions plus queries that USDA already
+    resolved) indexed by exact name, by sorted prefix and by trigram, ranked with trigram overlap
+    and token coverage. Resolves plurals, synonyms and small typos without a network round trip.
+    """
+
+    def __init__(self):
+        self._entries: List[_Entry] = []
+        self._by_name: Dict[str, int] = {}
+        self._sorted_names: List[str] = []
+        self._trigram_postings: Dict[str, List[int]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, text: str, fdc_id: int, data_type: Optional[str] = None) -> None:
+        with self._lock:
+            if self._add_locked(text, fdc_id, data_type):
+                bisect.insort(self._sorted_names, self._entries[-1].name)
+
+    def add_many(self, foods) -> None:
+        """
+        Bulk-loads (text, fdc_id, data_type) tuples in chunks, re-sorting the prefix index after each chunk.
+        The lock is released between chunks, so lookups and adds can run while a large load is in progress.
+        """
+        foods = iter(foods)
+        while True:
+            chunk = list(itertools.islice(foods, ADD_MANY_CHUNK))
+            if not chunk:
+                return
+            with self._lock:
+                for text, fdc_id, data_type in chunk:
+                    if self._add_locked(text, fdc_id, data_type):
+                        self._sorted_names.append(self._entries[-1].name)
+                self._sorted_names.sort()
+
+    def _add_locked(self, text: str, fdc_id: int, data_type: Optional[str]) -> bool:
+        """
+        Returns True when a new name was appended to the entries.
+        """
+        name = normalize_name(text)
+        if not name:
+            return False
+        rank = DATA_TYPE_RANK.get(data_type or "learned", 4)
+        existing = self._by_name.get(name)
+        if existing is not None:
+            if rank < self._entries[existing].rank:
+                self._entries[existing] = _Entry(name, text, fdc_id, rank)
+            return False
+        entry = _Entry(name, text, fdc_id, rank)
+        index = len(self._entries)
+        self._entries.append(entry)
+        self._by_name[name] = index
+        for trigram in entry.trigrams:
+            self._trigram_postings[trigram].append(index)
+        return True
+
+    def _score(self, query: str, query_tokens: list, query_trigrams: set, entry: _Entry) -> float:
+        shared = len(query_trigrams & entry.trigrams)
+        dice = 2 * shared / (len(query_trigrams) + len(entry.trigrams))
+        covered = sum(
+            1 for token in query_tokens
+            if any(name_token.startswith(token) or token.startswith(name_token) for name_token in entry.tokens)
+        )
+        coverage = covered / len(query_tokens)
+        leading = 0.1 if entry.name.startswith(query) or entry.tokens[0] == query_tokens[0] else 0.0
+        return min(1.0, 0.55 * dice + 0.35 * coverage + leading)
+
+    def candidates(self, text: str, limit: int = 10) -> List[dict]:
+        """
+        Ranked matches for a query or a partial query, best first.
+        """
+        query = normalize_name(text)
+        if not query:
+            return []
+        query_tokens = query.split()
+        query_trigrams = _trigrams(query)
+
+        with self._lock:
+            # Trigrams shared by a large share of all names ("raw", "ed ") say little and cost the most to
+            # count, so they are skipped whenever the query has rarer ones
+            postings = sorted((self._trigram_postings.get(trigram, ()) for trigram in query_trigrams), key=len)
+            common = max(COMMON_TRIGRAM_POSTINGS, len(self._entries) // 10)
+            counts: Dict[int, int] = defaultdict(int)
+            for i, indexes in enumerate(postings):
+                if i and len(indexes) > common:
+                    break
+                for index in indexes:
+                    counts[index] += 1
+            start = bisect.bisect_left(self._sorted_names, query)
+            for name in self._sorted_names[start:start + 50]:
+                if not name.startswith(query):
+                    break
+                counts[self._by_name[name]] += len(query_trigrams)
+            shortlist = sorted(counts, key=counts.get, reverse=True)[:200]
+            scored = [
+                (1.0 if self._entries[i].name == query else
+                 self._score(query, query_tokens, query_trigrams, self._entries[i]), self._entries[i])
+                for i in shortlist
+            ]
+
+        scored.sort(key=lambda item: (-item[0], item[1].rank, len(item[1].name)))
+        results, seen = [], set()
+        for score, entry in scored:
+            if entry.fdc_id in seen:
+                continue
+            seen.add(entry.fdc_id)
+            results.append({"fdc_id": entry.fdc_id, "name": entry.display, "score": round(score, 3)})
+            if len(results) == limit:
+                break
+        return results
+
+    def resolve(self, text: str, min_score: float = CONFIDENT_SCORE) -> Optional[int]:
+        """
+        Returns the FDC ID of a confident match, or None when the remote search should decide. A match is
+        confident when it names the same food as the query: no query word missing, no extra word in the
+        name other than USDA qualifiers such as "raw".
+        """
+        query = normalize_name(text)
+        exact = self._by_name.get(query)
+        if exact is not None:
+            return self._entries[exact].fdc_id
+        for candidate in self.candidates(text, limit=5):
+            if candidate["score"] < min_score:
+                break
+            if same_food(query, normalize_name(candidate["name"])):
+                return candidate["fdc_id"]
+        return None
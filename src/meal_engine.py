@@ -0,0 +1,198 @@
+"""
+Vectorized meal and recipe aggregation.
+
+Foods are held as rows of a foods x nutrients float32 matrix (amounts per gram), so totals for a
+meal, a recipe or a whole day of diary entries are one gather, one multiply and one bincount per
+nutrient, independent of how many foods are involved. A nutrient a food does not report is NaN, so
+any total it is part of is NaN (unknown) rather than understated. Nightly diary recomputation:
+
+    python -m src.meal_engine recompute diary.csv --out diary_totals.csv
+
+where diary.csv has log_id, fdc_id and grams columns and foods come from the offline USDA index.
+Diaries and totals ending in .parquet are read and written as Parquet instead of CSV.
+"""
+import argparse
+import os
+import sys
+import threading
+from typing import Optional, Tuple
+
+import numpy as np
+
+import src.settings  # noqa: F401  (loads .env before the settings below are read)
+from src.nutrients import MACRO_NUTRIENT_IDS, FoodNutrients
+
+MEAL_NUTRIENTS = tuple(MACRO_NUTRIENT_IDS)
+
+# Units whose gram weight does not depend on the food
+MASS_UNITS = {
+    "g": 1.0, "gram": 1.0, "grams": 1.0, "kg": 1000.0,
+    "oz": 28.3495, "ounce": 28.3495, "lb": 453.592, "pound": 453.592,
+}
+UNIT_ALIASES = {
+    "big": "large", "cups": "cup", "tablespoon": "tbsp", "teaspoon": "tsp",
+    "slices": "slice", "servings": "serving", "pieces": "piece",
+}
+
+
+class PortionError(ValueError):
+    """
+    Raised when a quantity cannot be converted to grams for a food.
+    """
+
+
+class MealEngine:
+    """
+    Growable foods x nutrients matrix with per-food portion sizes.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self._matrix = np.zeros((capacity, len(MEAL_NUTRIENTS)), dtype=np.float32)
+        self._rows = {}
+        self._portions = {}
+        self._sorted_ids: Optional[np.ndarray] = None
+        self._sorted_rows: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+
+    def __contains__(self, fdc_id: int) -> bool:
+        return fdc_id in self._rows
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def loaded_ids(self) -> list:
+        return list(self._rows)
+
+    def add_food(self, food: FoodNutrients) -> int:
+        """
+        Adds or refreshes a food from its nutrient record and returns its matrix row.
+        """
+        macros = food.macros()
+        per_gram = np.array([np.nan if macros[field] is None else macros[field] for field in MEAL_NUTRIENTS],
+                            dtype=np.float32) / 100.0
+        fdc_id = food.fdc_id
+        with self._lock:
+            row = self._rows.get(fdc_id)
+            if row is None:
+                row = len(self._rows)
+                if row == self._matrix.shape[0]:
+                    self._matrix = np.concatenate([self._matrix, np.zeros_like(self._matrix)])
+                self._rows[fdc_id] = row
+                self._sorted_ids = None
+            self._matrix[row] = per_gram
+            self._portions[fdc_id] = food.portions
+        return row
+
+    def grams_for(self, fdc_id: int, quantity: float, unit: str) -> float:
+        """
+        Converts a quantity in a mass unit ("g", "oz") or a food-specific portion ("medium", "cup") to grams.
+        """
+        unit = unit.strip().lower()
+        if unit in MASS_UNITS:
+            return quantity * MASS_UNITS[unit]
+        unit = UNIT_ALIASES.get(unit, unit)
+        portions = self._portions.get(fdc_id, [])
+        for name, grams in portions:
+            if name == unit:
+                return quantity * grams
+        # "medium" matches SR Legacy modifiers such as 'medium (7" to 7-7/8" long)'
+        for name, grams in portions:
+            if unit in name.replace("(", " ").replace(",", " ").split():
+                return quantity * grams
+        available = ", ".join(sorted({name for name, _ in portions} | {"g", "oz"}))
+        raise PortionError(f"Unknown unit '{unit}' for FDC ID {fdc_id}. Available units: {available}")
+
+    def _row_indices(self, fdc_ids: np.ndarray) -> np.ndarray:
+        with self._lock:
+            if self._sorted_ids is None:
+                ids = np.fromiter(self._rows.keys(), dtype=np.int64, count=len(self._rows))
+                rows = np.fromiter(self._rows.values(), dtype=np.int64, count=len(self._rows))
+                order = np.argsort(ids)
+                self._sorted_ids, self._sorted_rows = ids[order], rows[order]
+            sorted_ids, sorted_rows = self._sorted_ids, self._sorted_rows
+        if not len(sorted_ids):
+            raise KeyError("No foods are loaded in the meal engine")
+        positions = np.searchsorted(sorted_ids, fdc_ids)
+        positions = np.minimum(positions, len(sorted_ids) - 1)
+        found = sorted_ids[positions] == fdc_ids
+        if not found.all():
+            missing = np.unique(fdc_ids[~found])[:10].tolist()
+            raise KeyError(f"Foods not loaded in the meal engine: {missing}")
+        return sorted_rows[positions]
+
+    def item_nutrients(self, fdc_ids, grams) -> np.ndarray:
+        """
+        Nutrients for each item (items x nutrients), in MEAL_NUTRIENTS column order.
+        """
+        fdc_ids = np.asarray(fdc_ids, dtype=np.int64)
+        grams = np.asarray(grams, dtype=np.float64)
+        if not len(fdc_ids):
+            return np.zeros((0, len(MEAL_NUTRIENTS)))
+        return self._matrix[self._row_indices(fdc_ids)] * grams[:, None]
+
+    def aggregate(self, fdc_ids, grams, groups) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Sums items per group (a meal, a recipe, a user's day) in one pass.
+        Returns the sorted unique group ids and a groups x nutrients matrix of totals.
+        """
+        contributions = self.item_nutrients(fdc_ids, grams)
+        group_ids, inverse = np.unique(np.asarray(groups), return_inverse=True)
+        totals = np.empty((len(group_ids), len(MEAL_NUTRIENTS)))
+        for column in range(len(MEAL_NUTRIENTS)):
+            totals[:, column] = np.bincount(inverse, weights=contributions[:, column], minlength=len(group_ids))
+        return group_ids, totals
+
+    def totals(self, fdc_ids, grams) -> np.ndarray:
+        return self.item_nutrients(fdc_ids, grams).sum(axis=0)
+
+
+def recompute_diary(diary_path: str, out_path: str, index_path: str) -> int:
+    """
+    Recomputes per-log totals for a diary CSV or Parquet file (log_id, fdc_id, grams).
+    Returns the number of logs written.
+    """
+    import pandas as pd
+
+    from src.usda_index import LocalFoodIndex
+
+    if diary_path.endswith(".parquet"):
+        diary = pd.read_parquet(diary_path, columns=["log_id", "fdc_id", "grams"])
+    else:
+        diary = pd.read_csv(diary_path, usecols=["log_id", "fdc_id", "grams"])
+    engine = MealEngine()
+    index = LocalFoodIndex(index_path)
+    for fdc_id in diary["fdc_id"].unique():
+        food_data = index.get_food(int(fdc_id))
+        if food_data:
+            engine.add_food(FoodNutrients.from_food_data(food_data))
+
+    known = diary["fdc_id"].isin(engine.loaded_ids())
+    if not known.all():
+        print(f"Skipping {int((~known).sum())} diary rows with foods missing from the index", file=sys.stderr)
+    diary = diary[known]
+    log_ids, totals = engine.aggregate(diary["fdc_id"].to_numpy(), diary["grams"].to_numpy(), diary["log_id"].to_numpy())
+    result = pd.DataFrame(totals, columns=list(MEAL_NUTRIENTS))
+    result.insert(0, "log_id", log_ids)
+    if out_path.endswith(".parquet"):
+        result.to_parquet(out_path, index=False, compression="zstd")
+    else:
+        result.to_csv(out_path, index=False, float_format="%.4f")
+    return len(result)
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description="Vectorized meal and diary aggregation")
+    commands = parser.add_subparsers(dest="command", required=True)
+    recompute_cmd = commands.add_parser("recompute", help="Recompute diary totals from a log_id,fdc_id,grams CSV or Parquet file")
+    recompute_cmd.add_argument("diary")
+    recompute_cmd.add_argument("--out", required=True)
+    recompute_cmd.add_argument("--usda-index", default=os.getenv("USDA_LOCAL_INDEX_PATH", "data/usda/fdc_index.sqlite3"))
+    args = parser.parse_args(argv)
+
+    count = recompute_diary(args.diary, args.out, args.usda_index)
+    print(f"Wrote totals for {count} logs to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,376 @@
+"""
+Nutrient IDs, macro extraction and the compact per-food nutrient record.
+
+USDA foods report 100+ nutrients, each named by a display string ("Carbohydrate, by difference") and a
+unit. Holding those as dicts of strings per food costs kilobytes, so foods in memory are FoodNutrients
+records instead: the amounts as one float32 vector plus a bitmap of which nutrients of the canonical
+table they belong to. Names and units are stored once, in the table; a record only keeps the order USDA
+listed its nutrients in, the names and units USDA reported differently from the table, and the rare
+nutrients reported without an ID, so that to_food_data() gives back what from_food_data() was given.
+"""
+import math
+import struct
+import threading
+from typing import Iterable, Iterator, Optional, Tuple
+
+import numpy as np
+
+# USDA FoodData Central nutrient IDs for each macro field, in order of preference
+MACRO_NUTRIENT_IDS = {
+    "calories": (1008, 2047, 2048),
+    "protein_g": (1003,),
+    "fat_g": (1004,),
+    "carbohydrates_g": (1005, 1050),
+    "fiber_g": (1079,),
+    "sugar_g": (2000, 1063),
+    "sodium_mg": (1093,),
+    "cholesterol_mg": (1253,),
+}
+
+# Canonical nutrient table: (USDA nutrient ID, name, unit). A nutrient's position is its slot in every
+# FoodNutrients record, so entries are only ever appended. Macros come first so that most foods only set
+# low bits; nutrients outside the table are appended at runtime when a food first reports them.
+CANONICAL_NUTRIENTS = (
+    (1008, "Energy", "kcal"),
+    (1003, "Protein", "g"),
+    (1004, "Total lipid (fat)", "g"),
+    (1005, "Carbohydrate, by difference", "g"),
+    (1079, "Fiber, total dietary", "g"),
+    (2000, "Sugars, total including NLEA", "g"),
+    (1093, "Sodium, Na", "mg"),
+    (1253, "Cholesterol", "mg"),
+    (2047, "Energy (Atwater General Factors)", "kcal"),
+    (2048, "Energy (Atwater Specific Factors)", "kcal"),
+    (1050, "Carbohydrate, by summation", "g"),
+    (1063, "Sugars, Total", "g"),
+    (1062, "Energy", "kJ"),
+    (1051, "Water", "g"),
+    (1007, "Ash", "g"),
+    (1009, "Starch", "g"),
+    (1010, "Sucrose", "g"),
+    (1011, "Glucose", "g"),
+    (1012, "Fructose", "g"),
+    (1013, "Lactose", "g"),
+    (1014, "Maltose", "g"),
+    (1075, "Galactose", "g"),
+    (1235, "Sugars, added", "g"),
+    (1082, "Fiber, soluble", "g"),
+    (1084, "Fiber, insoluble", "g"),
+    (1018, "Alcohol, ethyl", "g"),
+    (1057, "Caffeine", "mg"),
+    (1058, "Theobromine", "mg"),
+    (1087, "Calcium, Ca", "mg"),
+    (1089, "Iron, Fe", "mg"),
+    (1090, "Magnesium, Mg", "mg"),
+    (1091, "Phosphorus, P", "mg"),
+    (1092, "Potassium, K", "mg"),
+    (1095, "Zinc, Zn", "mg"),
+    (1098, "Copper, Cu", "mg"),
+    (1101, "Manganese, Mn", "mg"),
+    (1103, "Selenium, Se", "µg"),
+    (1099, "Fluoride, F", "µg"),
+    (1104, "Vitamin A, IU", "IU"),
+    (1106, "Vitamin A, RAE", "µg"),
+    (1105, "Retinol", "µg"),
+    (1107, "Carotene, beta", "µg"),
+    (1108, "Carotene, alpha", "µg"),
+    (1120, "Cryptoxanthin, beta", "µg"),
+    (1122, "Lycopene", "µg"),
+    (1123, "Lutein + zeaxanthin", "µg"),
+    (1162, "Vitamin C, total ascorbic acid", "mg"),
+    (1165, "Thiamin", "mg"),
+    (1166, "Riboflavin", "mg"),
+    (1167, "Niacin", "mg"),
+    (1170, "Pantothenic acid", "mg"),
+    (1175, "Vitamin B-6", "mg"),
+    (1176, "Biotin", "µg"),
+    (1177, "Folate, total", "µg"),
+    (1186, "Folic acid", "µg"),
+    (1187, "Folate, food", "µg"),
+    (1190, "Folate, DFE", "µg"),
+    (1178, "Vitamin B-12", "µg"),
+    (1180, "Choline, total", "mg"),
+    (1198, "Betaine", "mg"),
+    (1109, "Vitamin E (alpha-tocopherol)", "mg"),
+    (1125, "Tocopherol, beta", "mg"),
+    (1126, "Tocopherol, gamma", "mg"),
+    (1127, "Tocopherol, delta", "mg"),
+    (1110, "Vitamin D (D2 + D3), International Units", "IU"),
+    (1114, "Vitamin D (D2 + D3)", "µg"),
+    (1111, "Vitamin D2 (ergocalciferol)", "µg"),
+    (1112, "Vitamin D3 (cholecalciferol)", "µg"),
+    (1185, "Vitamin K (phylloquinone)", "µg"),
+    (1183, "Vitamin K (Menaquinone-4)", "µg"),
+    (1184, "Vitamin K (Dihydrophylloquinone)", "µg"),
+    (1258, "Fatty acids, total saturated", "g"),
+    (1292, "Fatty acids, total monounsaturated", "g"),
+    (1293, "Fatty acids, total polyunsaturated", "g"),
+    (1257, "Fatty acids, total trans", "g"),
+    (1210, "Tryptophan", "g"),
+    (1211, "Threonine", "g"),
+    (1212, "Isoleucine", "g"),
+    (1213, "Leucine", "g"),
+    (1214, "Lysine", "g"),
+    (1215, "Methionine", "g"),
+    (1216, "Cystine", "g"),
+    (1217, "Phenylalanine", "g"),
+    (1218, "Tyrosine", "g"),
+    (1219, "Valine", "g"),
+    (1220, "Arginine", "g"),
+    (1221, "Histidine", "g"),
+    (1222, "Alanine", "g"),
+    (1223, "Aspartic acid", "g"),
+    (1224, "Glutamic acid", "g"),
+    (1225, "Glycine", "g"),
+    (1226, "Proline", "g"),
+    (1227, "Serine", "g"),
+)
+
+
+def to_amount(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def extract_macros(food_nutrients: list) -> dict:
+    """
+    Picks the canonical macro values out of a USDA foodNutrients list by nutrient ID.
+    Macros the food does not report are None.
+    """
+    amounts = {}
+    for food_nutrient in food_nutrients:
+        nutrient_id = food_nutrient.get("nutrient", {}).get("id")
+        if nutrient_id is not None:
+            amounts[nutrient_id] = to_amount(food_nutrient.get("amount"))
+
+    macros = {}
+    for field, nutrient_ids in MACRO_NUTRIENT_IDS.items():
+        macros[field] = next((amounts[i] for i in nutrient_ids if amounts.get(i) is not None), None)
+    return macros
+
+
+def normalize_portion(unit_name: Optional[str], modifier: Optional[str], description: Optional[str],
+                      amount, gram_weight) -> Optional[dict]:
+    """
+    Turns one USDA foodPortions entry into {"unit": ..., "gramWeight": grams per single unit}.
+    SR Legacy portions carry their name in the modifier ("medium (7\" to 7-7/8\" long)") with an
+    "undetermined" measure unit; Foundation foods use the measure unit ("cup").
+    """
+    grams = to_amount(gram_weight)
+    if not grams:
+        return None
+    count = to_amount(amount) or 1.0
+    unit = unit_name if unit_name and unit_name != "undetermined" else (modifier or description)
+    if not unit:
+        return None
+    return {"unit": unit.strip().lower(), "gramWeight": grams / count}
+
+# Marks, in a record's nutrient order, the position of the next nutrient that was reported without an ID
+_UNIDENTIFIED = 0xFFFF
+
+_nutrient_ids = [nutrient_id for nutrient_id, _, _ in CANONICAL_NUTRIENTS]
+_nutrient_info = [(name, unit) for _, name, unit in CANONICAL_NUTRIENTS]
+_nutrient_slots = {nutrient_id: slot for slot, nutrient_id in enumerate(_nutrient_ids)}
+_registry_lock = threading.Lock()
+
+
+def nutrient_slot(nutrient_id: int, name: Optional[str] = None, unit: Optional[str] = None) -> int:
+    """
+    The slot of a nutrient ID, appending it to the table (with the name and unit it was reported with)
+    the first time an ID outside the canonical table is seen.
+    """
+    slot = _nutrient_slots.get(nutrient_id)
+    if slot is None:
+        with _registry_lock:
+            slot = _nutrient_slots.get(nutrient_id)
+            if slot is None:
+                slot = len(_nutrient_ids)
+                _nutrient_ids.append(nutrient_id)
+                _nutrient_info.append((name or "Unknown Nutrient", unit or ""))
+                _nutrient_slots[nutrient_id] = slot
+    return slot
+
+
+def _rounded(values: np.ndarray) -> list:
+    """
+    float32 amounts as Python floats, rounded to the 7 significant digits float32 holds so that a stored 1.09
+    comes back as 1.09 rather than 1.0900000333786. NaN (reported without an amount) becomes None.
+    """
+    values = values.astype(np.float64)
+    nonzero = np.isfinite(values) & (values != 0)
+    scale = np.ones_like(values)
+    scale[nonzero] = 10.0 ** (6 - np.floor(np.log10(np.abs(values[nonzero]))))
+    return [None if amount != amount else amount for amount in (np.round(values * scale) / scale).tolist()]
+
+
+def _rounded_amount(value: float) -> Optional[float]:
+    """
+    _rounded() for a single amount, without the array round trip.
+    """
+    if value != value:
+        return None
+    if not value or math.isinf(value):
+        return value
+    scale = 10.0 ** (6 - math.floor(math.log10(abs(value))))
+    return round(value * scale) / scale
+
+
+class FoodNutrients:
+    """
+    One food's nutrients per 100 g as a compact record: the float32 amounts of the nutrients it reports, in
+    slot order, and a bitmap of those slots. Amounts are kept as raw bytes, which costs far less per food
+    than an ndarray; `values` views them as one. The order the nutrients were reported in is kept as uint16
+    slots only when it differs from slot order, and names or units only where they differ from the table.
+    """
+
+    __slots__ = ("fdc_id", "description", "present", "_values", "portions", "_order", "_labels", "_unidentified")
+
+    def __init__(self, fdc_id: int, description: str, present: int, values: bytes,
+                 portions: Tuple[Tuple[str, float], ...] = (), order: bytes = b"",
+                 labels: Tuple[Tuple[int, str, str], ...] = (),
+                 unidentified: Tuple[Tuple[str, str, Optional[float]], ...] = ()):
+        self.fdc_id = fdc_id
+        self.description = description
+        self.present = present
+        self._values = values
+        self.portions = portions
+        self._order = order
+        self._labels = labels
+        self._unidentified = unidentified
+
+    @classmethod
+    def _build(cls, fdc_id, description: str, entries: Iterable[tuple], portions) -> "FoodNutrients":
+        """
+        Builds a record from (nutrient ID, name, unit, amount) entries in reported order. A name or unit of
+        None means the table's; an ID of None is a nutrient USDA reported without one.
+        """
+        amounts, order, labels, unidentified = {}, [], {}, []
+        for nutrient_id, name, unit, amount in entries:
+            amount = to_amount(amount)
+            if nutrient_id is None:
+                order.append(_UNIDENTIFIED)
+                unidentified.append((name or "Unknown Nutrient", unit or "", amount))
+                continue
+            slot = nutrient_slot(int(nutrient_id), name, unit)
+            if slot not in amounts:
+                order.append(slot)
+            amounts[slot] = np.nan if amount is None else amount
+            table_name, table_unit = _nutrient_info[slot]
+            reported = (table_name if name is None else name, table_unit if unit is None else unit)
+            if reported != (table_name, table_unit):
+                labels[slot] = reported
+
+        present = 0
+        for slot in amounts:
+            present |= 1 << slot
+        slots = sorted(amounts)
+        values = np.array([amounts[slot] for slot in slots], dtype=np.float64)
+        return cls(int(fdc_id), description or "", present, values.astype(np.float32).tobytes(),
+                   tuple((unit, float(grams)) for unit, grams in portions),
+                   b"" if order == slots else np.array(order, dtype="<u2").tobytes(),
+                   tuple((slot, name, unit) for slot, (name, unit) in sorted(labels.items())),
+                   tuple(unidentified))
+
+    @classmethod
+    def from_food_data(cls, food_data: dict) -> "FoodNutrients":
+        """
+        Builds a record from USDA details in the trimmed shape (foodNutrients and normalized foodPortions).
+        """
+        entries = []
+        for food_nutrient in food_data.get("foodNutrients", []):
+            nutrient = food_nutrient.get("nutrient", {})
+            entries.append((nutrient.get("id"), nutrient.get("name"), nutrient.get("unitName"),
+                            food_nutrient.get("amount")))
+        portions = [(portion["unit"], portion["gramWeight"]) for portion in food_data.get("foodPortions", [])]
+        return cls._build(food_data.get("fdcId"), food_data.get("description", ""), entries, portions)
+
+    @classmethod
+    def from_json(cls, value: dict) -> "FoodNutrients":
+        """
+        Decodes to_json() output. Entries stored before records existed hold trimmed USDA details instead.
+        """
+        if "foodNutrients" in value:
+            return cls.from_food_data(value)
+        entries = ((nutrient_id, *(info or (None, None)), amount) for nutrient_id, amount, *info in value["nutrients"])
+        return cls._build(value["fdcId"], value.get("description", ""), entries, value.get("portions", []))
+
+    @property
+    def values(self) -> np.ndarray:
+        return np.frombuffer(self._values, dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self._values) // 4
+
+    def __repr__(self) -> str:
+        return f"FoodNutrients(fdc_id={self.fdc_id}, description={self.description!r}, nutrients={len(self)})"
+
+    def _slots(self) -> np.ndarray:
+        bitmap = self.present.to_bytes((self.present.bit_length() + 7) // 8, "little")
+        return np.flatnonzero(np.unpackbits(np.frombuffer(bitmap, dtype=np.uint8), bitorder="little"))
+
+    def amount(self, nutrient_id: int) -> Optional[float]:
+        """
+        Amount per 100 g of one nutrient, or None when the food does not report it.
+        """
+        slot = _nutrient_slots.get(nutrient_id)
+        if slot is None or not self.present >> slot & 1:
+            return None
+        rank = (self.present & ((1 << slot) - 1)).bit_count()
+        return _rounded_amount(struct.unpack_from("<f", self._values, 4 * rank)[0])
+
+    def nutrients(self) -> Iterator[Tuple[Optional[int], str, str, Optional[float]]]:
+        """
+        Yields (nutrient ID, name, unit, amount) in the order they were reported, with the names and units
+        they were reported with. Nutrients reported without an ID have an ID of None.
+        """
+        slots = self._slots().tolist()
+        amounts = dict(zip(slots, _rounded(self.values)))
+        labels = {slot: (name, unit) for slot, name, unit in self._labels}
+        unidentified = iter(self._unidentified)
+        for slot in np.frombuffer(self._order, dtype="<u2").tolist() if self._order else slots:
+            if slot == _UNIDENTIFIED:
+                yield (None, *next(unidentified))
+                continue
+            name, unit = labels.get(slot) or _nutrient_info[slot]
+            yield _nutrient_ids[slot], name, unit, amounts[slot]
+
+    def macros(self) -> dict:
+        """
+        The canonical macro values, like extract_macros(). Macros the food does not report are None.
+        """
+        macros = {}
+        for field, nutrient_ids in MACRO_NUTRIENT_IDS.items():
+            macros[field] = next((amount for amount in map(self.amount, nutrient_ids) if amount is not None), None)
+        return macros
+
+    def to_food_data(self) -> dict:
+        """
+        The record as trimmed USDA details, the shape the offline index and columnar exports use.
+        """
+        return {
+            "fdcId": self.fdc_id,
+            "description": self.description,
+            "foodNutrients": [
+                {"nutrient": {"id": nutrient_id, "name": name, "unitName": unit}, "amount": amount}
+                for nutrient_id, name, unit, amount in self.nutrients()
+            ],
+            "foodPortions": [{"unit": unit, "gramWeight": grams} for unit, grams in self.portions],
+        }
+
+    def to_json(self) -> dict:
+        """
+        Compact serialized form: [id, amount] pairs in reported order, with the name and unit only where they
+        differ from the canonical table or the nutrient is outside it, since another process may not have
+        seen it yet.
+        """
+        nutrients = []
+        for nutrient_id, name, unit, amount in self.nutrients():
+            entry = [nutrient_id, amount]
+            slot = _nutrient_slots.get(nutrient_id, len(CANONICAL_NUTRIENTS))
+            if slot >= len(CANONICAL_NUTRIENTS) or (name, unit) != _nutrient_info[slot]:
+                entry.extend((name, unit))
+            nutrients.append(entry)
+        return {"fdcId": self.fdc_id, "description": self.description, "nutrients": nutrients,
+                "portions": [list(portion) for portion in self.portions]}
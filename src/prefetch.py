@@ -0,0 +1,279 @@
+"""
+Background warm-up and refresh of popular foods in the nutrition cache.
+
+At startup the prefetcher loads the foods listed in PREFETCH_FOODS / PREFETCH_FOODS_FILE plus the
+most frequent foods mined from past request logs, and fetches the ones that are not cached. It then
+wakes every PREFETCH_INTERVAL seconds and re-fetches entries that expire within PREFETCH_REFRESH_BEFORE
+seconds (stale-while-revalidate), adding the foods most requested since the last cycle. USDA calls are
+paced by a token bucket and paused while live traffic has USDA requests in flight.
+
+When several worker processes share the cache, only the one holding PREFETCH_LOCK_PATH prefetches; the
+others try to take over the lock every cycle, so warm-up continues if that worker exits.
+"""
+import asyncio
+import collections
+import glob
+import os
+import re
+import time
+from typing import Iterable, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, every process prefetches
+    fcntl = None
+
+from loguru import logger
+
+import src.settings  # noqa: F401  (loads .env before the settings below are read)
+from src.ai_model import (
+    FOOD_RESOLVER_INCLUDE_BRANDED,
+    NUTRITION_CACHE_PATH,
+    NUTRITION_CACHE_TTL,
+    USDA_MULTI_FOOD_BATCH_SIZE,
+    NutritionLookupError,
+    afetch_details_many,
+    asearch_fdc_id,
+    food_lookup_counts,
+    local_food_index,
+    nutrition_cache,
+    resolve_fdc_id,
+    store_details,
+    usda_api_key,
+)
+from src.cache import fdc_key, normalize_query, query_key
+from src.metrics import Counter
+from src.resilience import upstream_in_flight
+
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "true").lower() == "true"
+PREFETCH_FOODS = os.getenv("PREFETCH_FOODS", "")
+PREFETCH_FOODS_FILE = os.getenv("PREFETCH_FOODS_FILE")
+PREFETCH_LOG_GLOB = os.getenv("PREFETCH_LOG_GLOB", "logs/app*.log*")
+PREFETCH_TOP_N = int(os.getenv("PREFETCH_TOP_N", "200"))
+PREFETCH_INTERVAL = float(os.getenv("PREFETCH_INTERVAL", "300"))
+PREFETCH_REFRESH_BEFORE = float(os.getenv("PREFETCH_REFRESH_BEFORE", str(NUTRITION_CACHE_TTL * 0.1)))
+PREFETCH_RATE = float(os.getenv("PREFETCH_RATE", "1"))  # USDA calls per second
+PREFETCH_MAX_LIVE_IN_FLIGHT = int(os.getenv("PREFETCH_MAX_LIVE_IN_FLIGHT", "2"))
+PREFETCH_LOCK_PATH = os.getenv(
+    "PREFETCH_LOCK_PATH", os.path.join(os.path.dirname(NUTRITION_CACHE_PATH) or ".", "prefetch.lock")
+)
+
+# Log lines that name the food of one lookup, whichever tier answered it
+_LOOKUP_LOG_RE = re.compile(
+    r" - (?:Searching USDA for: (?P<searched>.+)"
+    r"|(?:Nutrition cache|Local USDA index|Food resolver) hit for (?P<hit>.+?) \(FDC ID)"
+)
+
+prefetch_fetches = Counter("prefetch_fetches_total", "Foods warmed or refreshed in the background by outcome")
+
+
+def mine_popular_foods(paths: Iterable[str], top_n: int) -> List[str]:
+    """
+    The most frequently looked-up foods in loguru request logs, most frequent first.
+    """
+    counts = collections.Counter()
+    for path in paths:
+        try:
+            with open(path, encoding="utf-8", errors="replace") as f:
+                for line in f:
+                    match = _LOOKUP_LOG_RE.search(line.rstrip("\n"))
+                    if match:
+                        counts[normalize_query(match.group("searched") or match.group("hit"))] += 1
+        except OSError as e:
+            logger.warning(f"Could not read request log {path}: {str(e)}")
+    return [food for food, _ in counts.most_common(top_n)]
+
+
+def configured_foods() -> List[str]:
+    foods = [food for food in PREFETCH_FOODS.split(",") if food.strip()]
+    if PREFETCH_FOODS_FILE:
+        try:
+            with open(PREFETCH_FOODS_FILE, encoding="utf-8") as f:
+                foods.extend(line for line in f if line.strip() and not line.startswith("#"))
+        except OSError as e:
+            logger.warning(f"Could not read popular foods file {PREFETCH_FOODS_FILE}: {str(e)}")
+    return [normalize_query(food) for food in foods]
+
+
+class TokenBucket:
+    """
+    Paces background calls to `rate` per second with bursts of up to `burst`.
+    """
+
+    def __init__(self, rate: float, burst: float = 1.0):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return
+            await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+
+class Prefetcher:
+    """
+    Keeps a set of popular foods fresh in the nutrition cache without competing with live requests.
+    """
+
+    def __init__(self, rate: float = PREFETCH_RATE, interval: float = PREFETCH_INTERVAL,
+                 refresh_before: float = PREFETCH_REFRESH_BEFORE, top_n: int = PREFETCH_TOP_N,
+                 max_live_in_flight: int = PREFETCH_MAX_LIVE_IN_FLIGHT):
+        self.bucket = TokenBucket(rate)
+        self.interval = interval
+        self.refresh_before = refresh_before
+        self.top_n = top_n
+        self.max_live_in_flight = max_live_in_flight
+        self.foods: "collections.OrderedDict[str, None]" = collections.OrderedDict()
+        self.pinned = set()
+        self._task: Optional[asyncio.Task] = None
+        self._lock_file = None
+
+    def track(self, foods: Iterable[str], pinned: bool = False) -> None:
+        """
+        Adds foods as the most recently popular. Beyond top_n, the least recently popular unpinned foods
+        are dropped; configured foods are pinned and always kept.
+        """
+        for food in map(normalize_query, foods):
+            self.foods[food] = None
+            self.foods.move_to_end(food)
+            if pinned:
+                self.pinned.add(food)
+        overflow = len(self.foods) - max(self.top_n, len(self.pinned))
+        for food in [food for food in self.foods if food not in self.pinned][:max(overflow, 0)]:
+            del self.foods[food]
+
+    async def _usda_slot(self) -> None:
+        """
+        Waits for a token, then for live traffic to leave room on the USDA connection pool.
+        """
+        await self.bucket.acquire()
+        while upstream_in_flight.value(upstream="usda") >= self.max_live_in_flight:
+            await asyncio.sleep(0.05)
+
+    def _due(self, food: str) -> Tuple[bool, Optional[int]]:
+        """
+        Whether a food needs fetching, and its FDC ID when that is already known. Foods cached for longer
+        than refresh_before, or answered by the offline index, are not due. The cache is only peeked at, so
+        these checks count neither as hits nor as misses and leave the LRU order alone.
+        """
+        mapping = nutrition_cache.peek(query_key(food))
+        fdc_id = mapping["fdcId"] if mapping else resolve_fdc_id(food)
+        if fdc_id:
+            remaining = nutrition_cache.ttl_remaining(fdc_key(fdc_id))
+            if mapping or remaining is not None:
+                return remaining is None or remaining <= self.refresh_before, fdc_id
+            if local_food_index.get_food(fdc_id):
+                return False, fdc_id
+        return not local_food_index.lookup(food, include_branded=FOOD_RESOLVER_INCLUDE_BRANDED), None
+
+    async def run_once(self) -> dict:
+        """
+        Fetches every tracked food that is missing or about to expire. Returns counts by outcome.
+        """
+        self.track(food for food, _ in reversed(food_lookup_counts.most_common(self.top_n)))
+        food_lookup_counts.clear()
+
+        to_search, by_fdc_id = [], collections.defaultdict(list)
+        for food in list(self.foods):
+            due, fdc_id = self._due(food)
+            if due and fdc_id is None:
+                to_search.append(food)
+            elif due:
+                by_fdc_id[fdc_id].append(food)
+
+        outcomes = collections.Counter()
+        for food in to_search:
+            await self._usda_slot()
+            try:
+                by_fdc_id[await asearch_fdc_id(food)].append(food)
+            except Exception as e:
+                outcomes["failed"] += 1
+                logger.warning(f"Prefetch search failed for {food}: {getattr(e, 'message', str(e))}")
+                if isinstance(e, NutritionLookupError) and e.status_code == 404:
+                    # USDA does not know this food; stop asking every cycle
+                    self.foods.pop(food, None)
+
+        fdc_ids = list(by_fdc_id)
+        for start in range(0, len(fdc_ids), USDA_MULTI_FOOD_BATCH_SIZE):
+            chunk = fdc_ids[start:start + USDA_MULTI_FOOD_BATCH_SIZE]
+            await self._usda_slot()
+            details = await afetch_details_many(chunk)
+            for fdc_id in chunk:
+                outcome = details.get(fdc_id)
+                for food in by_fdc_id[fdc_id]:
+                    try:
+                        if outcome is None:
+                            raise NutritionLookupError(f"No detailed nutrition information found for '{food}'.", 404)
+                        if isinstance(outcome, BaseException):
+                            raise outcome
+                        store_details(food, fdc_id, outcome)
+                        outcomes["fetched"] += 1
+                    except Exception as e:
+                        outcomes["failed"] += 1
+                        logger.warning(f"Prefetch failed for {food}: {getattr(e, 'message', str(e))}")
+
+        for outcome, count in outcomes.items():
+            prefetch_fetches.inc(count, outcome=outcome)
+        if outcomes:
+            logger.info(f"Prefetched {outcomes['fetched']} foods ({outcomes['failed']} failed) of {len(self.foods)} tracked")
+        return dict(outcomes)
+
+    def _acquire_leadership(self) -> bool:
+        """
+        Takes the cross-process prefetch lock without blocking. The lock is held until the process exits.
+        """
+        if self._lock_file is not None or fcntl is None:
+            return True
+        try:
+            os.makedirs(os.path.dirname(PREFETCH_LOCK_PATH) or ".", exist_ok=True)
+            lock_file = open(PREFETCH_LOCK_PATH, "a")
+        except OSError as e:
+            logger.warning(f"Could not open prefetch lock {PREFETCH_LOCK_PATH}: {str(e)}")
+            return True
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    async def _run(self) -> None:
+        while not self._acquire_leadership():
+            await asyncio.sleep(self.interval)
+        mined = await asyncio.to_thread(mine_popular_foods, sorted(glob.glob(PREFETCH_LOG_GLOB)), self.top_n)
+        self.track(reversed(mined))
+        self.track(configured_foods(), pinned=True)
+        logger.info(f"Prefetcher tracking {len(self.foods)} popular foods")
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Prefetch cycle failed: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self._task is None and PREFETCH_ENABLED and usda_api_key:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+
+prefetcher = Prefetcher()
@@ -0,0 +1,107 @@
+import random
+import threading
+import time
+from typing import Optional
+
+from src.metrics import Counter, Gauge, Histogram
+
+# Upstream responses worth retrying: rate limiting and transient server errors
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+upstream_request_duration = Histogram(
+    "upstream_request_duration_seconds", "Latency of each upstream HTTP attempt by upstream and outcome"
+)
+upstream_retries = Counter("upstream_retries_total", "Upstream attempts that were retried")
+upstream_errors = Counter("upstream_errors_total", "Failed upstream attempts by upstream and kind")
+upstream_in_flight = Gauge("upstream_requests_in_flight", "Upstream HTTP requests currently in flight by upstream")
+upstream_circuit_open = Gauge("upstream_circuit_open", "1 while an upstream's circuit breaker is open, else 0")
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling an upstream whose circuit breaker is open.
+    """
+
+    def __init__(self, upstream: str, retry_after: float):
+        super().__init__(f"{upstream} is unavailable (circuit open, retry in {retry_after:.0f}s)")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter: attempt n waits a random time in [0, min(max_delay, base * 2^(n-1))].
+    A Retry-After value from the upstream takes precedence, capped at max_delay.
+    """
+
+    def __init__(self, max_attempts: int, base_delay: float, max_delay: float):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        if retry_after:
+            try:
+                return min(self.max_delay, max(0.0, float(retry_after)))
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls for `reset_timeout` seconds,
+    then lets a single trial call through (half-open); its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def check(self) -> bool:
+        """
+        Raises CircuitOpenError when calls are currently rejected. Returns True when this call is the
+        half-open trial, which must end in record_success, record_failure or release_trial.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+            if remaining > 0 or self._trial_in_flight:
+                raise CircuitOpenError(self.name, max(remaining, 0.0))
+            self._trial_in_flight = True
+            return True
+
+    def release_trial(self) -> None:
+        """
+        Ends a trial call that finished without a verdict (cancelled, or failed in a way that says nothing
+        about the upstream), so the next call can be the trial instead.
+        """
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
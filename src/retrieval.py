@@ -0,0 +1,205 @@
+"""
+Retrieval over local nutrition facts, used to ground assistant answers.
+
+Fact files (*.txt, one fact per line) are chunked, embedded with the hashed n-gram vectors from
+src.embeddings, weighted by IDF and stored as a float32 .npy matrix that is memory-mapped at
+startup. The index is rebuilt automatically when a fact file is newer than it, with the options it was
+last built with (recorded in fact_build.json), or explicitly:
+
+    python -m src.retrieval build
+    python -m src.retrieval build --include-usda
+    python -m src.retrieval search "which fruits are high in potassium"
+"""
+import argparse
+import glob
+import json
+import os
+import sqlite3
+import sys
+import threading
+from typing import Iterator, List, Optional
+
+import numpy as np
+from loguru import logger
+
+import src.settings  # noqa: F401  (loads .env before the settings below are read)
+from src.embeddings import LOCAL_EMBEDDING_DIM, hashed_embedding, l2_normalize
+
+MAX_CHUNK_WORDS = 60
+MIN_SCORE = 0.15
+USDA_FACT_DATA_TYPES = ("foundation_food", "sr_legacy_food", "Foundation", "SR Legacy")
+# Nutrient IDs summarized per food when facts are generated from the local USDA index
+USDA_FACT_NUTRIENTS = {
+    1008: "calories", 1003: "g protein", 1004: "g fat", 1005: "g carbohydrates",
+    1079: "g fiber", 2000: "g sugar", 1093: "mg sodium", 1092: "mg potassium",
+}
+
+
+def _chunk_line(line: str) -> Iterator[str]:
+    words = line.split()
+    for start in range(0, len(words), MAX_CHUNK_WORDS):
+        yield " ".join(words[start:start + MAX_CHUNK_WORDS])
+
+
+def load_fact_chunks(source_dir: str) -> List[str]:
+    chunks = []
+    for path in sorted(glob.glob(os.path.join(source_dir, "*.txt"))):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    chunks.extend(_chunk_line(line.strip()))
+    return chunks
+
+
+def usda_fact_chunks(index_path: str) -> Iterator[str]:
+    """
+    One short fact per Foundation/SR Legacy food in the offline USDA index, per 100 g.
+    """
+    conn = sqlite3.connect(f"file:{index_path}?mode=ro", uri=True)
+    placeholders = ",".join("?" * len(USDA_FACT_NUTRIENTS))
+    types = ",".join("?" * len(USDA_FACT_DATA_TYPES))
+    rows = conn.execute(
+        f"SELECT foods.fdc_id, foods.description, food_nutrients.nutrient_id, food_nutrients.amount "
+        f"FROM foods JOIN food_nutrients ON food_nutrients.fdc_id = foods.fdc_id "
+        f"WHERE foods.data_type IN ({types}) AND food_nutrients.nutrient_id IN ({placeholders}) "
+        f"ORDER BY foods.fdc_id",
+        (*USDA_FACT_DATA_TYPES, *USDA_FACT_NUTRIENTS),
+    )
+    current, description, parts = None, None, []
+    for fdc_id, food_description, nutrient_id, amount in rows:
+        if fdc_id != current:
+            if parts:
+                yield f"{description} (per 100 g): {', '.join(parts)}."
+            current, description, parts = fdc_id, food_description, []
+        if amount is not None:
+            parts.append(f"{amount:g} {USDA_FACT_NUTRIENTS[nutrient_id]}")
+    if parts:
+        yield f"{description} (per 100 g): {', '.join(parts)}."
+    conn.close()
+
+
+def build_fact_index(chunks: List[str], index_dir: str, dim: int = LOCAL_EMBEDDING_DIM) -> None:
+    counts = np.zeros((len(chunks), dim), dtype=np.float32)
+    for row, chunk in enumerate(chunks):
+        counts[row] = hashed_embedding(chunk, dim, normalize=False)
+    document_frequency = np.count_nonzero(counts, axis=0)
+    idf = np.log((1 + len(chunks)) / (1 + document_frequency)).astype(np.float32) + 1.0
+    vectors = l2_normalize(counts * idf)
+
+    os.makedirs(index_dir, exist_ok=True)
+    np.save(os.path.join(index_dir, "fact_vectors.npy"), vectors)
+    np.save(os.path.join(index_dir, "fact_idf.npy"), idf)
+    with open(os.path.join(index_dir, "fact_chunks.json"), "w", encoding="utf-8") as f:
+        json.dump(chunks, f)
+    logger.info(f"Built fact index with {len(chunks)} chunks in {index_dir}")
+
+
+def build_from_sources(source_dir: str, index_dir: str, usda_index: Optional[str] = None) -> int:
+    """
+    Indexes the fact files, plus per-food facts from the offline USDA index when one is given, and
+    records those options so an automatic rebuild indexes the same sources. Returns the chunk count.
+    """
+    chunks = load_fact_chunks(source_dir)
+    if usda_index:
+        chunks.extend(usda_fact_chunks(usda_index))
+    build_fact_index(chunks, index_dir)
+    with open(os.path.join(index_dir, "fact_build.json"), "w", encoding="utf-8") as f:
+        json.dump({"usda_index": usda_index}, f)
+    return len(chunks)
+
+
+def read_build_options(index_dir: str) -> dict:
+    try:
+        with open(os.path.join(index_dir, "fact_build.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+class FactIndex:
+    """
+    Memory-mapped similarity index over fact chunks. Loaded (and built if missing or stale) on first search.
+    """
+
+    def __init__(self, index_dir: str, source_dir: str):
+        self.index_dir = index_dir
+        self.source_dir = source_dir
+        self._vectors: Optional[np.ndarray] = None
+        self._idf: Optional[np.ndarray] = None
+        self._chunks: List[str] = []
+        self._lock = threading.Lock()
+
+    def _is_stale(self) -> bool:
+        vectors_path = os.path.join(self.index_dir, "fact_vectors.npy")
+        if not os.path.exists(vectors_path):
+            return True
+        built_at = os.path.getmtime(vectors_path)
+        return any(os.path.getmtime(path) > built_at
+                   for path in glob.glob(os.path.join(self.source_dir, "*.txt")))
+
+    def _rebuild(self) -> None:
+        usda_index = read_build_options(self.index_dir).get("usda_index")
+        if usda_index and not os.path.exists(usda_index):
+            if os.path.exists(os.path.join(self.index_dir, "fact_vectors.npy")):
+                logger.warning(f"Fact files changed but the USDA index {usda_index} the fact index was built with "
+                               f"is missing; keeping the current fact index")
+                return
+            usda_index = None
+        build_from_sources(self.source_dir, self.index_dir, usda_index)
+
+    def load(self) -> None:
+        with self._lock:
+            if self._vectors is not None:
+                return
+            if self._is_stale():
+                self._rebuild()
+            self._vectors = np.load(os.path.join(self.index_dir, "fact_vectors.npy"), mmap_mode="r")
+            self._idf = np.load(os.path.join(self.index_dir, "fact_idf.npy"))
+            with open(os.path.join(self.index_dir, "fact_chunks.json"), encoding="utf-8") as f:
+                self._chunks = json.load(f)
+
+    def search(self, text: str, k: int = 3, min_score: float = MIN_SCORE) -> List[str]:
+        """
+        Returns up to k fact chunks most similar to the text, best first.
+        """
+        try:
+            self.load()
+        except (OSError, ValueError) as e:
+            logger.error(f"Fact index unavailable: {str(e)}")
+            return []
+        if not self._chunks:
+            return []
+        query = l2_normalize(hashed_embedding(text, self._vectors.shape[1], normalize=False) * self._idf)
+        scores = self._vectors @ query
+        k = min(k, len(scores))
+        top = np.argpartition(scores, -k)[-k:]
+        top = top[np.argsort(scores[top])[::-1]]
+        return [self._chunks[i] for i in top if scores[i] >= min_score]
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description="Local nutrition fact retrieval index")
+    parser.add_argument("--index-dir", default=os.getenv("FACT_INDEX_DIR", "data/index"))
+    parser.add_argument("--source-dir", default=os.getenv("FACT_SOURCE_DIR", "data"))
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_cmd = commands.add_parser("build", help="Chunk and index the fact files")
+    build_cmd.add_argument("--include-usda", action="store_true",
+                           help="Also index per-food facts from the offline USDA index")
+    build_cmd.add_argument("--usda-index", default=os.getenv("USDA_LOCAL_INDEX_PATH", "data/usda/fdc_index.sqlite3"))
+    search_cmd = commands.add_parser("search", help="Show the facts retrieved for a question")
+    search_cmd.add_argument("question")
+    search_cmd.add_argument("-k", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        count = build_from_sources(args.source_dir, args.index_dir, args.usda_index if args.include_usda else None)
+        print(f"Indexed {count} fact chunks into {args.index_dir}")
+        return 0
+
+    for fact in FactIndex(args.index_dir, args.source_dir).search(args.question, k=args.k):
+        print(f"- {fact}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,194 @@
+"""
+Admission control in front of the LLM: a concurrency cap, a bounded wait queue with per-client fairness
+and priorities, and queueing deadlines.
+
+At most LLM_MAX_CONCURRENCY answers are generated at once. Further requests wait in a queue of at most
+LLM_QUEUE_SIZE entries; a client may hold at most LLM_MAX_QUEUED_PER_CLIENT of them. Free slots go to the
+highest priority first and, within a priority, to waiting clients in turn, so one busy client cannot starve
+the others. A request that has not started within LLM_QUEUE_TIMEOUT seconds is dropped rather than
+generated for a caller that has likely given up. Rejected requests fail fast with LLMOverloadedError,
+which carries the HTTP status (429 for a client over its share, 503 otherwise) and a Retry-After estimate.
+"""
+import asyncio
+import collections
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, Optional
+
+import src.settings  # noqa: F401  (loads .env before the settings below are read)
+from src.metrics import Counter, Gauge, Histogram
+from src.upstream import OLLAMA_MAX_CONCURRENCY
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", str(OLLAMA_MAX_CONCURRENCY)))
+LLM_QUEUE_SIZE = int(os.getenv("LLM_QUEUE_SIZE", "32"))
+LLM_MAX_QUEUED_PER_CLIENT = int(os.getenv("LLM_MAX_QUEUED_PER_CLIENT", "8"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))
+# Starting guess for how long one generation holds a slot, refined from observed generations
+LLM_EXPECTED_SERVICE_TIME = float(os.getenv("LLM_EXPECTED_SERVICE_TIME", "10"))
+
+# Priorities: lower is dispatched first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+
+llm_queue_depth = Gauge("llm_queue_depth", "Requests waiting for an LLM generation slot")
+llm_queue_wait = Histogram("llm_queue_wait_seconds", "Time spent waiting for an LLM generation slot by outcome")
+llm_requests_rejected = Counter("llm_requests_rejected_total", "LLM requests turned away by reason")
+
+
+class LLMOverloadedError(Exception):
+    """
+    Raised instead of queueing an LLM request the scheduler cannot serve in time.
+    """
+
+    def __init__(self, message: str, status_code: int, retry_after: float):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("client", "future", "enqueued_at")
+
+    def __init__(self, client: str, future: asyncio.Future):
+        self.client = client
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class Lease:
+    """
+    One generation slot. Releasing it twice is harmless, so it can be released from several cleanup paths.
+    """
+
+    def __init__(self, scheduler: "LLMScheduler"):
+        self._scheduler = scheduler
+        self._acquired_at = time.monotonic()
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._scheduler._release(time.monotonic() - self._acquired_at)
+
+
+class LLMScheduler:
+    """
+    Hands out generation slots; see the module docstring for the policy.
+    """
+
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY, max_queue: int = LLM_QUEUE_SIZE,
+                 max_queued_per_client: int = LLM_MAX_QUEUED_PER_CLIENT, queue_timeout: float = LLM_QUEUE_TIMEOUT,
+                 expected_service_time: float = LLM_EXPECTED_SERVICE_TIME):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max_queue
+        self.max_queued_per_client = max_queued_per_client
+        self.queue_timeout = queue_timeout
+        self.service_time = expected_service_time
+        self.active = 0
+        self.queued = 0
+        # priority -> client -> waiters; a client's position in its OrderedDict is its turn
+        self._queues: Dict[int, "collections.OrderedDict[str, Deque[_Waiter]]"] = {}
+        self._queued_by_client = collections.Counter()
+
+    def retry_after(self) -> float:
+        """
+        Seconds until the current backlog is likely to have drained.
+        """
+        backlog = self.active + self.queued
+        return max(1.0, math.ceil(self.service_time * backlog / self.max_concurrency))
+
+    def _reject(self, reason: str, message: str, status_code: int) -> LLMOverloadedError:
+        llm_requests_rejected.inc(reason=reason)
+        return LLMOverloadedError(message, status_code, self.retry_after())
+
+    async def acquire(self, client: str = "anonymous", priority: int = PRIORITY_INTERACTIVE,
+                      timeout: Optional[float] = None) -> Lease:
+        """
+        Waits for a generation slot for at most `timeout` seconds (default: queue_timeout).
+        Raises LLMOverloadedError when the queue is full or the wait times out.
+        """
+        if self.active < self.max_concurrency and not self.queued:
+            self.active += 1
+            llm_queue_wait.observe(0.0, outcome="admitted")
+            return Lease(self)
+        if self.queued >= self.max_queue:
+            raise self._reject("queue_full", "The answer service is at capacity, please retry later.", 503)
+        if self._queued_by_client[client] >= self.max_queued_per_client:
+            raise self._reject("client_limit", "Too many questions waiting for this client, please retry later.", 429)
+
+        waiter = _Waiter(client, asyncio.get_running_loop().create_future())
+        self._queues.setdefault(priority, collections.OrderedDict()).setdefault(client, collections.deque()).append(waiter)
+        self.queued += 1
+        self._queued_by_client[client] += 1
+        try:
+            # asyncio.wait neither cancels the future on timeout nor swallows a cancellation that races the handover
+            await asyncio.wait([waiter.future], timeout=self.queue_timeout if timeout is None else timeout)
+        except asyncio.CancelledError:
+            if waiter.future.done():
+                # The slot was handed over just as the caller went away; pass it on
+                self._release()
+            else:
+                self._remove(priority, waiter)
+            raise
+        if not waiter.future.done():
+            self._remove(priority, waiter)
+            llm_queue_wait.observe(time.monotonic() - waiter.enqueued_at, outcome="expired")
+            raise self._reject("deadline", "The answer service is busy and the question timed out in the queue.", 503)
+        llm_queue_wait.observe(time.monotonic() - waiter.enqueued_at, outcome="admitted")
+        return Lease(self)
+
+    @asynccontextmanager
+    async def slot(self, client: str = "anonymous", priority: int = PRIORITY_INTERACTIVE,
+                   timeout: Optional[float] = None) -> AsyncIterator[None]:
+        lease = await self.acquire(client, priority, timeout)
+        try:
+            yield
+        finally:
+            lease.release()
+
+    def _remove(self, priority: int, waiter: _Waiter) -> None:
+        clients = self._queues[priority]
+        waiters = clients[waiter.client]
+        waiters.remove(waiter)
+        if not waiters:
+            del clients[waiter.client]
+        self._dequeued(waiter)
+
+    def _dequeued(self, waiter: _Waiter) -> None:
+        self.queued -= 1
+        self._queued_by_client[waiter.client] -= 1
+        if not self._queued_by_client[waiter.client]:
+            del self._queued_by_client[waiter.client]
+
+    def _next_waiter(self) -> Optional[_Waiter]:
+        for priority in sorted(self._queues):
+            clients = self._queues[priority]
+            if not clients:
+                continue
+            client, waiters = next(iter(clients.items()))
+            waiter = waiters.popleft()
+            if waiters:
+                clients.move_to_end(client)
+            else:
+                del clients[client]
+            self._dequeued(waiter)
+            return waiter
+        return None
+
+    def _release(self, held_for: Optional[float] = None) -> None:
+        if held_for is not None:
+            # Exponentially weighted average of slot hold times, for Retry-After
+            self.service_time += 0.2 * (held_for - self.service_time)
+        waiter = self._next_waiter()
+        if waiter is None:
+            self.active -= 1
+        else:
+            # The slot passes straight to the next waiter, so active stays the same
+            waiter.future.set_result(None)
+
+
+llm_scheduler = LLMScheduler()
+llm_queue_depth.set_function(lambda: llm_scheduler.queued)
@@ -0,0 +1,84 @@
+from typing import List, Optional
+
+from pydantic import BaseModel, Field
+
+
+class Nutrient(BaseModel):
+    id: Optional[int] = None
+    name: str
+    amount: Optional[float] = None
+    unit: str = ""
+
+
+class Macros(BaseModel):
+    """
+    Canonical macro block, per 100 g as reported by USDA. Missing values are null.
+    """
+    calories: Optional[float] = None
+    protein_g: Optional[float] = None
+    fat_g: Optional[float] = None
+    carbohydrates_g: Optional[float] = None
+    fiber_g: Optional[float] = None
+    sugar_g: Optional[float] = None
+    sodium_mg: Optional[float] = None
+    cholesterol_mg: Optional[float] = None
+
+
+class NutritionReport(BaseModel):
+    food: str
+    fdc_id: int
+    description: str = ""
+    macros: Macros
+    nutrients: List[Nutrient]
+
+
+class BatchAnalyzeRequest(BaseModel):
+    foods: List[str] = Field(..., min_length=1, max_length=100)
+
+
+class BatchAnalyzeItem(BaseModel):
+    food: str
+    status_code: int = 200
+    report: Optional[NutritionReport] = None
+    error: Optional[str] = None
+
+
+class BatchAnalyzeResponse(BaseModel):
+    results: List[BatchAnalyzeItem]
+
+
+class MealItem(BaseModel):
+    food: str
+    quantity: float = Field(100.0, gt=0)
+    unit: str = "g"
+
+
+class MealAnalyzeRequest(BaseModel):
+    items: List[MealItem] = Field(..., min_length=1, max_length=100)
+
+
+class MealItemResult(BaseModel):
+    food: str
+    quantity: float
+    unit: str
+    status_code: int = 200
+    fdc_id: Optional[int] = None
+    grams: Optional[float] = None
+    macros: Optional[Macros] = None
+    error: Optional[str] = None
+
+
+class MealAnalyzeResponse(BaseModel):
+    items: List[MealItemResult]
+    totals: Macros
+
+
+class FoodSuggestion(BaseModel):
+    fdc_id: int
+    name: str
+    score: float
+
+
+class FoodSuggestResponse(BaseModel):
+    query: str
+    suggestions: List[FoodSuggestion]
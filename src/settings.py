@@ -0,0 +1,9 @@
+"""
+Configuration comes from environment variables, which each module reads into constants when it is
+imported. Importing this module loads .env into the environment first (variables that are already set
+win), so every module that reads configuration imports it before anything else of its own. That way .env
+applies however the code is entered: the API, serve.py, the CLIs or a direct import of src.ai_model.
+"""
+from dotenv import load_dotenv
+
+load_dotenv()
@@ -0,0 +1,237 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, AsyncIterator, Optional
+
+import httpx
+
+import src.settings  # noqa: F401  (loads .env before the settings below are read)
+from src.resilience import (
+    RETRY_STATUSES,
+    CircuitBreaker,
+    RetryPolicy,
+    upstream_circuit_open,
+    upstream_errors,
+    upstream_in_flight,
+    upstream_request_duration,
+    upstream_retries,
+)
+
+if TYPE_CHECKING:
+    import requests
+
+# Upstream HTTP configuration
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "50"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "20"))
+USDA_READ_TIMEOUT = float(os.getenv("USDA_READ_TIMEOUT", "15"))
+USDA_MAX_CONCURRENCY = int(os.getenv("USDA_MAX_CONCURRENCY", "20"))
+USDA_MAX_ATTEMPTS = int(os.getenv("USDA_MAX_ATTEMPTS", "3"))
+OLLAMA_READ_TIMEOUT = float(os.getenv("OLLAMA_READ_TIMEOUT", "300"))
+OLLAMA_MAX_CONCURRENCY = int(os.getenv("OLLAMA_MAX_CONCURRENCY", "4"))
+OLLAMA_MAX_ATTEMPTS = int(os.getenv("OLLAMA_MAX_ATTEMPTS", "1"))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "0.25"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "4"))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "30"))
+
+
+class _Upstream:
+    """
+    Retry and circuit-breaker bookkeeping shared by the sync and async clients of one upstream service.
+    """
+
+    def __init__(self, name: str, read_timeout: float, max_attempts: int):
+        self.name = name
+        self.read_timeout = read_timeout
+        self.retry = RetryPolicy(max_attempts, RETRY_BASE_DELAY, RETRY_MAX_DELAY)
+        self.breaker = CircuitBreaker(name, BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT)
+
+    def _record_error(self, start: float, e: Exception) -> None:
+        upstream_request_duration.observe(time.perf_counter() - start, upstream=self.name, outcome="error")
+        upstream_errors.inc(upstream=self.name, kind=type(e).__name__)
+        self.breaker.record_failure()
+
+    def _record_response(self, start: float, status_code: int) -> bool:
+        """
+        Records one attempt and returns True when its status is worth retrying.
+        """
+        upstream_request_duration.observe(
+            time.perf_counter() - start, upstream=self.name, outcome=f"{status_code // 100}xx"
+        )
+        if status_code in RETRY_STATUSES:
+            upstream_errors.inc(upstream=self.name, kind=str(status_code))
+            self.breaker.record_failure()
+            return True
+        self.breaker.record_success()
+        return False
+
+
+class SyncUpstream(_Upstream):
+    """
+    Pooled keep-alive requests.Session for one upstream service, with jittered exponential backoff on
+    429/5xx and connection errors, and a circuit breaker that fails fast while the service is down.
+    requests is imported on first use: the API itself only uses AsyncUpstream.
+    """
+
+    def __init__(self, name: str, read_timeout: float, max_attempts: int, pool_size: int):
+        super().__init__(name, read_timeout, max_attempts)
+        self.pool_size = pool_size
+        self._session: Optional["requests.Session"] = None
+
+    @property
+    def session(self) -> "requests.Session":
+        if self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            self._session = session
+        return self._session
+
+    def request(self, method: str, url: str, **kwargs) -> "requests.Response":
+        import requests
+
+        kwargs.setdefault("timeout", (HTTP_CONNECT_TIMEOUT, self.read_timeout))
+        for attempt in range(1, self.retry.max_attempts + 1):
+            trial = self.breaker.check()
+            start = time.perf_counter()
+            try:
+                with upstream_in_flight.track_inprogress(upstream=self.name):
+                    response = self.session.request(method, url, **kwargs)
+            except requests.exceptions.RequestException as e:
+                self._record_error(start, e)
+                if attempt == self.retry.max_attempts:
+                    raise
+                upstream_retries.inc(upstream=self.name)
+                time.sleep(self.retry.delay(attempt))
+                continue
+            except BaseException:
+                if trial:
+                    self.breaker.release_trial()
+                raise
+            if not self._record_response(start, response.status_code) or attempt == self.retry.max_attempts:
+                return response
+            upstream_retries.inc(upstream=self.name)
+            time.sleep(self.retry.delay(attempt, response.headers.get("Retry-After")))
+        raise AssertionError("unreachable")
+
+    def close(self) -> None:
+        if self._session is not None:
+            self._session.close()
+        self._session = None
+
+
+class AsyncUpstream(_Upstream):
+    """
+    Pooled keep-alive HTTP client for one upstream service, with a cap on in-flight requests and the
+    same retry and circuit-breaker policy as SyncUpstream. The client is created on first use so it
+    binds to the running event loop.
+    """
+
+    def __init__(self, name: str, read_timeout: float, max_attempts: int, max_concurrency: int,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        super().__init__(name, read_timeout, max_attempts)
+        self.max_concurrency = max_concurrency
+        self.transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.read_timeout, connect=HTTP_CONNECT_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                ),
+                transport=self.transport,
+            )
+        return self._client
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        for attempt in range(1, self.retry.max_attempts + 1):
+            trial = self.breaker.check()
+            start = time.perf_counter()
+            try:
+                async with self.semaphore:
+                    with upstream_in_flight.track_inprogress(upstream=self.name):
+                        response = await self.client.request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                self._record_error(start, e)
+                if attempt == self.retry.max_attempts:
+                    raise
+                upstream_retries.inc(upstream=self.name)
+                await asyncio.sleep(self.retry.delay(attempt))
+                continue
+            except BaseException:
+                # Cancelled (e.g. the client went away) or a non-transport error: no verdict on the upstream
+                if trial:
+                    self.breaker.release_trial()
+                raise
+            if not self._record_response(start, response.status_code) or attempt == self.retry.max_attempts:
+                return response
+            upstream_retries.inc(upstream=self.name)
+            await asyncio.sleep(self.retry.delay(attempt, response.headers.get("Retry-After")))
+        raise AssertionError("unreachable")
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, **kwargs) -> AsyncIterator[httpx.Response]:
+        """
+        Streams a response body without retries. The concurrency slot is held until the stream is closed.
+        """
+        trial = self.breaker.check()
+        start = time.perf_counter()
+        recorded = False
+        try:
+            async with self.semaphore:
+                with upstream_in_flight.track_inprogress(upstream=self.name):
+                    async with self.client.stream(method, url, **kwargs) as response:
+                        self._record_response(start, response.status_code)
+                        recorded = True
+                        yield response
+        except httpx.TransportError as e:
+            self._record_error(start, e)
+            recorded = True
+            raise
+        finally:
+            if trial and not recorded:
+                self.breaker.release_trial()
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+        self._client = None
+        self._semaphore = None
+
+
+usda_upstream = AsyncUpstream("usda", USDA_READ_TIMEOUT, USDA_MAX_ATTEMPTS, USDA_MAX_CONCURRENCY)
+ollama_upstream = AsyncUpstream("ollama", OLLAMA_READ_TIMEOUT, OLLAMA_MAX_ATTEMPTS, OLLAMA_MAX_CONCURRENCY)
+usda_sync_upstream = SyncUpstream("usda", USDA_READ_TIMEOUT, USDA_MAX_ATTEMPTS, HTTP_POOL_SIZE)
+ollama_sync_upstream = SyncUpstream("ollama", OLLAMA_READ_TIMEOUT, OLLAMA_MAX_ATTEMPTS, HTTP_POOL_SIZE)
+
+# The sync and async clients of a service share one breaker so either sees the other's failures
+usda_sync_upstream.breaker = usda_upstream.breaker
+ollama_sync_upstream.breaker = ollama_upstream.breaker
+
+for _upstream in (usda_upstream, ollama_upstream):
+    upstream_circuit_open.set_function(lambda breaker=_upstream.breaker: breaker.state == "open", upstream=_upstream.name)
+
+
+async def close_upstream_clients() -> None:
+    await usda_upstream.aclose()
+    await ollama_upstream.aclose()
+    usda_sync_upstream.close()
+    ollama_sync_upstream.close()
@@ -0,0 +1,420 @@
+"""
+Offline USDA FoodData Central index.
+
+Loads a FoodData Central bulk download (the CSV directory or one of the JSON files) into a
+SQLite store with a prefix-enabled full-text index on food descriptions and a food x nutrient
+table clustered by FDC ID, so lookups need no network:
+
+    python -m src.usda_index import path/to/FoodData_Central_csv_2024-04-18
+    python -m src.usda_index import path/to/FoodData_Central_foundation_food_json_2024-04-18.json
+    python -m src.usda_index search "banana"
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+from typing import Iterable, Iterator, Optional
+
+from loguru import logger
+
+import src.settings  # noqa: F401  (loads .env before the settings below are read)
+from src.food_resolver import DATA_TYPE_RANK, normalize_name, same_food
+from src.nutrients import normalize_portion, to_amount
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS foods (
+    fdc_id INTEGER PRIMARY KEY,
+    description TEXT NOT NULL,
+    data_type TEXT
+);
+CREATE TABLE IF NOT EXISTS nutrients (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    unit_name TEXT
+);
+CREATE TABLE IF NOT EXISTS food_nutrients (
+    fdc_id INTEGER NOT NULL,
+    nutrient_id INTEGER NOT NULL,
+    amount REAL,
+    PRIMARY KEY (fdc_id, nutrient_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS food_portions (
+    fdc_id INTEGER NOT NULL,
+    unit TEXT NOT NULL,
+    gram_weight REAL NOT NULL,
+    PRIMARY KEY (fdc_id, unit)
+) WITHOUT ROWID;
+CREATE VIRTUAL TABLE IF NOT EXISTS foods_fts USING fts5(
+    description, content='foods', content_rowid='fdc_id', prefix='2 3'
+);
+"""
+
+BATCH_SIZE = 50_000
+# Full-text matches lookup() considers before deciding there is no confident local answer
+LOOKUP_CANDIDATES = 50
+BRANDED_DATA_TYPES = ("branded_food", "Branded")
+# Restricts a query on foods to non-branded data types; bind BRANDED_DATA_TYPES to its placeholders
+_NOT_BRANDED_SQL = f"data_type IS NULL OR data_type NOT IN ({', '.join('?' * len(BRANDED_DATA_TYPES))})"
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def _fts_query(text: str) -> Optional[str]:
+    """
+    Turns free text into an FTS5 query where every token must match as a prefix.
+    """
+    tokens = _TOKEN_RE.findall(text.lower())
+    if not tokens:
+        return None
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+class LocalFoodIndex:
+    """
+    Read side of the offline index. Returns foods in the same shape as a trimmed USDA details response.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    @property
+    def available(self) -> bool:
+        return os.path.exists(self.path)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        # Thread-locals survive fork(), so a worker must not reuse a connection opened by its parent;
+        # an import swaps in a new file, which the next lookup opens instead of the replaced one
+        inode = os.stat(self.path).st_ino
+        if conn is None or getattr(self._local, "pid", None) != os.getpid() or self._local.inode != inode:
+            if conn is not None and self._local.pid == os.getpid():
+                conn.close()
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+            self._local.inode = inode
+        return conn
+
+    def search(self, query: str, limit: int = 5) -> list:
+        fts_query = _fts_query(query)
+        if not fts_query or not self.available:
+            return []
+        rows = self._connection().execute(
+            "SELECT foods.fdc_id, foods.description, foods.data_type FROM foods_fts "
+            "JOIN foods ON foods.fdc_id = foods_fts.rowid "
+            "WHERE foods_fts MATCH ? ORDER BY foods_fts.rank LIMIT ?",
+            (fts_query, limit),
+        ).fetchall()
+        return [{"fdcId": fdc_id, "description": description, "dataType": data_type}
+                for fdc_id, description, data_type in rows]
+
+    def get_food(self, fdc_id: int) -> Optional[dict]:
+        if not self.available:
+            return None
+        conn = self._connection()
+        food = conn.execute("SELECT description FROM foods WHERE fdc_id = ?", (fdc_id,)).fetchone()
+        if food is None:
+            return None
+        rows = conn.execute(
+            "SELECT nutrients.id, nutrients.name, nutrients.unit_name, food_nutrients.amount "
+            "FROM food_nutrients JOIN nutrients ON nutrients.id = food_nutrients.nutrient_id "
+            "WHERE food_nutrients.fdc_id = ?",
+            (fdc_id,),
+        ).fetchall()
+        portions = conn.execute(
+            "SELECT unit, gram_weight FROM food_portions WHERE fdc_id = ?", (fdc_id,)
+        ).fetchall()
+        return {
+            "fdcId": fdc_id,
+            "description": food[0],
+            "foodNutrients": [
+                {"nutrient": {"id": nutrient_id, "name": name, "unitName": unit_name or ""}, "amount": amount}
+                for nutrient_id, name, unit_name, amount in rows
+            ],
+            "foodPortions": [{"unit": unit, "gramWeight": gram_weight} for unit, gram_weight in portions],
+        }
+
+    def iter_foods(self, include_branded: bool = False) -> Iterator[tuple]:
+        """
+        Yields (description, fdc_id, data_type) for every indexed food, optionally skipping branded products.
+        """
+        if not self.available:
+            return
+        sql, params = "SELECT description, fdc_id, data_type FROM foods", ()
+        if not include_branded:
+            sql, params = f"{sql} WHERE {_NOT_BRANDED_SQL}", BRANDED_DATA_TYPES
+        yield from self._connection().execute(sql, params)
+
+    def iter_food_details(self, include_branded: bool = False) -> Iterator[tuple]:
+        """
+        Yields (food, data_type) for every indexed food in FDC ID order, each food shaped like get_food.
+        Foods, nutrient values and portions are read as three cursors in FDC ID order and merged, so memory
+        stays flat however large the index is. Uses its own connection, so it may be consumed across threads.
+        """
+        if not self.available:
+            return
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+        try:
+            sql, params = "SELECT fdc_id, description, data_type FROM foods", ()
+            if not include_branded:
+                sql, params = f"{sql} WHERE {_NOT_BRANDED_SQL}", BRANDED_DATA_TYPES
+            foods = conn.execute(f"{sql} ORDER BY fdc_id", params)
+            values = conn.execute(
+                "SELECT food_nutrients.fdc_id, nutrients.id, nutrients.name, nutrients.unit_name, food_nutrients.amount "
+                "FROM food_nutrients JOIN nutrients ON nutrients.id = food_nutrients.nutrient_id "
+                "ORDER BY food_nutrients.fdc_id"
+            )
+            portions = conn.execute("SELECT fdc_id, unit, gram_weight FROM food_portions ORDER BY fdc_id")
+            value, portion = next(values, None), next(portions, None)
+            for fdc_id, description, data_type in foods:
+                food_nutrients, food_portions = [], []
+                while value is not None and value[0] <= fdc_id:
+                    if value[0] == fdc_id:
+                        food_nutrients.append({"nutrient": {"id": value[1], "name": value[2], "unitName": value[3] or ""},
+                                               "amount": value[4]})
+                    value = next(values, None)
+                while portion is not None and portion[0] <= fdc_id:
+                    if portion[0] == fdc_id:
+                        food_portions.append({"unit": portion[1], "gramWeight": portion[2]})
+                    portion = next(portions, None)
+                yield {"fdcId": fdc_id, "description": description, "foodNutrients": food_nutrients,
+                       "foodPortions": food_portions}, data_type
+        finally:
+            conn.close()
+
+    def lookup(self, food_item: str, include_branded: bool = False) -> Optional[dict]:
+        """
+        Returns the local food a free-text query names, or None when there is no confident match and the
+        remote search should decide. Matches are held to the food resolver's rule (the same words, give or
+        take qualifiers such as "raw") and generic USDA data is preferred over branded products, which are
+        skipped unless include_branded.
+        """
+        query = normalize_name(food_item)
+        if not query:
+            return None
+        try:
+            matches = [
+                match for match in self.search(food_item, limit=LOOKUP_CANDIDATES)
+                if (include_branded or match["dataType"] not in BRANDED_DATA_TYPES)
+                and same_food(query, normalize_name(match["description"]))
+            ]
+            if not matches:
+                return None
+            # min() keeps the full-text rank order among foods of the same data type
+            best = min(matches, key=lambda match: DATA_TYPE_RANK.get(match["dataType"] or "", 4))
+            return self.get_food(best["fdcId"])
+        except sqlite3.Error as e:
+            logger.error(f"Local USDA index error for '{food_item}': {str(e)}")
+            return None
+
+
+def _batched(rows: Iterable[tuple], size: int = BATCH_SIZE) -> Iterator[list]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _read_csv(path: str) -> Iterator[dict]:
+    with open(path, newline="", encoding="utf-8") as f:
+        yield from csv.DictReader(f)
+
+
+def _open_for_import(db_path: str) -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _insert(conn: sqlite3.Connection, foods: Iterable[tuple], nutrients: Iterable[tuple],
+            food_nutrients: Iterable[tuple], food_portions: Iterable[tuple] = ()) -> None:
+    for batch in _batched(nutrients):
+        conn.executemany("INSERT OR REPLACE INTO nutrients (id, name, unit_name) VALUES (?, ?, ?)", batch)
+    for batch in _batched(foods):
+        conn.executemany("INSERT OR REPLACE INTO foods (fdc_id, description, data_type) VALUES (?, ?, ?)", batch)
+    for batch in _batched(food_nutrients):
+        conn.executemany(
+            "INSERT OR REPLACE INTO food_nutrients (fdc_id, nutrient_id, amount) VALUES (?, ?, ?)", batch
+        )
+    for batch in _batched(food_portions):
+        conn.executemany("INSERT OR REPLACE INTO food_portions (fdc_id, unit, gram_weight) VALUES (?, ?, ?)", batch)
+
+
+def _finish_import(conn: sqlite3.Connection) -> dict:
+    conn.execute("INSERT INTO foods_fts (foods_fts) VALUES ('rebuild')")
+    conn.commit()
+    conn.execute("ANALYZE")
+    counts = {
+        table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        for table in ("foods", "nutrients", "food_nutrients", "food_portions")
+    }
+    conn.close()
+    return counts
+
+
+class IndexImport:
+    """
+    Adds foods to the index at db_path without touching the file readers have open: the import is written
+    to a copy next to it, with journaling off for speed, and swapped in with os.replace once it is complete.
+    If the import fails, the copy is deleted and the index is left as it was.
+
+        with IndexImport(db_path) as index_import:
+            index_import.insert(foods, nutrients, food_nutrients, food_portions)
+        print(index_import.counts)
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.counts: Optional[dict] = None
+        self._build_path = f"{db_path}.import-{os.getpid()}"
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def __enter__(self) -> "IndexImport":
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        if os.path.exists(self._build_path):
+            os.remove(self._build_path)
+        if os.path.exists(self.db_path):
+            # The backup API copies a consistent snapshot even while the API is reading the index
+            source = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+            target = sqlite3.connect(self._build_path)
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+                source.close()
+        self._conn = _open_for_import(self._build_path)
+        return self
+
+    def insert(self, foods: Iterable[tuple], nutrients: Iterable[tuple], food_nutrients: Iterable[tuple],
+               food_portions: Iterable[tuple] = ()) -> None:
+        _insert(self._conn, foods, nutrients, food_nutrients, food_portions)
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        if exc_type is None:
+            self.counts = _finish_import(self._conn)
+            os.replace(self._build_path, self.db_path)
+            return
+        self._conn.close()
+        os.remove(self._build_path)
+
+
+def import_fdc_csv(directory: str, db_path: str) -> dict:
+    """
+    Imports the food.csv, nutrient.csv and food_nutrient.csv files of a FoodData Central CSV download,
+    plus food_portion.csv and measure_unit.csv when present.
+    """
+    foods = (
+        (int(row["fdc_id"]), row["description"], row.get("data_type"))
+        for row in _read_csv(os.path.join(directory, "food.csv"))
+    )
+    nutrients = (
+        (int(row["id"]), row["name"], row.get("unit_name"))
+        for row in _read_csv(os.path.join(directory, "nutrient.csv"))
+    )
+    food_nutrients = (
+        (int(row["fdc_id"]), int(row["nutrient_id"]), to_amount(row.get("amount")))
+        for row in _read_csv(os.path.join(directory, "food_nutrient.csv"))
+    )
+    with IndexImport(db_path) as index_import:
+        index_import.insert(foods, nutrients, food_nutrients, _csv_portions(directory))
+    return index_import.counts
+
+
+def _csv_portions(directory: str) -> Iterator[tuple]:
+    portion_path = os.path.join(directory, "food_portion.csv")
+    if not os.path.exists(portion_path):
+        return
+    measure_units = {}
+    unit_path = os.path.join(directory, "measure_unit.csv")
+    if os.path.exists(unit_path):
+        measure_units = {row["id"]: row["name"] for row in _read_csv(unit_path)}
+    for row in _read_csv(portion_path):
+        portion = normalize_portion(
+            measure_units.get(row.get("measure_unit_id")), row.get("modifier"),
+            row.get("portion_description"), row.get("amount"), row.get("gram_weight"),
+        )
+        if portion:
+            yield int(row["fdc_id"]), portion["unit"], portion["gramWeight"]
+
+
+def import_fdc_json(json_path: str, db_path: str) -> dict:
+    """
+    Imports a FoodData Central JSON download (Foundation, SR Legacy, Survey or Branded foods).
+    """
+    with open(json_path, encoding="utf-8") as f:
+        document = json.load(f)
+    records = []
+    for value in document.values() if isinstance(document, dict) else [document]:
+        if isinstance(value, list):
+            records.extend(value)
+
+    foods, nutrients, food_nutrients, food_portions = [], {}, [], []
+    for record in records:
+        fdc_id = record.get("fdcId")
+        if fdc_id is None:
+            continue
+        foods.append((int(fdc_id), record.get("description", ""), record.get("dataType")))
+        for food_nutrient in record.get("foodNutrients", []):
+            nutrient = food_nutrient.get("nutrient", {})
+            if nutrient.get("id") is None:
+                continue
+            nutrients[nutrient["id"]] = (int(nutrient["id"]), nutrient.get("name", ""), nutrient.get("unitName"))
+            food_nutrients.append((int(fdc_id), int(nutrient["id"]), to_amount(food_nutrient.get("amount"))))
+        for food_portion in record.get("foodPortions", []):
+            portion = normalize_portion(
+                food_portion.get("measureUnit", {}).get("name"), food_portion.get("modifier"),
+                food_portion.get("portionDescription"), food_portion.get("amount"), food_portion.get("gramWeight"),
+            )
+            if portion:
+                food_portions.append((int(fdc_id), portion["unit"], portion["gramWeight"]))
+
+    with IndexImport(db_path) as index_import:
+        index_import.insert(foods, nutrients.values(), food_nutrients, food_portions)
+    return index_import.counts
+
+
+def import_fdc(source: str, db_path: str) -> dict:
+    if os.path.isdir(source):
+        return import_fdc_csv(source, db_path)
+    return import_fdc_json(source, db_path)
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline USDA FoodData Central index")
+    parser.add_argument("--db", default=os.getenv("USDA_LOCAL_INDEX_PATH", "data/usda/fdc_index.sqlite3"))
+    commands = parser.add_subparsers(dest="command", required=True)
+    import_cmd = commands.add_parser("import", help="Load a FoodData Central CSV directory or JSON file")
+    import_cmd.add_argument("source")
+    search_cmd = commands.add_parser("search", help="Search the local index")
+    search_cmd.add_argument("query")
+    search_cmd.add_argument("--limit", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    if args.command == "import":
+        counts = import_fdc(args.source, args.db)
+        print(f"Imported {counts['foods']} foods, {counts['nutrients']} nutrients, "
+              f"{counts['food_nutrients']} food nutrient values and {counts['food_portions']} portions into {args.db}")
+        return 0
+
+    index = LocalFoodIndex(args.db)
+    if not index.available:
+        print(f"No local index at {args.db}", file=sys.stderr)
+        return 1
+    for match in index.search(args.query, limit=args.limit):
+        print(f"{match['fdcId']}\t{match['description']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
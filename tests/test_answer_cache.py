@@ -0,0 +1,45 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from src.answer_cache import AnswerCache
+from src.embeddings import hashed_embedding
+
+
+async def _embed(text: str):
+    return hashed_embedding(text)
+
+
+def _lookup(cached_question: str, question: str, embed=_embed):
+    async def run():
+        cache = AnswerCache(ttl_seconds=60, capacity=8, similarity_threshold=0.9, embed=embed)
+        await cache.set(cached_question, "cached answer")
+        return await cache.get(question)
+
+    return asyncio.run(run())
+
+
+def test_exact_hit_ignores_filler_words_and_plurals():
+    assert _lookup("Which fruits are high in potassium?", "fruit high in potassium") == ("cached answer", "exact")
+
+
+def test_semantic_hit_for_a_rephrased_question():
+    async def same_meaning(text: str):
+        return np.ones(8, dtype=np.float32) / np.sqrt(8)
+
+    assert _lookup("how much protein in boiled eggs", "protein content of a hard boiled egg",
+                   embed=same_meaning) == ("cached answer", "semantic")
+
+
+def test_and_and_or_questions_do_not_share_an_answer():
+    assert _lookup("foods high in iron or zinc", "foods high in iron and zinc") is None
+
+
+@pytest.mark.parametrize("cached_question, question", [
+    ("recommended daily intake of vitamin d for adults", "recommended daily intake of vitamin c for adults"),
+    ("calories for a 30 year old woman", "calories for a 60 year old woman"),
+    ("how much vitamin b12 in salmon", "how much vitamin b6 in salmon"),
+])
+def test_questions_differing_in_numbers_or_letters_are_not_served_each_others_answers(cached_question, question):
+    assert _lookup(cached_question, question) is None
@@ -0,0 +1,98 @@
+import sqlite3
+import time
+
+import pytest
+
+from src.cache import ACCESS_TIME_RESOLUTION, NutritionCache, fdc_key, query_key
+from src.nutrients import FoodNutrients
+
+BANANA = {
+    "fdcId": 173944,
+    "description": "Bananas, raw",
+    "foodNutrients": [
+        {"nutrient": {"id": 1008, "name": "Energy", "unitName": "kcal"}, "amount": 89},
+        {"nutrient": {"id": 1003, "name": "Protein", "unitName": "g"}, "amount": 1.09},
+    ],
+    "foodPortions": [{"unit": "medium", "gramWeight": 118.0}],
+}
+
+
+@pytest.fixture
+def cache(tmp_path) -> NutritionCache:
+    return NutritionCache(str(tmp_path / "cache.sqlite3"), ttl_seconds=3600, max_memory_entries=2, max_disk_entries=100)
+
+
+def test_foods_round_trip_as_records(cache):
+    cache.set(fdc_key(173944), FoodNutrients.from_food_data(BANANA))
+    cache._memory.clear()
+    food = cache.get(fdc_key(173944))
+    assert isinstance(food, FoodNutrients)
+    assert food.macros()["protein_g"] == 1.09
+    assert food.portions == (("medium", 118.0),)
+
+
+def test_entries_in_the_old_format_are_still_read(cache):
+    cache.set(fdc_key(173944), BANANA)
+    cache._memory.clear()
+    assert cache.get(fdc_key(173944)).to_food_data()["foodNutrients"][0]["amount"] == 89.0
+
+
+def test_peek_does_not_count_or_reorder(cache):
+    cache.set(query_key("banana"), {"fdcId": 173944})
+    cache.set(query_key("apple"), {"fdcId": 171688})
+    before = cache.stats()
+    assert cache.peek(query_key("banana")) == {"fdcId": 173944}
+    assert cache.peek(query_key("missing")) is None
+    assert cache.stats() == before
+    # banana is still the least recently used entry, so it is the one evicted
+    cache.set(query_key("egg"), {"fdcId": 171287})
+    assert query_key("banana") not in cache._memory
+
+
+def test_prefetch_checks_do_not_skew_the_hit_ratio(cache, monkeypatch):
+    from src import prefetch
+
+    monkeypatch.setattr(prefetch, "nutrition_cache", cache)
+    cache.set(query_key("banana"), {"fdcId": 173944})
+    cache.set(fdc_key(173944), FoodNutrients.from_food_data(BANANA))
+    before = cache.stats()
+    assert prefetch.Prefetcher(refresh_before=60)._due("banana") == (False, 173944)
+    assert prefetch.Prefetcher(refresh_before=7200)._due("banana") == (True, 173944)
+    assert cache.stats() == before
+
+
+def test_a_write_locked_by_another_worker_does_not_stall_requests(cache):
+    cache.set(query_key("banana"), {"fdcId": 173944})
+    cache._connection().execute("UPDATE entries SET accessed_at = accessed_at - ?", (ACCESS_TIME_RESOLUTION * 2,))
+    cache._connection().commit()
+    cache._memory.clear()
+    other_worker = sqlite3.connect(cache.path)
+    other_worker.execute("BEGIN IMMEDIATE")
+    try:
+        start = time.monotonic()
+        cache.set(query_key("apple"), {"fdcId": 171688})
+        # The disk hit still counts although its LRU timestamp cannot be refreshed
+        assert cache.get(query_key("banana")) == {"fdcId": 173944}
+        assert time.monotonic() - start < 1.0
+    finally:
+        other_worker.rollback()
+        other_worker.close()
+    assert cache.get(query_key("apple")) == {"fdcId": 171688}
+    assert cache.stats()["misses"] == 0
+    cache.set(query_key("egg"), {"fdcId": 171287})
+    cache._memory.clear()
+    assert cache.get(query_key("egg")) == {"fdcId": 171287}
+
+
+def test_popular_foods_are_mined_from_every_lookup_tier(tmp_path):
+    from src.prefetch import mine_popular_foods
+
+    log = tmp_path / "app.log"
+    log.write_text(
+        "2026-01-01 12:00:00.000 | INFO | src.ai_model:_afetch_remote_food_data:1 - Searching USDA for: Banana\n"
+        "2026-01-01 12:00:01.000 | INFO | src.ai_model:store_details:1 - Successfully fetched nutrition data for Banana\n"
+        "2026-01-01 12:00:02.000 | INFO | src.ai_model:_local_food_data:1 - Nutrition cache hit for banana (FDC ID: 173944)\n"
+        "2026-01-01 12:00:03.000 | INFO | src.ai_model:_local_food_data:1 - Local USDA index hit for eggs (FDC ID: 171287)\n",
+        encoding="utf-8",
+    )
+    assert mine_popular_foods([str(log)], top_n=10) == ["banana", "eggs"]
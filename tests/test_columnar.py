@@ -0,0 +1,96 @@
+import os
+
+import pyarrow as pa
+import pytest
+
+from src.cache import NutritionCache, fdc_key, query_key
+from src.columnar import (
+    cache_foods,
+    import_into_cache,
+    import_into_index,
+    index_foods,
+    iter_record_batches,
+    stream_foods,
+    write_foods,
+)
+from src.nutrients import FoodNutrients
+from src.usda_index import LocalFoodIndex
+
+BANANA = {
+    "fdcId": 173944,
+    "description": "Bananas, raw",
+    "foodNutrients": [
+        {"nutrient": {"id": 1003, "name": "Protein", "unitName": "g"}, "amount": 1.09},
+        {"nutrient": {"id": 1008, "name": "Energy", "unitName": "kcal"}, "amount": 89.0},
+        {"nutrient": {"id": 1079, "name": "Fiber, total dietary", "unitName": "g"}, "amount": 2.6},
+    ],
+    "foodPortions": [{"unit": "medium", "gramWeight": 118.0}, {"unit": "cup", "gramWeight": 150.0}],
+}
+
+
+def _cache(path) -> NutritionCache:
+    return NutritionCache(str(path), ttl_seconds=3600, max_memory_entries=0, max_disk_entries=100)
+
+
+@pytest.fixture
+def exported(tmp_path, request):
+    cache = _cache(tmp_path / "source.sqlite3")
+    cache.set(fdc_key(173944), FoodNutrients.from_food_data(BANANA))
+    cache.set(query_key("banana"), {"fdcId": 173944})
+    path = str(tmp_path / f"foods.{request.param}")
+    assert write_foods(iter_record_batches(cache_foods(cache)), path, request.param) == 1
+    return path
+
+
+def _portions(food_data: dict) -> list:
+    return sorted((portion["unit"], portion["gramWeight"]) for portion in food_data["foodPortions"])
+
+
+def _amounts(food_data: dict) -> dict:
+    return {food_nutrient["nutrient"]["id"]: food_nutrient["amount"] for food_nutrient in food_data["foodNutrients"]}
+
+
+@pytest.mark.parametrize("exported", ["parquet", "arrow"], indirect=True)
+def test_export_import_round_trip_through_the_cache(tmp_path, exported):
+    cache = _cache(tmp_path / "target.sqlite3")
+    assert import_into_cache(exported, cache) == 1
+    assert cache.get(query_key("banana")) == {"fdcId": 173944}
+    food = cache.get(fdc_key(173944)).to_food_data()
+    assert food["description"] == "Bananas, raw"
+    assert _amounts(food) == _amounts(BANANA)
+    assert _portions(food) == _portions(BANANA)
+
+
+@pytest.mark.parametrize("exported", ["parquet", "arrow"], indirect=True)
+def test_export_import_round_trip_through_the_index(tmp_path, exported):
+    db_path = str(tmp_path / "index" / "fdc_index.sqlite3")
+    counts = import_into_index(exported, db_path)
+    assert counts["foods"] == 1 and counts["food_nutrients"] == 3
+    index = LocalFoodIndex(db_path)
+    assert _amounts(index.get_food(173944)) == _amounts(BANANA)
+    assert _portions(index.get_food(173944)) == _portions(BANANA)
+    assert [food["fdcId"] for food, _, _ in index_foods(index)] == [173944]
+    assert os.listdir(os.path.dirname(db_path)) == ["fdc_index.sqlite3"]
+
+
+@pytest.mark.parametrize("fmt", ["parquet", "arrow"])
+def test_streamed_export_reads_back(tmp_path, fmt):
+    path = tmp_path / f"streamed.{fmt}"
+    path.write_bytes(b"".join(stream_foods(iter_record_batches([(BANANA, "sr_legacy_food", ["banana"])]), fmt)))
+    cache = _cache(tmp_path / "target.sqlite3")
+    assert import_into_cache(str(path), cache) == 1
+    assert _amounts(cache.get(fdc_key(173944)).to_food_data()) == _amounts(BANANA)
+
+
+@pytest.mark.parametrize("exported", ["parquet"], indirect=True)
+def test_failed_import_leaves_the_live_index_untouched(tmp_path, exported):
+    db_path = str(tmp_path / "fdc_index.sqlite3")
+    import_into_index(exported, db_path)
+    index = LocalFoodIndex(db_path)
+    assert index.get_food(173944)
+    broken = tmp_path / "broken.parquet"
+    broken.write_bytes(open(exported, "rb").read()[:200])
+    with pytest.raises(pa.ArrowInvalid):
+        import_into_index(str(broken), db_path)
+    assert index.get_food(173944)["description"] == "Bananas, raw"
+    assert not [name for name in os.listdir(tmp_path) if ".import-" in name]
@@ -0,0 +1,80 @@
+import threading
+
+import pytest
+
+from src.food_resolver import ADD_MANY_CHUNK, FoodResolver
+
+
+@pytest.fixture
+def resolver() -> FoodResolver:
+    resolver = FoodResolver()
+    resolver.add_many([
+        ("Bananas, raw", 173944, "sr_legacy_food"),
+        ("Eggs, whole, raw, fresh", 171287, "sr_legacy_food"),
+        ("Egg, white, raw, fresh", 172183, "sr_legacy_food"),
+        ("Eggplant, raw", 169228, "sr_legacy_food"),
+        ("BANANA CHIPS", 2000001, "branded_food"),
+    ])
+    for name, fdc_id in [("egg white", 1), ("apple pie", 2), ("chicken breast", 3), ("rice pudding", 4)]:
+        resolver.add(name, fdc_id)
+    return resolver
+
+
+@pytest.mark.parametrize("query, fdc_id", [
+    ("banana", 173944),
+    ("Bananas", 173944),
+    ("banan", 173944),
+    ("egg white", 1),
+    ("eggs whole", 171287),
+    ("aubergine", 169228),
+])
+def test_resolves_the_same_food(resolver, query, fdc_id):
+    assert resolver.resolve(query) == fdc_id
+
+
+@pytest.mark.parametrize("query", ["egg", "apple", "chicken", "rice", "egg yolk", "banana bread"])
+def test_names_with_extra_words_are_not_confident(resolver, query):
+    assert resolver.resolve(query) is None
+
+
+def test_candidates_still_suggest_longer_names(resolver):
+    assert resolver.candidates("apple")[0]["fdc_id"] == 2
+
+
+def test_lookups_are_not_held_up_by_a_bulk_load():
+    resolver = FoodResolver()
+    resolver.add("banana", 173944)
+    results = []
+
+    def lookup():
+        results.append(resolver.resolve("banana"))
+
+    def foods():
+        for i in range(ADD_MANY_CHUNK * 2):
+            if i == ADD_MANY_CHUNK + 1:
+                # Between chunks: another thread's lookup must get the lock
+                thread = threading.Thread(target=lookup)
+                thread.start()
+                thread.join(timeout=5)
+            yield f"Mock food {i}, raw", 1_000_000 + i, "sr_legacy_food"
+
+    resolver.add_many(foods())
+    assert results == [173944]
+    assert len(resolver) == ADD_MANY_CHUNK * 2 + 1
+    assert resolver.resolve("mock food 12345 raw") == 1_012_345
+
+
+def test_resolution_waits_for_the_resolver_to_load(monkeypatch):
+    from src import ai_model
+
+    resolver = FoodResolver()
+    resolver.add("banana", 173944)
+    monkeypatch.setattr(ai_model, "food_resolver", resolver)
+    monkeypatch.setattr(ai_model, "_food_resolver_started", False)
+    monkeypatch.setattr(ai_model, "_food_resolver_loaded", threading.Event())
+    assert ai_model.resolve_fdc_id("banana") is None
+    assert ai_model.suggest_foods("bana")[0]["fdc_id"] == 173944
+    # Lookups skip the resolver rather than load it on the caller's thread
+    assert not ai_model._food_resolver_started
+    ai_model._food_resolver_loaded.set()
+    assert ai_model.resolve_fdc_id("banana") == 173944
@@ -0,0 +1,91 @@
+import asyncio
+import math
+
+import numpy as np
+import pytest
+
+from src.meal_engine import MEAL_NUTRIENTS, MealEngine, PortionError
+from src.nutrients import FoodNutrients
+
+
+def _food(fdc_id: int, description: str, amounts: dict, portions: list) -> FoodNutrients:
+    return FoodNutrients.from_food_data({
+        "fdcId": fdc_id,
+        "description": description,
+        "foodNutrients": [
+            {"nutrient": {"id": nutrient_id, "name": "", "unitName": ""}, "amount": amount}
+            for nutrient_id, amount in amounts.items()
+        ],
+        "foodPortions": [{"unit": name, "gramWeight": grams} for name, grams in portions],
+    })
+
+
+# Amounts per 100 g; the egg reports no fiber, sugar or sodium
+BANANA = _food(173944, "Bananas, raw", {1008: 89, 1003: 1.09, 1004: 0.33, 1005: 22.84, 1079: 2.6, 2000: 12.23, 1093: 1},
+               [('medium (7" to 7-7/8" long)', 118.0), ("cup, sliced", 150.0)])
+EGG = _food(171287, "Eggs, whole, raw, fresh", {1008: 143, 1003: 12.56, 1004: 9.51, 1005: 0.72},
+            [("large", 50.0)])
+
+
+@pytest.fixture
+def engine() -> MealEngine:
+    engine = MealEngine(capacity=1)
+    engine.add_food(BANANA)
+    engine.add_food(EGG)
+    return engine
+
+
+@pytest.mark.parametrize("fdc_id, quantity, unit, grams", [
+    (173944, 150, "g", 150.0),
+    (173944, 2, "oz", 56.699),
+    (173944, 2, "medium", 236.0),
+    (173944, 1, "Cups", 150.0),
+    (171287, 3, "big", 150.0),
+])
+def test_quantities_are_scaled_to_grams(engine, fdc_id, quantity, unit, grams):
+    assert engine.grams_for(fdc_id, quantity, unit) == pytest.approx(grams)
+
+
+def test_unknown_portion_names_the_available_units(engine):
+    with pytest.raises(PortionError, match="large"):
+        engine.grams_for(171287, 1, "slice")
+
+
+def test_totals_sum_the_scaled_items(engine):
+    totals = dict(zip(MEAL_NUTRIENTS, engine.totals([173944, 171287, 173944], [118.0, 100.0, 50.0])))
+    assert totals["calories"] == pytest.approx(89 * 1.68 + 143)
+    assert totals["protein_g"] == pytest.approx(1.09 * 1.68 + 12.56, rel=1e-6)
+
+
+def test_missing_macros_make_totals_unknown(engine):
+    item = dict(zip(MEAL_NUTRIENTS, engine.item_nutrients([171287], [50.0])[0]))
+    assert math.isnan(item["fiber_g"])
+    totals = dict(zip(MEAL_NUTRIENTS, engine.totals([173944, 171287], [100.0, 50.0])))
+    assert math.isnan(totals["fiber_g"])
+    assert not np.isnan(totals["calories"])
+
+
+def test_aggregate_totals_each_group(engine):
+    groups, totals = engine.aggregate([173944, 171287, 173944], [100.0, 100.0, 200.0], ["b", "a", "b"])
+    assert groups.tolist() == ["a", "b"]
+    assert totals[:, 0].tolist() == pytest.approx([143, 267])
+
+
+def test_meal_analysis_reports_missing_macros_as_null(monkeypatch):
+    from src import ai_model
+    from src.schemas import MealItem
+
+    async def fetch(queries):
+        return {"banana": BANANA, "egg": EGG}
+
+    monkeypatch.setattr(ai_model, "_afetch_many_food_data", fetch)
+    response = asyncio.run(ai_model.aanalyze_meal([
+        MealItem(food="banana", quantity=1, unit="medium"),
+        MealItem(food="egg", quantity=2, unit="large"),
+        MealItem(food="banana", quantity=1, unit="slice"),
+    ]))
+    assert [item.grams for item in response.items] == [118.0, 100.0, None]
+    assert response.items[2].status_code == 422
+    assert response.items[1].macros.fiber_g is None
+    assert response.totals.calories == pytest.approx(89 * 1.18 + 143, abs=1e-3)
+    assert response.totals.fiber_g is None
@@ -0,0 +1,90 @@
+import pytest
+
+from src.ai_model import _trim_food_data
+from src.cache import NutritionCache, fdc_key
+from src.nutrients import FoodNutrients
+
+
+def _food_nutrient(nutrient_id, number, name, unit, rank, amount):
+    return {"type": "FoodNutrient", "id": 1000000 + rank, "amount": amount, "dataPoints": 1,
+            "nutrient": {"id": nutrient_id, "number": number, "name": name, "rank": rank, "unitName": unit}}
+
+
+# GET /food/173944 (SR Legacy), abridged to a third of its nutrients; USDA lists them by rank
+BANANA_DETAILS = {
+    "fdcId": 173944,
+    "description": "Bananas, raw",
+    "dataType": "SR Legacy",
+    "publicationDate": "4/1/2019",
+    "foodNutrients": [
+        _food_nutrient(1051, "255", "Water", "g", 100, 74.91),
+        _food_nutrient(1008, "208", "Energy", "kcal", 300, 89.0),
+        _food_nutrient(1062, "268", "Energy", "kJ", 400, 371.0),
+        _food_nutrient(1003, "203", "Protein", "g", 600, 1.09),
+        _food_nutrient(1004, "204", "Total lipid (fat)", "g", 800, 0.33),
+        _food_nutrient(1007, "207", "Ash", "g", 1000, 0.82),
+        _food_nutrient(1005, "205", "Carbohydrate, by difference", "g", 1110, 22.84),
+        _food_nutrient(1079, "291", "Fiber, total dietary", "g", 1200, 2.6),
+        _food_nutrient(2000, "269", "Sugars, total including NLEA", "g", 1510, 12.23),
+        _food_nutrient(1010, "210", "Sucrose", "g", 1600, 2.39),
+        _food_nutrient(1011, "211", "Glucose (dextrose)", "g", 1700, 4.98),
+        _food_nutrient(1012, "212", "Fructose", "g", 1800, 4.85),
+        _food_nutrient(1009, "209", "Starch", "g", 2200, 5.38),
+        _food_nutrient(1087, "301", "Calcium, Ca", "mg", 5300, 5.0),
+        _food_nutrient(1089, "303", "Iron, Fe", "mg", 5400, 0.26),
+        _food_nutrient(1092, "306", "Potassium, K", "mg", 5700, 358.0),
+        _food_nutrient(1093, "307", "Sodium, Na", "mg", 5800, 1.0),
+        _food_nutrient(1103, "317", "Selenium, Se", "µg", 6200, 1.0),
+        _food_nutrient(1162, "401", "Vitamin C, total ascorbic acid", "mg", 6300, 8.7),
+        _food_nutrient(1175, "415", "Vitamin B-6", "mg", 6800, 0.367),
+        _food_nutrient(1253, "601", "Cholesterol", "mg", 15700, 0.0),
+        _food_nutrient(1258, "606", "Fatty acids, total saturated", "g", 9700, 0.112),
+        _food_nutrient(1268, "614", "SFA 18:0", "g", 10400, 0.002),
+        _food_nutrient(1235, "539", "Sugars, added", "g", 1540, None),
+    ],
+    "foodPortions": [
+        {"id": 89926, "amount": 1.0, "gramWeight": 118.0, "sequenceNumber": 4, "modifier": 'medium (7" to 7-7/8" long)',
+         "measureUnit": {"id": 9999, "name": "undetermined", "abbreviation": "undetermined"}},
+        {"id": 89923, "amount": 1.0, "gramWeight": 150.0, "sequenceNumber": 1, "modifier": "cup, sliced",
+         "measureUnit": {"id": 9999, "name": "undetermined", "abbreviation": "undetermined"}},
+    ],
+}
+
+# Branded details report units in capitals, and an occasional nutrient without an ID
+BRANDED_DETAILS = {
+    "fdcId": 2000001,
+    "description": "BANANA CHIPS",
+    "dataType": "Branded",
+    "servingSize": 30.0,
+    "servingSizeUnit": "g",
+    "foodNutrients": [
+        _food_nutrient(1003, "203", "Protein", "G", 600, 3.33),
+        {"type": "FoodNutrient", "amount": 4.0, "nutrient": {"name": "Vitamin D (D2 + D3), International Units"}},
+        _food_nutrient(1008, "208", "Energy", "KCAL", 300, 533.0),
+        _food_nutrient(1093, "307", "Sodium, Na", "MG", 5800, 7.0),
+    ],
+}
+
+
+@pytest.mark.parametrize("details", [BANANA_DETAILS, BRANDED_DETAILS], ids=["sr_legacy", "branded"])
+def test_usda_details_survive_the_cache(tmp_path, details):
+    food_data = _trim_food_data(details)
+    cache = NutritionCache(str(tmp_path / "cache.sqlite3"), ttl_seconds=3600, max_memory_entries=0,
+                           max_disk_entries=100)
+    cache.set(fdc_key(food_data["fdcId"]), FoodNutrients.from_food_data(food_data))
+    assert cache.get(fdc_key(food_data["fdcId"])).to_food_data() == food_data
+
+
+def test_records_only_store_what_differs_from_the_table():
+    food = FoodNutrients.from_food_data(_trim_food_data(BANANA_DETAILS))
+    # "Glucose (dextrose)" is named differently in the table; 1268 is not in the table at all
+    assert [entry[2:] for entry in food.to_json()["nutrients"] if len(entry) > 2] == [
+        ["Glucose (dextrose)", "g"], ["SFA 18:0", "g"],
+    ]
+    assert food.macros()["carbohydrates_g"] == 22.84
+    assert food.amount(1235) is None
+    in_slot_order = FoodNutrients.from_food_data({"fdcId": 1, "foodNutrients": [
+        {"nutrient": {"id": 1008, "name": "Energy", "unitName": "kcal"}, "amount": 89.0},
+        {"nutrient": {"id": 1003, "name": "Protein", "unitName": "g"}, "amount": 1.09},
+    ]})
+    assert in_slot_order._order == b"" and in_slot_order._labels == ()
@@ -0,0 +1,166 @@
+import asyncio
+import collections
+import json
+import threading
+
+import httpx
+import pytest
+
+from src.cache import NutritionCache
+from src.food_resolver import FoodResolver
+from src.resilience import CircuitBreaker, CircuitOpenError
+from src.singleflight import SingleFlight
+from src.upstream import AsyncUpstream
+from src.usda_index import LocalFoodIndex
+
+
+def _open_breaker(upstream: AsyncUpstream) -> None:
+    upstream.breaker = CircuitBreaker(upstream.name, failure_threshold=1, reset_timeout=0.0)
+    upstream.breaker.record_failure()
+    assert upstream.breaker.state == "half-open"
+
+
+def test_breaker_allows_one_trial_at_a_time():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0.0)
+    breaker.record_failure()
+    assert breaker.check() is True
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+    breaker.release_trial()
+    assert breaker.check() is True
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.check() is False
+
+
+def test_cancelled_trial_request_releases_the_breaker():
+    async def hang(request):
+        await asyncio.sleep(60)
+
+    async def run():
+        upstream = AsyncUpstream("test", 5.0, 1, 1, transport=httpx.MockTransport(hang))
+        _open_breaker(upstream)
+        task = asyncio.create_task(upstream.request("GET", "http://upstream.test/"))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # The next call becomes the trial instead of being rejected forever
+        assert upstream.breaker.check() is True
+        await upstream.aclose()
+
+    asyncio.run(run())
+
+
+def test_non_transport_error_in_trial_releases_the_breaker():
+    def fail(request):
+        raise httpx.DecodingError("bad body")
+
+    async def run():
+        upstream = AsyncUpstream("test", 5.0, 1, 1, transport=httpx.MockTransport(fail))
+        _open_breaker(upstream)
+        with pytest.raises(httpx.DecodingError):
+            await upstream.request("GET", "http://upstream.test/")
+        assert upstream.breaker.check() is True
+        await upstream.aclose()
+
+    asyncio.run(run())
+
+
+def test_cancelled_trial_stream_releases_the_breaker():
+    async def hang(request):
+        await asyncio.sleep(60)
+
+    async def consume(upstream):
+        async with upstream.stream("GET", "http://upstream.test/"):
+            pass
+
+    async def run():
+        upstream = AsyncUpstream("test", 5.0, 1, 1, transport=httpx.MockTransport(hang))
+        _open_breaker(upstream)
+        task = asyncio.create_task(consume(upstream))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert upstream.breaker.check() is True
+        await upstream.aclose()
+
+    asyncio.run(run())
+
+
+def test_successful_trial_closes_the_breaker():
+    async def run():
+        upstream = AsyncUpstream("test", 5.0, 1, 1, transport=httpx.MockTransport(lambda request: httpx.Response(200)))
+        _open_breaker(upstream)
+        response = await upstream.request("GET", "http://upstream.test/")
+        assert response.status_code == 200
+        assert upstream.breaker.state == "closed"
+        await upstream.aclose()
+
+    asyncio.run(run())
+
+
+FDC_IDS = {"banana": 173944, "egg": 171287, "oats": 173904}
+
+
+def _details(fdc_id: int) -> dict:
+    return {"fdcId": fdc_id, "description": f"Food {fdc_id}",
+            "foodNutrients": [{"nutrient": {"id": 1008, "name": "Energy", "unitName": "kcal"}, "amount": 100.0}]}
+
+
+@pytest.fixture
+def usda(tmp_path, monkeypatch):
+    """
+    Points ai_model at a mock USDA API with empty local tiers. Yields the count of calls per request path.
+    """
+    from src import ai_model
+
+    calls = collections.Counter()
+
+    async def handle(request: httpx.Request) -> httpx.Response:
+        calls[request.url.path] += 1
+        await asyncio.sleep(0.05)
+        if request.url.path.endswith("/foods/search"):
+            query = request.url.params["query"]
+            if query == "flaky":
+                return httpx.Response(500)
+            return httpx.Response(200, json={"foods": [{"fdcId": FDC_IDS[query]}] if query in FDC_IDS else []})
+        if request.url.path.endswith("/foods"):
+            return httpx.Response(200, json=[_details(fdc_id) for fdc_id in json.loads(request.content)["fdcIds"]])
+        return httpx.Response(200, json=_details(int(request.url.path.rsplit("/", 1)[1])))
+
+    cache = NutritionCache(str(tmp_path / "cache.sqlite3"), ttl_seconds=3600, max_memory_entries=100,
+                           max_disk_entries=100)
+    upstream = AsyncUpstream("usda", 5.0, 1, 10, transport=httpx.MockTransport(handle))
+    monkeypatch.setattr(ai_model, "usda_upstream", upstream)
+    monkeypatch.setattr(ai_model, "usda_api_key", "test")
+    monkeypatch.setattr(ai_model, "nutrition_cache", cache)
+    monkeypatch.setattr(ai_model, "local_food_index", LocalFoodIndex(str(tmp_path / "no_index.sqlite3")))
+    monkeypatch.setattr(ai_model, "food_resolver", FoodResolver())
+    monkeypatch.setattr(ai_model, "_food_resolver_loaded", threading.Event())
+    monkeypatch.setattr(ai_model, "usda_flight", SingleFlight())
+    yield calls
+
+
+def test_concurrent_lookups_of_one_food_make_one_upstream_call(usda):
+    from src.ai_model import aget_nutrition_report
+
+    async def run():
+        return await asyncio.gather(*(aget_nutrition_report(query) for query in ["banana", "Banana", " banana "] * 4))
+
+    reports = asyncio.run(run())
+    assert {report.fdc_id for report in reports} == {173944}
+    assert sum(calls for path, calls in usda.items() if path.endswith("/foods/search")) == 1
+    assert sum(calls for path, calls in usda.items() if "/food/" in path) == 1
+
+
+def test_a_failing_batch_item_does_not_fail_the_others(usda):
+    from src.ai_model import aget_nutrition_reports
+
+    results = asyncio.run(aget_nutrition_reports(["banana", "flaky", "no such food", "egg", "banana"]))
+    assert [report.fdc_id if report else None for report, _ in results] == [173944, None, None, 171287, 173944]
+    assert [error.status_code if error else None for _, error in results] == [None, 502, 404, None, None]
+    # Duplicates are looked up once, and the found foods share one multi-ID details call
+    assert sum(calls for path, calls in usda.items() if path.endswith("/foods/search")) == 4
+    assert sum(calls for path, calls in usda.items() if path.endswith("/foods")) == 1
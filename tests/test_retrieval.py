@@ -0,0 +1,48 @@
+import os
+
+import pytest
+
+from src.retrieval import FactIndex, build_from_sources
+from src.usda_index import IndexImport
+
+
+@pytest.fixture
+def sources(tmp_path):
+    facts = tmp_path / "facts"
+    facts.mkdir()
+    (facts / "nutrition.txt").write_text("Bananas are a good source of potassium.\n", encoding="utf-8")
+    usda_index = str(tmp_path / "fdc_index.sqlite3")
+    with IndexImport(usda_index) as index_import:
+        index_import.insert([(169228, "Eggplant, raw", "sr_legacy_food")], [(1008, "Energy", "kcal")],
+                            [(169228, 1008, 25.0)])
+    return str(facts), str(tmp_path / "index"), usda_index
+
+
+def _touch_facts(facts_dir: str, index_dir: str) -> None:
+    built_at = os.path.getmtime(os.path.join(index_dir, "fact_vectors.npy"))
+    with open(os.path.join(facts_dir, "nutrition.txt"), "a", encoding="utf-8") as f:
+        f.write("Oats contain beta-glucan fiber.\n")
+    os.utime(os.path.join(facts_dir, "nutrition.txt"), (built_at + 10, built_at + 10))
+
+
+def test_automatic_rebuild_keeps_the_usda_facts(sources):
+    facts_dir, index_dir, usda_index = sources
+    assert build_from_sources(facts_dir, index_dir, usda_index) == 2
+    _touch_facts(facts_dir, index_dir)
+    index = FactIndex(index_dir, facts_dir)
+    index.load()
+    assert index._chunks == [
+        "Bananas are a good source of potassium.",
+        "Oats contain beta-glucan fiber.",
+        "Eggplant, raw (per 100 g): 25 calories.",
+    ]
+
+
+def test_rebuild_is_skipped_when_the_usda_index_is_gone(sources):
+    facts_dir, index_dir, usda_index = sources
+    build_from_sources(facts_dir, index_dir, usda_index)
+    _touch_facts(facts_dir, index_dir)
+    os.remove(usda_index)
+    index = FactIndex(index_dir, facts_dir)
+    index.load()
+    assert len(index._chunks) == 2
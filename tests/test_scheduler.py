@@ -0,0 +1,139 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src.scheduler import PRIORITY_BATCH, PRIORITY_INTERACTIVE, LLMOverloadedError, LLMScheduler
+
+
+def _scheduler(**kwargs) -> LLMScheduler:
+    options = dict(max_concurrency=1, max_queue=8, max_queued_per_client=8, queue_timeout=5.0,
+                   expected_service_time=2.0)
+    options.update(kwargs)
+    return LLMScheduler(**options)
+
+
+async def _queue(scheduler: LLMScheduler, order: list, name: str, client: str, priority: int) -> asyncio.Task:
+    async def wait():
+        lease = await scheduler.acquire(client, priority)
+        order.append(name)
+        lease.release()
+
+    task = asyncio.create_task(wait())
+    await asyncio.sleep(0)
+    return task
+
+
+def test_interactive_requests_are_served_before_batch_ones():
+    async def run():
+        scheduler, order = _scheduler(), []
+        lease = await scheduler.acquire()
+        tasks = [
+            await _queue(scheduler, order, "batch", "a", PRIORITY_BATCH),
+            await _queue(scheduler, order, "interactive", "b", PRIORITY_INTERACTIVE),
+        ]
+        lease.release()
+        await asyncio.gather(*tasks)
+        return order, scheduler.active
+
+    assert asyncio.run(run()) == (["interactive", "batch"], 0)
+
+
+def test_waiting_clients_take_turns():
+    async def run():
+        scheduler, order = _scheduler(), []
+        lease = await scheduler.acquire()
+        tasks = [await _queue(scheduler, order, f"a{i}", "a", PRIORITY_INTERACTIVE) for i in range(3)]
+        tasks.append(await _queue(scheduler, order, "b0", "b", PRIORITY_INTERACTIVE))
+        lease.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(run()) == ["a0", "b0", "a1", "a2"]
+
+
+def test_full_queue_and_busy_client_are_rejected_with_retry_after():
+    async def run():
+        scheduler = _scheduler(max_queue=2, max_queued_per_client=1)
+        lease = await scheduler.acquire()
+        tasks = [asyncio.create_task(scheduler.acquire("a"))]
+        await asyncio.sleep(0)
+        with pytest.raises(LLMOverloadedError) as client_limit:
+            await scheduler.acquire("a")
+        tasks.append(asyncio.create_task(scheduler.acquire("b")))
+        await asyncio.sleep(0)
+        with pytest.raises(LLMOverloadedError) as queue_full:
+            await scheduler.acquire("c")
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        lease.release()
+        return client_limit.value, queue_full.value, scheduler
+
+    client_limit, queue_full, scheduler = asyncio.run(run())
+    assert client_limit.status_code == 429
+    assert queue_full.status_code == 503
+    # One generation and two waiters at about 2 s each, on one slot
+    assert queue_full.retry_after == 6
+    assert (scheduler.active, scheduler.queued) == (0, 0)
+
+
+def test_overloaded_response_carries_retry_after(monkeypatch):
+    import main
+
+    async def overloaded(question, client, priority):
+        raise LLMOverloadedError("busy", 503, 7.0)
+
+    monkeypatch.setattr(main, "aanswer_nutrition_question", overloaded)
+    response = TestClient(main.app).get("/ask/anything")
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "7"
+    assert response.json() == {"detail": "busy"}
+
+
+def test_requests_past_their_deadline_are_dropped():
+    async def run():
+        scheduler = _scheduler()
+        lease = await scheduler.acquire()
+        with pytest.raises(LLMOverloadedError) as expired:
+            await scheduler.acquire("a", timeout=0.01)
+        queued = scheduler.queued
+        lease.release()
+        return expired.value, queued, scheduler.active
+
+    expired, queued, active = asyncio.run(run())
+    assert expired.status_code == 503
+    assert (queued, active) == (0, 0)
+
+
+def test_cancelled_waiter_hands_its_slot_on():
+    async def run():
+        scheduler, order = _scheduler(), []
+        lease = await scheduler.acquire()
+        leaving = asyncio.create_task(scheduler.acquire("a"))
+        await asyncio.sleep(0)
+        staying = await _queue(scheduler, order, "b", "b", PRIORITY_INTERACTIVE)
+        # The slot is handed to the first waiter, which is cancelled before it can resume
+        lease.release()
+        leaving.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leaving
+        await asyncio.wait_for(staying, 1)
+        return order, scheduler.active, scheduler.queued
+
+    assert asyncio.run(run()) == (["b"], 0, 0)
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def run():
+        scheduler = _scheduler()
+        lease = await scheduler.acquire()
+        waiter = asyncio.create_task(scheduler.acquire("a"))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        queued = scheduler.queued
+        lease.release()
+        return queued, scheduler.active
+
+    assert asyncio.run(run()) == (0, 0)
@@ -0,0 +1,13 @@
+from benchmarks.bench_startup import STARTUP_BUDGET_MS, import_times
+
+
+def test_api_imports_within_budget():
+    # Best of a few fresh interpreters, after one that warms the bytecode and OS file caches
+    import_times("main")
+    best = min(import_times("main")["main"][0] for _ in range(3))
+    assert best <= STARTUP_BUDGET_MS, f"import main took {best:.0f} ms, budget {STARTUP_BUDGET_MS:.0f} ms"
+
+
+def test_api_import_does_not_load_heavy_libraries():
+    modules = import_times("main")
+    assert not {"pandas", "requests", "matplotlib", "pyarrow", "streamlit"} & set(modules)
@@ -0,0 +1,56 @@
+import pytest
+
+from src.usda_index import IndexImport, LocalFoodIndex
+
+
+@pytest.fixture
+def index(tmp_path) -> LocalFoodIndex:
+    path = str(tmp_path / "fdc_index.sqlite3")
+    foods = [
+        (173944, "Bananas, raw", "sr_legacy_food"),
+        (2000001, "BANANA CHIPS", "branded_food"),
+        (2000002, "EGGS", "branded_food"),
+        (171287, "Eggs, whole, raw, fresh", "sr_legacy_food"),
+        (172183, "Egg, white, raw, fresh", "sr_legacy_food"),
+        (2000003, "GREEK YOGURT", "branded_food"),
+    ]
+    with IndexImport(path) as index_import:
+        index_import.insert(foods, [(1008, "Energy", "kcal")], [(fdc_id, 1008, 100.0) for fdc_id, _, _ in foods])
+    return LocalFoodIndex(path)
+
+
+@pytest.mark.parametrize("query, fdc_id", [
+    ("banana", 173944),
+    ("bananas raw", 173944),
+    ("eggs", 171287),
+    ("egg white", 172183),
+])
+def test_lookup_prefers_generic_foods_naming_the_query(index, query, fdc_id):
+    assert index.lookup(query)["fdcId"] == fdc_id
+
+
+@pytest.mark.parametrize("query", ["banana chips", "greek yogurt", "egg yolk"])
+def test_lookup_leaves_unconfident_queries_to_the_remote_search(index, query):
+    assert index.lookup(query) is None
+
+
+def test_lookup_includes_branded_foods_on_request(index):
+    assert index.lookup("banana chips", include_branded=True)["fdcId"] == 2000001
+
+
+def test_an_import_is_swapped_in_under_open_readers(index):
+    assert index.get_food(173944)
+    with IndexImport(index.path) as index_import:
+        index_import.insert([(169228, "Eggplant, raw", "sr_legacy_food")], [], [])
+        # Until the import finishes, readers see the index as it was
+        assert index.get_food(169228) is None
+    assert index_import.counts["foods"] == 7
+    assert index.get_food(169228)["description"] == "Eggplant, raw"
+    assert index.get_food(173944)["description"] == "Bananas, raw"
+
+
+def test_iterating_foods_skips_branded_products_unless_asked(index):
+    assert {fdc_id for _, fdc_id, _ in index.iter_foods()} == {173944, 171287, 172183}
+    assert len(list(index.iter_foods(include_branded=True))) == 6
+    assert [food["fdcId"] for food, _ in index.iter_food_details()] == [171287, 172183, 173944]
+    assert len(list(index.iter_food_details(include_branded=True))) == 6